@@ -0,0 +1,253 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import (
+    AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage,
+)
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.constants import TAG_NOSTREAM
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+# Environment variables (all optional):
+# - AGENT_MEMORY: "on" (default) keeps conversation state per chat session; "off" makes every turn stateless
+# - AGENT_HISTORY_TOKEN_BUDGET: estimated tokens of history sent to the model before compaction kicks in (default 6000)
+# - AGENT_HISTORY_KEEP_TURNS: most recent earlier turns always kept verbatim (default 2)
+# - AGENT_HISTORY_TOOL_CHARS: characters kept of each tool output in earlier turns once over budget (default 800)
+# - AGENT_HISTORY_SUMMARY: "llm" (default) or "extractive" summaries of folded turns
+# - AGENT_MEMORY_MAX_SESSIONS: chat sessions whose state is kept in memory (default 200)
+
+SUMMARY_ID = "history-summary"
+_SUMMARY_HEADER = "Summary of the earlier conversation:"
+_SUMMARY_MAX_CHARS = 4000
+# Compaction folds turns until the history is this fraction of the budget, so the summary is not
+# rewritten again on the very next model call
+_FOLD_TARGET = 0.6
+
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+
+def memory_enabled() -> bool:
+    return os.environ.get("AGENT_MEMORY", "on").lower() not in ("off", "0", "false", "no")
+
+def _budget():
+    return int(os.environ.get("AGENT_HISTORY_TOKEN_BUDGET", 6000))
+
+def _keep_turns():
+    return max(0, int(os.environ.get("AGENT_HISTORY_KEEP_TURNS", 2)))
+
+def _tool_chars():
+    return int(os.environ.get("AGENT_HISTORY_TOOL_CHARS", 800))
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(p if isinstance(p, str) else str(p.get("text", "")) for p in content)
+    return str(content)
+
+def estimate_tokens(messages) -> int:
+    """Cheap token estimate: one token per CJK character, ~4 characters per token otherwise."""
+    total = 0
+    for m in messages:
+        text = _text(m.content)
+        if isinstance(m, AIMessage) and m.tool_calls:
+            text += str([(c["name"], c["args"]) for c in m.tool_calls])
+        cjk = len(_CJK.findall(text))
+        total += 4 + cjk + (len(text) - cjk) // 4
+    return total
+
+def _split_turns(messages):
+    """(summary message or None, [turn, ...]) where each turn starts at a HumanMessage."""
+    summary = None
+    turns = []
+    for m in messages:
+        if isinstance(m, SystemMessage) and m.id == SUMMARY_ID:
+            summary = m
+        elif isinstance(m, HumanMessage) or not turns:
+            turns.append([m])
+        else:
+            turns[-1].append(m)
+    return summary, turns
+
+def _shorten_tool_output(msg, limit):
+    text = _text(msg.content)
+    if len(text) <= limit or text.startswith("[tool output truncated"):
+        return msg
+    note = f"[tool output truncated from {len(text)} chars in history; call the tool again if the full result is needed]\n"
+    return msg.model_copy(update={"content": note + text[:limit]})
+
+def _extractive_summary(previous, turns):
+    lines = [previous] if previous else []
+    for turn in turns:
+        for m in turn:
+            text = _text(m.content).strip()
+            if isinstance(m, HumanMessage):
+                lines.append(f"- User: {text[:300]}")
+            elif isinstance(m, AIMessage):
+                for c in m.tool_calls:
+                    lines.append(f"  - Called {c['name']}({str(c['args'])[:150]})")
+                if text:
+                    lines.append(f"  - Assistant: {text[:400]}")
+            elif isinstance(m, ToolMessage):
+                lines.append(f"  - {m.name} returned: {text[:200]}")
+    # Keep the most recent part when the running summary outgrows its cap
+    return "\n".join(lines)[-_SUMMARY_MAX_CHARS:]
+
+_SUMMARY_INSTRUCTIONS = (
+    "Update the running summary of an assistant conversation with the turns below. Keep facts the "
+    "assistant may need later: file names, table columns/row counts, numbers, conclusions, artifact ids "
+    "and which tools already produced them. Drop small talk. Answer with the summary only, under "
+    f"{_SUMMARY_MAX_CHARS // 4} words, in the language of the conversation."
+)
+
+def _summary_prompt(previous, turns):
+    transcript = _extractive_summary("", turns)
+    return [
+        SystemMessage(content=_SUMMARY_INSTRUCTIONS),
+        HumanMessage(content=f"Current summary:\n{previous or '(none)'}\n\nNew turns:\n{transcript}"),
+    ]
+
+def _use_llm_summary(llm):
+    return llm is not None and os.environ.get("AGENT_HISTORY_SUMMARY", "llm").lower() == "llm"
+
+def _plan(messages):
+    """Decide how to compact. Returns None when nothing needs to change, else
+    (previous summary text, turns to fold, turns kept)."""
+    budget = _budget()
+    if estimate_tokens(messages) <= budget:
+        return None
+    summary, turns = _split_turns(messages)
+    previous = _text(summary.content) if summary else ""
+    previous = previous.split("\n", 1)[-1] if previous.startswith(_SUMMARY_HEADER) else previous
+    # The current turn (tool loop in progress) is never touched
+    earlier, current = turns[:-1], turns[-1:]
+    limit = _tool_chars()
+    shortened = [[_shorten_tool_output(m, limit) if isinstance(m, ToolMessage) else m for m in t] for t in earlier]
+    changed = any(a is not b for t, u in zip(earlier, shortened) for a, b in zip(t, u))
+    earlier = shortened
+    fold = []
+    keep = _keep_turns()
+    while len(earlier) > keep:
+        estimate = estimate_tokens([m for t in earlier + current for m in t]) + len(previous) // 3
+        if fold and estimate <= budget * _FOLD_TARGET:
+            break
+        fold.append(earlier.pop(0))
+    if not fold and not changed:
+        return None
+    return previous, fold, earlier + current
+
+def _close_dangling_tool_calls(messages):
+    """A run that failed or was stopped between the model and the tools leaves tool calls without
+    results, which providers reject on the next request; answer them with a placeholder."""
+    answered = {m.tool_call_id for m in messages if isinstance(m, ToolMessage)}
+    out = []
+    for m in messages:
+        out.append(m)
+        if isinstance(m, AIMessage):
+            for c in m.tool_calls:
+                if c["id"] not in answered:
+                    out.append(ToolMessage(content="Error: tool call was interrupted", tool_call_id=c["id"], name=c["name"]))
+    return out
+
+def _rewrite(summary_text, kept):
+    out = [RemoveMessage(id=REMOVE_ALL_MESSAGES)]
+    if summary_text:
+        out.append(SystemMessage(content=f"{_SUMMARY_HEADER}\n{summary_text}", id=SUMMARY_ID))
+    for turn in kept:
+        out.extend(turn)
+    return {"messages": out}
+
+def make_history_hook(llm=None):
+    """pre_model_hook that keeps the checkpointed history under AGENT_HISTORY_TOKEN_BUDGET.
+
+    Over budget, tool outputs of earlier turns are cut down first; then the oldest turns (beyond
+    the AGENT_HISTORY_KEEP_TURNS most recent) are folded into one running summary message. The
+    rewrite replaces the stored state, so the checkpoint stays bounded as well as the prompt.
+    """
+    def hook(state):
+        messages = _close_dangling_tool_calls(state["messages"])
+        plan = _plan(messages)
+        if plan is None:
+            return _rewrite("", [messages]) if len(messages) != len(state["messages"]) else {"messages": []}
+        previous, fold, kept = plan
+        summary = previous
+        if fold:
+            summary = _extractive_summary(previous, fold)
+            if _use_llm_summary(llm):
+                try:
+                    resp = llm.invoke(_summary_prompt(previous, fold), config={"tags": [TAG_NOSTREAM]})
+                    summary = _text(resp.content).strip()[:_SUMMARY_MAX_CHARS] or summary
+                except Exception:
+                    pass
+        return _rewrite(summary, kept)
+
+    async def ahook(state):
+        messages = _close_dangling_tool_calls(state["messages"])
+        plan = _plan(messages)
+        if plan is None:
+            return _rewrite("", [messages]) if len(messages) != len(state["messages"]) else {"messages": []}
+        previous, fold, kept = plan
+        summary = previous
+        if fold:
+            summary = _extractive_summary(previous, fold)
+            if _use_llm_summary(llm):
+                try:
+                    resp = await llm.ainvoke(_summary_prompt(previous, fold), config={"tags": [TAG_NOSTREAM]})
+                    summary = _text(resp.content).strip()[:_SUMMARY_MAX_CHARS] or summary
+                except Exception:
+                    pass
+        return _rewrite(summary, kept)
+
+    return RunnableLambda(hook, afunc=ahook, name="pre_model_hook")
+
+
+class SessionSaver(InMemorySaver):
+    """In-memory checkpointer that keeps only the latest checkpoint of each chat session and
+    forgets the least recently used sessions beyond AGENT_MEMORY_MAX_SESSIONS."""
+
+    def __init__(self):
+        super().__init__()
+        self._recent = OrderedDict()  # thread id -> None, least recently used first
+        self._recent_lock = threading.Lock()
+
+    def touch(self, thread_id: str):
+        max_sessions = int(os.environ.get("AGENT_MEMORY_MAX_SESSIONS", 200))
+        with self._recent_lock:
+            self._recent[thread_id] = None
+            self._recent.move_to_end(thread_id)
+            evicted = []
+            while len(self._recent) > max_sessions:
+                evicted.append(self._recent.popitem(last=False)[0])
+        for tid in evicted:
+            self.delete_thread(tid)
+
+    def prune(self, thread_id: str):
+        """Drop superseded checkpoints, their pending writes and channel blobs for one session.
+        Call between runs only; a run in progress still reads its parent checkpoint."""
+        keep_blobs = set()
+        for ns, checkpoints in list(self.storage.get(thread_id, {}).items()):
+            if not checkpoints:
+                continue
+            latest = max(checkpoints)
+            for cid in [c for c in checkpoints if c != latest]:
+                del checkpoints[cid]
+                self.writes.pop((thread_id, ns, cid), None)
+            checkpoint = self.serde.loads_typed(checkpoints[latest][0])
+            keep_blobs.update((thread_id, ns, ch, v) for ch, v in checkpoint["channel_versions"].items())
+        for key in [k for k in list(self.blobs) if k[0] == thread_id and k not in keep_blobs]:
+            self.blobs.pop(key, None)
+
+
+_SAVER = SessionSaver()
+
+def get_checkpointer() -> SessionSaver:
+    return _SAVER
+
+def session_config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+def reset_session(thread_id: str):
+    _SAVER.delete_thread(thread_id)
@@ -1,10 +1,16 @@
 import os
+import hashlib
+import threading
 from langchain_core.messages import HumanMessage
-from langgraph.prebuilt import create_react_agent
+from langgraph.prebuilt import create_react_agent, ToolNode
 
 # Import tools and config
 from src.tools import get_tools
-from src.core.config import get_llm
+from src.core.config import get_chat_model, get_llm_configs, routing_enabled
+from src.core.llmpool import RoutedChatModel
+from src.core.aio import ToolLimiter, iterate_sync
+from src.core.governor import govern_tool_message
+from src.agent.memory import memory_enabled, make_history_hook, get_checkpointer, session_config
 
 # 1. 初始化 LLM (moved to get_graph)
 # llm = get_llm()
@@ -13,70 +19,205 @@ from src.core.config import get_llm
 # tools = get_tools()
 
 # 3. 创建 ReAct Agent
-system_prompt = """You are a helpful AI assistant capable of using various tools to solve problems.
+# The system prompt is assembled from the tool groups the agent is built with (see
+# src/agent/router.py), so a turn only carries the descriptions and hints it can use.
+_PROMPT_HEAD = """You are a helpful AI assistant capable of using various tools to solve problems.
 You have access to the following tools:
-- web_search: Robust web search (Tavily/SerpAPI/DDG fallback).
-- calculator: Calculate mathematical expressions.
-- current_time: Get the current local time.
-- python_interpreter: Execute Python code for complex tasks. You can use pandas, matplotlib, etc. Plots are returned as images.
-- list_uploaded_files: Check which files the user has uploaded.
-- read_file_from_upload: Read text content from uploaded files (txt, md, py, json, etc.).
-- json_formatter: Handle JSON data (format/pretty-print, compress/minify, escape, unescape).
-- hash_generator: Generate hash (MD5, SHA1, SHA256) for text.
-- encoding_tool: Handle text encoding/decoding (Base64, URL).
-- timestamp_converter: Convert between Unix timestamp and date string.
-- qrcode_generator: Generate QR code images from text (UI displays directly via Base64).
-- sql_formatter: Format SQL queries.
-- excel_to_csv_from_upload: Convert uploaded Excel to CSV (returns CSV or Base64).
-- csv_to_excel_from_upload: Convert uploaded CSV to Excel (returns Base64 + filename).
-- markdown_to_html: Convert Markdown to HTML.
-- image_resize_base64: Resize base64-encoded image and return base64.
-- image_convert_base64: Convert base64-encoded image format.
- - image_crop_base64: Crop to rectangle by x,y,width,height.
- - image_compress_base64: Compress with quality to JPEG/WEBP.
- - image_rotate_base64: Rotate by degrees.
- - image_add_text_watermark_base64: Add semi-transparent text watermark.
- - image_add_image_watermark_base64: Overlay image watermark with opacity and scale.
-- image_remove_watermark_base64: Blur or pixelate a selected rectangle.
-- image_upload_to_base64: Load an uploaded image from 'uploads/' into base64.
- - image_upload_to_base64: Load an uploaded image from 'uploads/' into base64.
- - image_*_upload: Operate directly on files in 'uploads/' and return base64 for UI.
- - image_auto_remove_watermark_upload: Automatically detect and remove watermark on uploaded images without asking for coordinates.
+"""
+
+# Prompt lines per tool; tools without one are described by the first line of their docstring.
+_TOOL_LINES = {
+    "web_search": "Robust web search (Tavily/SerpAPI/DDG fallback).",
+    "calculator": "Safely evaluate math expressions; pass variables/rows to evaluate one formula over many inputs in one call.",
+    "current_time": "Get the current local time.",
+    "python_interpreter": "Execute Python code for complex tasks (variables persist within the session; pd/np/plt preloaded). Plots are returned as images, new DataFrames as CSV downloads.",
+    "list_uploaded_files": "Check which files the user has uploaded.",
+    "read_file_from_upload": "Read text content from uploaded files (txt, md, py, json, log, etc.); page through large files with offset/length or start_line/end_line.",
+    "search_in_upload": "BM25 search inside an uploaded text document; returns the most relevant passages with line numbers/offsets.",
+    "json_formatter": "Handle JSON data (format/pretty-print, compress/minify, escape, unescape).",
+    "hash_generator": "Generate hash (MD5, SHA1, SHA256) for text.",
+    "encoding_tool": "Handle text encoding/decoding (Base64, URL).",
+    "timestamp_converter": "Convert between Unix timestamp and date string.",
+    "qrcode_generator": "Generate QR code images from text (UI displays them directly).",
+    "sql_formatter": "Format SQL queries.",
+    "excel_to_csv_from_upload": "Convert uploaded Excel to CSV (returns CSV or a download).",
+    "csv_to_excel_from_upload": "Convert uploaded CSV to Excel (returns a download).",
+    "markdown_to_html": "Convert Markdown to HTML.",
+    "image_resize_base64": "Resize base64-encoded image and return base64.",
+    "image_convert_base64": "Convert base64-encoded image format.",
+    "image_crop_base64": "Crop to rectangle by x,y,width,height.",
+    "image_compress_base64": "Compress with quality to JPEG/WEBP.",
+    "image_rotate_base64": "Rotate by degrees.",
+    "image_add_text_watermark_base64": "Add semi-transparent text watermark.",
+    "image_add_image_watermark_base64": "Overlay image watermark with opacity and scale.",
+    "image_remove_watermark_base64": "Blur or pixelate a selected rectangle.",
+    "image_upload_to_base64": "Load an uploaded image from 'uploads/' into base64.",
+    "image_auto_remove_watermark_upload": "Automatically detect and remove watermark on uploaded images without asking for coordinates.",
+    "image_pipeline_upload": "Run several image edits (crop/resize/rotate/watermark/compress...) on one upload in a single call.",
+    "image_batch_pipeline_upload": "Apply the same pipeline to many uploaded images in parallel and return one ZIP.",
+}
 
+# Process hints per tool group, inserted under step 3
+_GROUP_HINTS = {
+    "text": [
+        "- Use 'read_file_from_upload' for text-based files (txt, md, code, etc.) and summarize the content.",
+        "- For questions about specific facts in a long document, use 'search_in_upload' first instead of reading the whole file.",
+    ],
+    "table": [
+        "- Use 'table_basic_profile_from_upload' for data files (csv, excel) to get a general summary (rows, columns, types).",
+        "- If specific chart types are requested, use the 'table_chart_*' tools.",
+    ],
+    "image": [
+        "- For image operations, ALWAYS prefer the '*_upload' tools to operate directly on files in 'uploads/'.",
+        "- If the user does NOT specify a filename, choose the MOST RECENT uploaded image (extensions: png, jpg, jpeg, webp, bmp, gif).",
+        "- DO NOT use base64 image tools unless the user provides base64 explicitly.",
+        "- For watermark removal, prefer 'image_auto_remove_watermark_upload' and avoid asking the user for positions.",
+        "- For compound image edits (e.g. crop + rotate + watermark + compress), use ONE 'image_pipeline_upload' call instead of chaining tools.",
+        "- When the same edit applies to several images, use ONE 'image_batch_pipeline_upload' call (list or glob of filenames).",
+    ],
+}
+
+_PROMPT_TAIL = """
 Process:
 1. Analyze the user's request and break it into sub-tasks when needed.
 2. For multi-step tasks, call multiple tools in sequence until all subtasks are done.
 3. First call 'list_uploaded_files' to discover available files. 
-   - For summarizing file content:
-     - Use 'read_file_from_upload' for text-based files (txt, md, code, etc.) and summarize the content.
-     - Use 'table_basic_profile_from_upload' for data files (csv, excel) to get a general summary (rows, columns, types).
-     - If the user doesn't specify what to summarize, provide a general overview based on file type.
-   - For data visualization:
-     - If specific chart types are requested, use the 'table_chart_*' tools.
-     - If the user asks to "use Python to draw charts" or for custom visualization, use 'python_interpreter' with matplotlib/seaborn.
-   - For image operations, ALWAYS prefer the '*_upload' tools to operate directly on files in 'uploads/'.
-   - If the user does NOT specify a filename, choose the MOST RECENT uploaded image (extensions: png, jpg, jpeg, webp, bmp, gif).
-   - DO NOT use base64 image tools unless the user provides base64 explicitly.
-   - For watermark removal, prefer 'image_auto_remove_watermark_upload' and avoid asking the user for positions.
-4. For file processing (CSV/Excel), prefer 'excel_to_csv_from_upload' and 'csv_to_excel_from_upload' over Python unless custom logic is needed.
-5. For images, produce and consume Base64 (prefer WEBP to keep outputs compact), never write to disk; the UI will render markers [IMAGE:mime:base64].
-6. Execute tools, observe outputs, and continue the loop until the full solution is ready.
+   - If the user doesn't specify what to summarize, provide a general overview based on file type.
+   - If the user asks to "use Python to draw charts" or for custom visualization, use 'python_interpreter' with matplotlib/seaborn.
+{hints}
+4. For file processing (CSV/Excel), prefer the dedicated conversion and table tools over Python unless custom logic is needed.
+5. Images and files are returned as artifact markers ([IMAGE_ID:...], [FILE_ID:...]) that the UI renders; never write to disk.
+6. Execute tools, observe outputs, and continue the loop until the full solution is ready. Earlier tool results in
+   this conversation are still valid; reuse them instead of calling the same tool again.
 7. Finally summarize results clearly.
 
 Always answer in the same language as the user's request (mostly Chinese).
 """
 
+def build_system_prompt(tools, groups=None) -> str:
+    """System prompt listing exactly `tools`, with the process hints of the selected groups."""
+    lines = []
+    for t in tools:
+        desc = _TOOL_LINES.get(t.name) or (t.description or "").strip().splitlines()[0]
+        lines.append(f"- {t.name}: {desc}")
+    hints = [
+        f"   {h}" for name, group_hints in _GROUP_HINTS.items()
+        if groups is None or name in groups
+        for h in group_hints
+    ]
+    return _PROMPT_HEAD + "\n".join(lines) + "\n" + _PROMPT_TAIL.format(hints="\n".join(hints)).rstrip("\n") + "\n"
+
+system_prompt = build_system_prompt(get_tools())
+
 graph = None
 
-def get_graph():
-    """Create and return the ReAct agent graph with fresh configuration."""
-    # 1. 初始化 LLM (uses current env vars)
-    llm = get_llm()
-    
-    # 2. 获取工具集
-    tools = get_tools()
-    
-    return create_react_agent(llm, tools, prompt=system_prompt)
+# Compiled graphs keyed by (((provider, model, base_url, sha256(api_key)), ...), routing on/off,
+# memory on/off), tool groups). Graphs of one configuration share the chat model (a single
+# ChatOpenAI client or the provider pool) and its pooled HTTP connections.
+_GRAPH_REGISTRY = {}
+_LLM_REGISTRY = {}
+_GRAPH_LOCK = threading.Lock()
+
+def _graph_key(cfgs):
+    providers = tuple(
+        (c["provider"], c["model"], c["base_url"], hashlib.sha256(c["api_key"].encode("utf-8")).hexdigest())
+        for c in cfgs
+    )
+    return (providers, routing_enabled(), memory_enabled())
+
+# Tool calls emitted in one model step run concurrently (threads on graph.stream, tasks on
+# graph.astream); stream_graph gives every run its own ToolLimiter in config["configurable"],
+# capping that run at AGENT_TOOL_CONCURRENCY in-flight calls without sharing slots across
+# sessions. Results then pass the output-size governor, so oversized outputs reach the model
+# as a preview.
+_LIMITER_KEY = "tool_limiter"
+
+def _tool_limiter(request):
+    runtime = getattr(request, "runtime", None)
+    config = getattr(runtime, "config", None) or {}
+    return (config.get("configurable") or {}).get(_LIMITER_KEY)
+
+def _bounded_tool_call(request, execute):
+    limiter = _tool_limiter(request)
+    if limiter is None:
+        return govern_tool_message(execute(request))
+    with limiter.threads:
+        return govern_tool_message(execute(request))
+
+async def _abounded_tool_call(request, execute):
+    limiter = _tool_limiter(request)
+    if limiter is None:
+        result = await execute(request)
+    else:
+        async with limiter.tasks:
+            result = await execute(request)
+    return govern_tool_message(result)
+
+def _get_llm(cfgs, key):
+    # One chat model (and HTTP connection pool) per configuration, shared by all tool subsets
+    llm = _LLM_REGISTRY.get(key)
+    if llm is None:
+        llm = _LLM_REGISTRY[key] = get_chat_model(cfgs)
+    return llm
+
+def get_graph(groups=None):
+    """Return the ReAct agent graph for the current configuration and tool groups (None = all
+    tools), building it only on first use of that combination."""
+    cfgs = get_llm_configs()
+    llm_key = _graph_key(cfgs)
+    groups = None if groups is None else frozenset(groups) - {"core"}
+    key = (llm_key, groups)
+    g = _GRAPH_REGISTRY.get(key)
+    if g is not None:
+        return g
+    with _GRAPH_LOCK:
+        g = _GRAPH_REGISTRY.get(key)
+        if g is None:
+            # 1. 初始化 LLM (uses current env vars)
+            llm = _get_llm(cfgs, llm_key)
+            # 2. 获取工具集 (only the routed groups; the prompt lists exactly these)
+            tools = get_tools(groups)
+            prompt = build_system_prompt(tools, groups)
+            tool_node = ToolNode(tools, wrap_tool_call=_bounded_tool_call, awrap_tool_call=_abounded_tool_call)
+            if memory_enabled():
+                # Conversation state is checkpointed per chat session (thread_id); the hook keeps
+                # the history sent to the model within the token budget.
+                g = create_react_agent(
+                    llm, tool_node, prompt=prompt,
+                    pre_model_hook=make_history_hook(llm), checkpointer=get_checkpointer(),
+                )
+            else:
+                g = create_react_agent(llm, tool_node, prompt=prompt)
+            _GRAPH_REGISTRY[key] = g
+    return g
+
+def stream_graph(graph, inputs, stream_mode, config=None):
+    """Stream a graph run from synchronous code.
+
+    With AGENT_RUNTIME=async (default) the run is driven by graph.astream on the shared event
+    loop, so async-native tools await I/O and parallel tool calls overlap; AGENT_RUNTIME=sync
+    keeps the plain graph.stream path. `config` carries the session thread_id when memory is on;
+    a fresh ToolLimiter is added to it for this run.
+    """
+    config = dict(config or {})
+    config["configurable"] = {**(config.get("configurable") or {}), _LIMITER_KEY: ToolLimiter()}
+    if os.environ.get("AGENT_RUNTIME", "async").lower() == "sync":
+        return graph.stream(inputs, config=config, stream_mode=stream_mode)
+    return iterate_sync(graph.astream(inputs, config=config, stream_mode=stream_mode))
+
+def llm_provider_stats():
+    """p50/p95 latency and error rates per provider of the routed chat models in use."""
+    stats = {}
+    for llm in list(_LLM_REGISTRY.values()):
+        if isinstance(llm, RoutedChatModel):
+            stats.update(llm.pool.snapshot())
+    return stats
+
+def clear_graph_cache():
+    """Drop all cached graphs (e.g. after tools or prompt change at runtime)."""
+    with _GRAPH_LOCK:
+        _GRAPH_REGISTRY.clear()
+        _LLM_REGISTRY.clear()
 
 if __name__ == "__main__":
     # 简单测试
@@ -87,7 +228,7 @@ if __name__ == "__main__":
         
     graph = get_graph()
     inputs = {"messages": [HumanMessage(content="现在几点了？")]}
-    for s in graph.stream(inputs, stream_mode="values"):
+    for s in graph.stream(inputs, config=session_config("test"), stream_mode="values"):
         message = s["messages"][-1]
         if hasattr(message, "content"):
              print(message.content)
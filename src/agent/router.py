@@ -0,0 +1,100 @@
+import os
+import re
+
+# Environment variables (all optional):
+# - AGENT_TOOL_ROUTING: "on" (default) binds only the tool groups a turn needs; "off" binds all tools
+
+# Keyword heuristics per tool group (lowercased substring match on the user message).
+# "core" tools are always bound; matching it only stops the web-search fallback.
+_KEYWORDS = {
+    "core": (
+        "几点", "时间", "日期", "星期", "计算", "等于", "多少", "python", "代码",
+        "time", "date", "calculate", "compute", "code", "script",
+    ),
+    "image": (
+        "图片", "图像", "照片", "相片", "水印", "裁剪", "剪裁", "旋转", "缩放", "像素", "分辨率", "头像", "抠图",
+        "image", "photo", "picture", "watermark", "crop", "rotate", "resize", "thumbnail",
+        "png", "jpg", "jpeg", "webp", "gif",
+    ),
+    "table": (
+        "表格", "报表", "数据", "统计", "图表", "柱状", "折线", "散点", "直方", "透视", "相关性", "异常值", "筛选", "列名",
+        "行数", "平均", "求和", "分组", "excel", "csv", "xlsx", "table", "column", "chart", "histogram",
+        "scatter", "pivot", "correlation", "outlier", "filter", "rows", "dataset",
+    ),
+    "office": (
+        "word", "pdf", "docx", "markdown", "html", "文档", "转pdf", "转成pdf", "转为pdf", "转word",
+    ),
+    "text": (
+        "文件", "读取", "内容", "总结", "摘要", "概括", "日志", "文章", "段落", "第几行", "查找", "原文",
+        "file", "read", "summar", "log", "document", "paragraph", "line ", "txt",
+    ),
+    "dev": (
+        "json", "哈希", "hash", "md5", "sha1", "sha256", "base64", "编码", "解码", "转义", "url", "时间戳",
+        "timestamp", "二维码", "qr", "sql", "格式化", "encode", "decode", "escape",
+    ),
+    "search": (
+        "搜索", "搜一下", "查一下", "上网", "网上", "最新", "新闻", "近况", "天气", "股价", "汇率", "官网",
+        "search", "google", "news", "latest", "today", "weather", "price of", "who is", "what is",
+    ),
+}
+
+_EXT_GROUPS = {
+    "image": {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif"},
+    "table": {".csv", ".xlsx", ".xls"},
+    "office": {".doc", ".docx", ".pdf", ".md"},
+}
+
+# Uploads of these types are usually read as text when the message names no other operation
+_TEXT_EXTS = {".txt", ".md", ".log", ".json", ".py", ".csv", ".xml", ".yaml", ".yml", ".ini", ".html"}
+
+_WORD = re.compile(r"[a-z]+")
+
+
+def routing_enabled() -> bool:
+    return os.environ.get("AGENT_TOOL_ROUTING", "on").lower() not in ("off", "0", "false", "no")
+
+def _upload_groups(filenames):
+    groups = set()
+    for name in filenames or ():
+        ext = os.path.splitext(name)[1].lower()
+        for group, exts in _EXT_GROUPS.items():
+            if ext in exts:
+                groups.add(group)
+        if ext in _TEXT_EXTS:
+            groups.add("text")
+    return groups
+
+def _keyword_groups(message: str):
+    text = (message or "").lower()
+    words = set(_WORD.findall(text))
+    groups = set()
+    for group, keywords in _KEYWORDS.items():
+        for kw in keywords:
+            # Short ASCII keywords must match whole words ("qr" in "query" is not a QR code)
+            hit = kw in words if kw.isascii() and kw.isalpha() and len(kw) <= 4 else kw in text
+            if hit:
+                groups.add(group)
+                break
+    return groups
+
+def select_tool_groups(message: str, uploads=None, previous=None):
+    """Tool groups to bind for one turn, or None for all tools.
+
+    Groups come from keywords in the message; a message without any (a follow-up like "do the
+    same for the other one") reuses the previous turn's groups. Uploads add the groups of their
+    file types when the message is about files or names nothing else. With nothing matched, the
+    turn gets web search besides the always-bound core tools.
+    """
+    if not routing_enabled():
+        return None
+    matched = _keyword_groups(message)
+    groups = set(matched) or set(previous or ())
+    from_uploads = _upload_groups(uploads)
+    if from_uploads and (not matched or matched & {"text", "table", "image", "office"}):
+        groups |= from_uploads
+    # Base64 image tools only when an image request comes with inline base64
+    if "image" in groups and "base64" in (message or "").lower():
+        groups.add("image_base64")
+    if not groups:
+        groups = {"search"}
+    return frozenset(groups)
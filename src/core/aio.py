@@ -0,0 +1,92 @@
+import os
+import queue
+import asyncio
+import threading
+import contextvars
+import weakref
+
+import httpx
+
+# Environment variables (all optional):
+# - AGENT_TOOL_CONCURRENCY: max tool calls of one agent step running at the same time (default 4)
+
+_loop = None
+_loop_lock = threading.Lock()
+_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Process-wide event loop running in a daemon thread.
+
+    Streamlit reruns the script in a fresh thread each time, so the agent's async work is
+    submitted here instead; pooled HTTP clients stay bound to one loop.
+    """
+    global _loop
+    if _loop is not None:
+        return _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
+            _loop = loop
+    return _loop
+
+async def _in_context(coro, ctx):
+    # Tasks created on the loop thread would otherwise run in that thread's context and lose
+    # the caller's context variables (the chat session, src/core/session.py)
+    return await asyncio.get_running_loop().create_task(coro, context=ctx)
+
+def run_sync(coro, timeout: float = None):
+    """Run a coroutine on the shared loop and block the calling thread for its result."""
+    ctx = contextvars.copy_context()
+    return asyncio.run_coroutine_threadsafe(_in_context(coro, ctx), get_loop()).result(timeout)
+
+def iterate_sync(agen):
+    """Drive an async iterator on the shared loop and yield its items in the calling thread."""
+    q = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for item in agen:
+                q.put((True, item))
+        except BaseException as e:
+            q.put((False, e))
+        finally:
+            q.put((True, done))
+
+    fut = asyncio.run_coroutine_threadsafe(_in_context(pump(), contextvars.copy_context()), get_loop())
+    try:
+        while True:
+            ok, item = q.get()
+            if not ok:
+                raise item
+            if item is done:
+                return
+            yield item
+    finally:
+        # Consumer stopped early (e.g. Streamlit rerun): stop the producer as well
+        fut.cancel()
+
+def http_client() -> httpx.AsyncClient:
+    """Pooled AsyncClient for the running event loop (connections are reused across calls)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(timeout=20, follow_redirects=True)
+        _clients[loop] = client
+    return client
+
+class ToolLimiter:
+    """Caps the tool calls of one agent run at AGENT_TOOL_CONCURRENCY.
+
+    Created per run so one session's tool calls never queue behind another's; `threads` bounds
+    the thread-pool path (graph.stream), `tasks` the async path (graph.astream).
+    """
+
+    def __init__(self, limit: int = None):
+        limit = limit or tool_concurrency()
+        self.threads = threading.BoundedSemaphore(limit)
+        self.tasks = asyncio.Semaphore(limit)  # binds to the loop on first use
+
+def tool_concurrency() -> int:
+    return max(1, int(os.environ.get("AGENT_TOOL_CONCURRENCY", 4)))
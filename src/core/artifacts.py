@@ -0,0 +1,189 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+from src.core.cachedir import private_cache_dir, trim_dir
+from src.core.session import current_session_id
+
+# Environment variables (all optional):
+# - ARTIFACT_MAX_BYTES: in-memory budget shared by all sessions (default 256 MB)
+# - ARTIFACT_SESSION_QUOTA_BYTES: in-memory budget per session (default 64 MB)
+# - ARTIFACT_TTL_SECONDS: lifetime of an artifact in memory or on disk (default 6 h)
+# - ARTIFACT_SPILL_DIR: where evicted artifacts are written (default ~/.cache/bunnytools/artifacts)
+# - ARTIFACT_SPILL_MAX_BYTES: disk budget of the spill directory (default 1 GB)
+
+class ArtifactStore:
+    """LRU artifact store with a global byte budget, per-session quotas, TTL and spill-to-disk.
+
+    Artifacts are kept as raw bytes (or any bytes-like buffer) together with their MIME type;
+    base64 is only produced at the UI edge when a data URI is rendered. Entries pushed out of
+    memory are written to the spill directory and transparently reloaded by get() until they expire.
+    """
+
+    def __init__(self, max_bytes: int, session_quota: int, ttl: float, spill_dir: str,
+                 spill_max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.session_quota = session_quota
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self._mem = OrderedDict()  # key -> (data, mime, session_id, created)
+        self._spilled = {}  # key -> (path, mime, session_id, created)
+        self._bytes = 0
+        self._session_bytes = {}
+        self._lock = threading.RLock()
+        self._clear_stale_spills()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_bytes=int(os.environ.get("ARTIFACT_MAX_BYTES", 256 * 1024 * 1024)),
+            session_quota=int(os.environ.get("ARTIFACT_SESSION_QUOTA_BYTES", 64 * 1024 * 1024)),
+            ttl=float(os.environ.get("ARTIFACT_TTL_SECONDS", 6 * 3600)),
+            spill_dir=private_cache_dir("artifacts", "ARTIFACT_SPILL_DIR"),
+            spill_max_bytes=int(os.environ.get("ARTIFACT_SPILL_MAX_BYTES", 1024 * 1024 * 1024)),
+        )
+
+    def put(self, data, mime: str = "application/octet-stream", session_id: str = None) -> str:
+        key = uuid.uuid4().hex
+        sid = session_id or current_session_id()
+        with self._lock:
+            self._purge_expired()
+            self._insert(key, data, mime, sid, time.time())
+        return key
+
+    def get(self, key: str):
+        """Return (data, mime) for key, or None when unknown or expired."""
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                if self._expired(entry[3]):
+                    self._drop_mem(key)
+                    return None
+                self._mem.move_to_end(key)
+                return entry[0], entry[1]
+            spilled = self._spilled.get(key)
+            if spilled is None:
+                return None
+            path, mime, sid, created = spilled
+            if self._expired(created):
+                self._drop_spilled(key)
+                return None
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                self._spilled.pop(key, None)
+                return None
+            # Promote back into memory; the disk copy is removed once it is resident again.
+            self._drop_spilled(key)
+            self._insert(key, data, mime, sid, created)
+            return data, mime
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._mem),
+                "bytes": self._bytes,
+                "spilled": len(self._spilled),
+                "sessions": dict(self._session_bytes),
+            }
+
+    def _insert(self, key, data, mime, sid, created):
+        size = _nbytes(data)
+        self._mem[key] = (data, mime, sid, created)
+        self._bytes += size
+        self._session_bytes[sid] = self._session_bytes.get(sid, 0) + size
+        # Per-session quota first (oldest entries of this session), then the global budget.
+        while self._session_bytes.get(sid, 0) > self.session_quota:
+            victim = next((k for k, v in self._mem.items() if v[2] == sid and k != key), None)
+            if victim is None:
+                break
+            self._spill(victim)
+        while self._bytes > self.max_bytes and len(self._mem) > 1:
+            victim = next(k for k in self._mem if k != key)
+            self._spill(victim)
+
+    def _spill(self, key):
+        data, mime, sid, created = self._mem[key]
+        self._drop_mem(key)
+        if self._expired(created):
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = os.path.join(self.spill_dir, key)
+            with open(path, "wb") as f:
+                f.write(data)
+            self._spilled[key] = (path, mime, sid, created)
+        except OSError:
+            # Spilling is best-effort; an unwritable disk just means plain eviction.
+            return
+        # Files trimmed here are dropped from the index lazily, when get() fails to open them.
+        trim_dir(self.spill_dir, self.spill_max_bytes)
+
+    def _clear_stale_spills(self):
+        # Spill files outlive the process but the index does not; anything older than the TTL
+        # can never be served again. Younger files may belong to another live instance.
+        cutoff = time.time() - self.ttl
+        try:
+            with os.scandir(self.spill_dir) as it:
+                for e in it:
+                    try:
+                        if e.is_file(follow_symlinks=False) and e.stat(follow_symlinks=False).st_mtime < cutoff:
+                            os.remove(e.path)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+    def _drop_mem(self, key):
+        data, _, sid, _ = self._mem.pop(key)
+        size = _nbytes(data)
+        self._bytes -= size
+        left = self._session_bytes.get(sid, 0) - size
+        if left > 0:
+            self._session_bytes[sid] = left
+        else:
+            self._session_bytes.pop(sid, None)
+
+    def _drop_spilled(self, key):
+        spilled = self._spilled.pop(key, None)
+        if spilled:
+            try:
+                os.remove(spilled[0])
+            except OSError:
+                pass
+
+    def _expired(self, created) -> bool:
+        return time.time() - created > self.ttl
+
+    def _purge_expired(self):
+        for key in [k for k, v in self._mem.items() if self._expired(v[3])]:
+            self._drop_mem(key)
+        for key in [k for k, v in self._spilled.items() if self._expired(v[3])]:
+            self._drop_spilled(key)
+
+
+def _nbytes(data) -> int:
+    return memoryview(data).nbytes
+
+
+_STORE = ArtifactStore.from_env()
+
+def get_store() -> ArtifactStore:
+    return _STORE
+
+def put_artifact(data, mime: str = "application/octet-stream", session_id: str = None) -> str:
+    """Store raw bytes (or a bytes-like buffer) and return the artifact id."""
+    return _STORE.put(data, mime, session_id)
+
+def get_artifact(key: str) -> bytes:
+    """Return the raw bytes of an artifact, or b"" when it is unknown or expired."""
+    entry = _STORE.get(key)
+    return bytes(entry[0]) if entry else b""
+
+def get_artifact_mime(key: str) -> str:
+    entry = _STORE.get(key)
+    return entry[1] if entry else ""
@@ -0,0 +1,227 @@
+import os
+import re
+import math
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from src.core.tables import file_digest
+from src.core.cachedir import private_cache_dir, touch, trim_dir
+
+# Environment variables (all optional):
+# - BM25_CACHE_DIR: where built indexes are persisted by content hash (default ~/.cache/bunnytools/bm25)
+# - BM25_CACHE_MAX_BYTES: size of that directory before the least recently used indexes go (default 512 MB)
+# - BM25_CHUNK_BYTES: target passage size in bytes (default 1200, ~300 English words or ~400 CJK chars)
+
+_K1 = 1.5
+_B = 0.75
+_MAX_INDEXES = 16
+_INDEX_VERSION = 4
+# Longer word tokens (hex dumps, base64 lines) are cut to this many characters; they are
+# never useful search terms beyond their prefix and would bloat the vocabulary
+_MAX_TOKEN_CHARS = 64
+
+# CJK has no spaces: runs are indexed as overlapping character bigrams (plus the single
+# character for one-character runs); everything else is split into lowercase word tokens.
+_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+_WORD = re.compile(r"[^\W_]+", re.UNICODE)
+
+def _words(text: str):
+    return [w[:_MAX_TOKEN_CHARS] for w in _WORD.findall(text.lower())]
+
+def tokenize(text: str):
+    tokens = []
+    pos = 0
+    for m in _CJK_RUN.finditer(text):
+        tokens.extend(_words(text[pos:m.start()]))
+        run = m.group()
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        pos = m.end()
+    tokens.extend(_words(text[pos:]))
+    return tokens
+
+def _split_long(raw: bytes, limit: int):
+    # Break a very long line (minified JSON, one-line dumps) without cutting a UTF-8 character
+    start = 0
+    while len(raw) - start > limit:
+        cut = start + limit
+        while cut > start and (raw[cut] & 0xC0) == 0x80:
+            cut -= 1
+        yield raw[start:cut]
+        start = cut
+    yield raw[start:]
+
+def _chunks(path: str, chunk_bytes: int):
+    """Yield (start_byte, end_byte, first_line, text) passages made of whole lines where possible."""
+    buf, size, start, first = [], 0, 0, 1
+    pos, line_no = 0, 1
+    with open(path, "rb") as f:
+        for line in f:
+            pieces = _split_long(line, chunk_bytes * 4) if len(line) > chunk_bytes * 4 else (line,)
+            for raw in pieces:
+                if not buf:
+                    start, first = pos, line_no
+                buf.append(raw)
+                size += len(raw)
+                pos += len(raw)
+                if size >= chunk_bytes:
+                    yield start, pos, first, b"".join(buf).decode("utf-8", errors="replace")
+                    buf, size = [], 0
+            line_no += 1
+    if buf:
+        yield start, pos, first, b"".join(buf).decode("utf-8", errors="replace")
+
+
+class BM25Index:
+    """Okapi BM25 over fixed-size passages of one text file.
+
+    Postings are kept in CSR form (vocab -> row, row pointers, passage ids, term frequencies), so a
+    query scores every passage with a few vectorized adds per query term and the index is saved
+    as a handful of flat arrays (.npz, loaded without pickle).
+    """
+
+    def __init__(self, starts, ends, lines, lengths, vocab, indptr, doc_ids, tfs):
+        self.starts = starts
+        self.ends = ends
+        self.lines = lines
+        self.lengths = lengths
+        self.vocab = vocab  # term -> row
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.avgdl = float(lengths.mean()) if len(lengths) else 0.0
+
+    @classmethod
+    def build(cls, path: str, chunk_bytes: int):
+        starts, ends, lines, lengths = [], [], [], []
+        post = {}
+        for doc, (start, end, first, text) in enumerate(_chunks(path, chunk_bytes)):
+            tokens = tokenize(text)
+            starts.append(start)
+            ends.append(end)
+            lines.append(first)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                ids_tfs = post.get(term)
+                if ids_tfs is None:
+                    post[term] = ids_tfs = ([], [])
+                ids_tfs[0].append(doc)
+                ids_tfs[1].append(tf)
+        vocab = {}
+        indptr = [0]
+        doc_ids, tfs = [], []
+        for row, (term, (ids, counts)) in enumerate(post.items()):
+            vocab[term] = row
+            doc_ids.extend(ids)
+            tfs.extend(counts)
+            indptr.append(len(doc_ids))
+        return cls(
+            np.array(starts, dtype=np.int64),
+            np.array(ends, dtype=np.int64),
+            np.array(lines, dtype=np.int64),
+            np.array(lengths, dtype=np.int32),
+            vocab,
+            np.array(indptr, dtype=np.int64),
+            np.array(doc_ids, dtype=np.int32),
+            np.array(tfs, dtype=np.float64),
+        )
+
+    def search(self, query: str, top_k: int = 5):
+        """Return [(passage id, score)] best first; passages without any query term are left out."""
+        n = len(self.lengths)
+        if not n:
+            return []
+        scores = np.zeros(n, dtype=np.float64)
+        norm = _K1 * (1 - _B + _B * self.lengths / max(self.avgdl, 1e-9))
+        for term in set(tokenize(query)):
+            row = self.vocab.get(term)
+            if row is None:
+                continue
+            lo, hi = self.indptr[row], self.indptr[row + 1]
+            ids, tf = self.doc_ids[lo:hi], self.tfs[lo:hi]
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tf * (_K1 + 1) / (tf + norm[ids])
+        k = min(top_k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+
+_INDEXES = OrderedDict()  # digest -> BM25Index
+_LOCK = threading.Lock()
+_BUILD_LOCKS = {}
+
+_CACHE_DIR = None
+
+def _cache_dir():
+    global _CACHE_DIR
+    if _CACHE_DIR is None:
+        _CACHE_DIR = private_cache_dir("bm25", "BM25_CACHE_DIR")
+    return _CACHE_DIR
+
+def get_index(path: str) -> BM25Index:
+    """Index for the file's content: memory, then the on-disk cache, then a fresh build."""
+    chunk_bytes = int(os.environ.get("BM25_CHUNK_BYTES", 1200))
+    digest = file_digest(path)
+    key = f"{digest}-{chunk_bytes}-v{_INDEX_VERSION}"
+    with _LOCK:
+        idx = _INDEXES.get(key)
+        if idx is not None:
+            _INDEXES.move_to_end(key)
+            return idx
+        build_lock = _BUILD_LOCKS.setdefault(key, threading.Lock())
+    # Concurrent searches on a new document build its index once
+    with build_lock:
+        with _LOCK:
+            idx = _INDEXES.get(key)
+        if idx is None:
+            idx = _load(key)
+        if idx is None:
+            idx = BM25Index.build(path, chunk_bytes)
+            _save(key, idx)
+        with _LOCK:
+            _INDEXES[key] = idx
+            _BUILD_LOCKS.pop(key, None)
+            while len(_INDEXES) > _MAX_INDEXES:
+                _INDEXES.popitem(last=False)
+    return idx
+
+def _load(key):
+    path = os.path.join(_cache_dir(), key + ".npz")
+    try:
+        with np.load(path, allow_pickle=False) as z:
+            blob = z["terms"].tobytes().decode("utf-8")
+            ends = z["term_ends"].tolist()
+            terms = [blob[a:b] for a, b in zip([0] + ends[:-1], ends)]
+            idx = BM25Index(
+                z["starts"], z["ends"], z["lines"], z["lengths"],
+                dict(zip(terms, range(len(terms)))),
+                z["indptr"], z["doc_ids"], z["tfs"],
+            )
+    except Exception:
+        return None
+    touch(path)
+    return idx
+
+def _save(key, idx):
+    path = os.path.join(_cache_dir(), key + ".npz")
+    try:
+        # Rows are numbered in vocab insertion order, so the term list alone restores the mapping.
+        # Terms are stored as one concatenated string plus end offsets (in characters): a
+        # fixed-width string array would be as wide as the longest term for every term.
+        terms = list(idx.vocab)
+        blob = np.frombuffer("".join(terms).encode("utf-8"), dtype=np.uint8)
+        term_ends = np.cumsum([len(t) for t in terms], dtype=np.int64)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(
+            tmp, terms=blob, term_ends=term_ends, starts=idx.starts, ends=idx.ends, lines=idx.lines, lengths=idx.lengths,
+            indptr=idx.indptr, doc_ids=idx.doc_ids, tfs=idx.tfs,
+        )
+        os.replace(tmp, path)
+        trim_dir(_cache_dir(), int(os.environ.get("BM25_CACHE_MAX_BYTES", 512 * 1024 * 1024)))
+    except Exception:
+        pass
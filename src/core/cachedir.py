@@ -0,0 +1,64 @@
+import os
+import tempfile
+from typing import Optional
+
+
+def _private(path: str) -> bool:
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):
+        return True
+    st = os.stat(path)
+    return st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+def private_cache_dir(name: str, env_var: Optional[str] = None) -> str:
+    """Cache directory for `name` that only the current user can read or write.
+
+    An explicit `env_var` setting is used as given. Otherwise the cache lives under
+    $XDG_CACHE_HOME (or ~/.cache)/bunnytools, falling back to a per-user directory in the system
+    temp dir; a directory that exists but belongs to someone else, or is group/world accessible,
+    is never used, since cached files are loaded back without further checks.
+    """
+    configured = os.environ.get(env_var) if env_var else None
+    if configured:
+        path = os.path.abspath(configured)
+        os.makedirs(path, exist_ok=True)
+        return path
+    uid = os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", "user")
+    home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    for base in (os.path.join(home, "bunnytools"), os.path.join(tempfile.gettempdir(), f"bunnytools-{uid}")):
+        try:
+            if _private(base):
+                path = os.path.join(base, name)
+                os.makedirs(path, mode=0o700, exist_ok=True)
+                return path
+        except OSError:
+            continue
+    return tempfile.mkdtemp(prefix=f"bunnytools-{name}-")
+
+def touch(path: str):
+    """Mark a cache file as recently used for trim_dir."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def trim_dir(path: str, max_bytes: int):
+    """Delete the least recently used files until the directory holds at most max_bytes."""
+    entries = []
+    try:
+        with os.scandir(path) as it:
+            for e in it:
+                if e.is_file(follow_symlinks=False):
+                    st = e.stat(follow_symlinks=False)
+                    entries.append((st.st_mtime, st.st_size, e.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, file in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(file)
+            total -= size
+        except OSError:
+            pass
@@ -1,24 +1,78 @@
 import os
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
+from src.core.llmcache import get_llm_cache
+from src.core.llmpool import Provider, ProviderPool, RoutedChatModel, request_timeout as pool_timeout
 
 load_dotenv()
 
-def get_llm():
+def _provider_configs():
+    configs = {}
     ds_key = os.environ.get("DEEPSEEK_API_KEY")
     zhipu_key = os.environ.get("ZHIPU_API_KEY")
     if ds_key:
-        return ChatOpenAI(
-            model=os.environ.get("DEEPSEEK_MODEL", "deepseek-chat"),
-            api_key=ds_key,
-            base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
-            temperature=0,
-        )
+        configs["deepseek"] = {
+            "provider": "deepseek",
+            "model": os.environ.get("DEEPSEEK_MODEL", "deepseek-chat"),
+            "api_key": ds_key,
+            "base_url": os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
+        }
     if zhipu_key:
-        return ChatOpenAI(
-            model=os.environ.get("ZHIPU_MODEL", "glm-4-flash"),
-            api_key=zhipu_key,
-            base_url=os.environ.get("ZHIPU_BASE_URL", "https://open.bigmodel.cn/api/paas/v4/"),
-            temperature=0,
-        )
-    raise RuntimeError("Missing API Key: 请在侧边栏或 .env 中配置 DEEPSEEK_API_KEY 或 ZHIPU_API_KEY")
+        configs["zhipu"] = {
+            "provider": "zhipu",
+            "model": os.environ.get("ZHIPU_MODEL", "glm-4-flash"),
+            "api_key": zhipu_key,
+            "base_url": os.environ.get("ZHIPU_BASE_URL", "https://open.bigmodel.cn/api/paas/v4/"),
+        }
+    return configs
+
+def get_llm_configs():
+    """All configured providers, in LLM_PROVIDERS order (default: deepseek, zhipu)."""
+    configs = _provider_configs()
+    order = [p.strip() for p in os.environ.get("LLM_PROVIDERS", "").split(",") if p.strip()]
+    ordered = [configs[p] for p in order if p in configs]
+    ordered += [c for name, c in configs.items() if name not in order]
+    if not ordered:
+        raise RuntimeError("Missing API Key: 请在侧边栏或 .env 中配置 DEEPSEEK_API_KEY 或 ZHIPU_API_KEY")
+    return ordered
+
+def get_llm_config():
+    """Resolve the provider settings from the current env vars (sidebar keys override .env)."""
+    return get_llm_configs()[0]
+
+def _chat_openai(cfg, http_client=None, http_async_client=None, **kwargs):
+    return ChatOpenAI(
+        model=cfg["model"],
+        api_key=cfg["api_key"],
+        base_url=cfg["base_url"],
+        temperature=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        **kwargs,
+    )
+
+def get_llm(cfg=None):
+    cfg = cfg or get_llm_config()
+    # temperature=0 makes repeated requests deterministic enough to answer from the response cache
+    return _chat_openai(cfg, cache=get_llm_cache(f"{cfg['provider']}|{cfg['base_url']}"))
+
+def routing_enabled() -> bool:
+    return os.environ.get("LLM_ROUTING", "on").lower() not in ("off", "0", "false", "no")
+
+def get_chat_model(cfgs=None):
+    """Chat model for the agent: a single provider, or a RoutedChatModel over all configured ones
+    (latency-ranked, with failover) when more than one is configured and LLM_ROUTING is on."""
+    cfgs = cfgs or get_llm_configs()
+    if len(cfgs) == 1 or not routing_enabled():
+        return get_llm(cfgs[0])
+    # Retries and timeouts are handled by the pool, which moves on to the next provider instead
+    providers = [
+        Provider(cfg, lambda c, h, ah: _chat_openai(c, h, ah, cache=False, max_retries=0, timeout=pool_timeout()))
+        for cfg in cfgs
+    ]
+    namespace = "pool|" + "|".join(f"{c['provider']}:{c['base_url']}" for c in cfgs)
+    return RoutedChatModel(
+        pool=ProviderPool(providers),
+        model_names=[f"{c['provider']}:{c['model']}" for c in cfgs],
+        cache=get_llm_cache(namespace),
+    )
@@ -0,0 +1,80 @@
+import os
+import time
+import sqlite3
+import threading
+
+class SQLiteTTLCache:
+    """Small string key/value cache persisted in SQLite, with per-entry expiry.
+
+    Entries older than `ttl` seconds are ignored on read and purged on write; when the table
+    grows past `max_entries` the oldest rows are dropped. One connection is shared by all
+    threads (guarded by a lock), so the cache survives Streamlit reruns and process restarts.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int, table: str = "cache"):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.table = table
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_created ON {self.table}(created)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str):
+        if self.ttl <= 0:
+            return None
+        try:
+            with self._lock:
+                row = self._db().execute(
+                    f"SELECT value FROM {self.table} WHERE key = ? AND created >= ?",
+                    (key, time.time() - self.ttl),
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def set(self, key: str, value: str):
+        if self.ttl <= 0:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, now),
+                )
+                self._writes += 1
+                # Purge every so often rather than on each write
+                if self._writes % 64 == 1:
+                    db.execute(f"DELETE FROM {self.table} WHERE created < ?", (now - self.ttl,))
+                    db.execute(
+                        f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                        "ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,),
+                    )
+                db.commit()
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        try:
+            with self._lock:
+                self._db().execute(f"DELETE FROM {self.table}")
+                self._db().commit()
+        except sqlite3.Error:
+            pass
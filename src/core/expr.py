@@ -0,0 +1,225 @@
+import ast
+import math
+import operator
+from functools import lru_cache
+
+import numpy as np
+
+# Limits that keep a single expression from hanging or exhausting the process
+MAX_EXPRESSION_CHARS = 2000
+MAX_NODES = 500
+MAX_INT_BITS = 4096  # ~1233 decimal digits
+MAX_COMBINATORIC_ARG = 1000  # factorial / comb / perm argument bound
+MAX_ROUND_DIGITS = 100  # round() ndigits bound; round(7, -10**7) alone takes seconds
+
+CONSTANTS = {"pi": math.pi, "e": math.e, "tau": math.tau, "inf": math.inf, "nan": math.nan}
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def _check_int(value):
+    if isinstance(value, int) and not isinstance(value, bool) and value.bit_length() > MAX_INT_BITS:
+        raise ExpressionError(f"result exceeds {MAX_INT_BITS} bits")
+    return value
+
+def _checked(op):
+    return lambda a, b: _check_int(op(a, b))
+
+def _safe_pow(base, exp):
+    if isinstance(base, int) and isinstance(exp, int) and exp > 0 and abs(base) > 1:
+        if exp * math.log2(abs(base)) > MAX_INT_BITS:
+            raise ExpressionError(f"result of {base}**{exp} exceeds {MAX_INT_BITS} bits")
+    return _check_int(operator.pow(base, exp))
+
+def _combinatoric(fn):
+    def wrapped(*args):
+        for a in args:
+            if not isinstance(a, int) or isinstance(a, bool):
+                if isinstance(a, float) and a.is_integer():
+                    continue
+                raise ExpressionError(f"{fn.__name__}() needs integer arguments")
+            if a > MAX_COMBINATORIC_ARG:
+                raise ExpressionError(f"{fn.__name__}() argument larger than {MAX_COMBINATORIC_ARG}")
+        return _check_int(fn(*[int(a) for a in args]))
+    wrapped.__name__ = fn.__name__
+    return wrapped
+
+def _bounded_round(fn):
+    def wrapped(x, ndigits=None):
+        if ndigits is not None:
+            if isinstance(ndigits, float) and ndigits.is_integer():
+                ndigits = int(ndigits)
+            if not isinstance(ndigits, int) or isinstance(ndigits, bool):
+                raise ExpressionError("round() needs an integer number of digits")
+            if abs(ndigits) > MAX_ROUND_DIGITS:
+                raise ExpressionError(f"round() digits beyond ±{MAX_ROUND_DIGITS}")
+            return fn(x, ndigits)
+        return fn(x)
+    return wrapped
+
+def _log(x, base=None):
+    return math.log(x) if base is None else math.log(x, base)
+
+def _vlog(x, base=None):
+    return np.log(x) if base is None else np.log(x) / np.log(base)
+
+def _vreduce(ufunc):
+    return lambda *args: ufunc.reduce(np.broadcast_arrays(*args)) if len(args) > 1 else args[0]
+
+def _vectorized(fn):
+    f = np.frompyfunc(fn, 2 if fn.__name__ in ("comb", "perm", "gcd") else 1, 1)
+    return lambda *args: f(*args).astype(np.float64)
+
+
+_SCALAR = {
+    "binop": {
+        ast.Add: _checked(operator.add),
+        ast.Sub: _checked(operator.sub),
+        ast.Mult: _checked(operator.mul),
+        ast.Div: operator.truediv,
+        ast.FloorDiv: operator.floordiv,
+        ast.Mod: operator.mod,
+        ast.Pow: _safe_pow,
+    },
+    "func": {
+        "abs": abs, "round": _bounded_round(round), "min": min, "max": max, "pow": _safe_pow,
+        "sqrt": math.sqrt, "exp": math.exp, "log": _log, "log10": math.log10, "log2": math.log2,
+        "sin": math.sin, "cos": math.cos, "tan": math.tan,
+        "asin": math.asin, "acos": math.acos, "atan": math.atan, "atan2": math.atan2,
+        "sinh": math.sinh, "cosh": math.cosh, "tanh": math.tanh,
+        "floor": math.floor, "ceil": math.ceil, "hypot": math.hypot,
+        "degrees": math.degrees, "radians": math.radians,
+        "factorial": _combinatoric(math.factorial), "comb": _combinatoric(math.comb),
+        "perm": _combinatoric(math.perm), "gcd": _combinatoric(math.gcd),
+    },
+}
+
+# Batch mode evaluates over float64 arrays, so overflow gives inf instead of a huge int
+_VECTOR = {
+    "binop": {
+        ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide,
+        ast.FloorDiv: np.floor_divide, ast.Mod: np.mod, ast.Pow: np.power,
+    },
+    "func": {
+        "abs": np.abs, "round": _bounded_round(np.round), "min": _vreduce(np.minimum), "max": _vreduce(np.maximum), "pow": np.power,
+        "sqrt": np.sqrt, "exp": np.exp, "log": _vlog, "log10": np.log10, "log2": np.log2,
+        "sin": np.sin, "cos": np.cos, "tan": np.tan,
+        "asin": np.arcsin, "acos": np.arccos, "atan": np.arctan, "atan2": np.arctan2,
+        "sinh": np.sinh, "cosh": np.cosh, "tanh": np.tanh,
+        "floor": np.floor, "ceil": np.ceil, "hypot": np.hypot,
+        "degrees": np.degrees, "radians": np.radians,
+        "factorial": _vectorized(_SCALAR["func"]["factorial"]), "comb": _vectorized(_SCALAR["func"]["comb"]),
+        "perm": _vectorized(_SCALAR["func"]["perm"]), "gcd": _vectorized(_SCALAR["func"]["gcd"]),
+    },
+}
+
+_UNARY = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+_COMPARE = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt,
+    ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+
+
+def _compile_node(node, names):
+    """Turn a whitelisted AST node into a closure fn(env, lib); anything else is rejected."""
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if type(value) not in (int, float):
+            raise ExpressionError(f"unsupported constant {value!r}")
+        return lambda env, lib: value
+    if isinstance(node, ast.Name):
+        if node.id in CONSTANTS:
+            value = CONSTANTS[node.id]
+            return lambda env, lib: value
+        name = node.id
+        names.add(name)
+        def load(env, lib):
+            try:
+                return env[name]
+            except KeyError:
+                raise ExpressionError(f"unknown name '{name}'")
+        return load
+    if isinstance(node, ast.BinOp) and type(node.op) in _SCALAR["binop"]:
+        left, right, op = _compile_node(node.left, names), _compile_node(node.right, names), type(node.op)
+        return lambda env, lib: lib["binop"][op](left(env, lib), right(env, lib))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        operand, op = _compile_node(node.operand, names), _UNARY[type(node.op)]
+        return lambda env, lib: op(operand(env, lib))
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _COMPARE:
+        left, right, op = _compile_node(node.left, names), _compile_node(node.comparators[0], names), _COMPARE[type(node.ops[0])]
+        return lambda env, lib: op(left(env, lib), right(env, lib))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _SCALAR["func"]:
+        if node.keywords:
+            raise ExpressionError("keyword arguments are not supported")
+        fname = node.func.id
+        args = [_compile_node(a, names) for a in node.args]
+        return lambda env, lib: lib["func"][fname](*[a(env, lib) for a in args])
+    raise ExpressionError(f"unsupported syntax: {type(node).__name__}")
+
+@lru_cache(maxsize=512)
+def compile_expression(expression: str):
+    """Parse and validate once per distinct expression; returns (fn, variable names)."""
+    if len(expression) > MAX_EXPRESSION_CHARS:
+        raise ExpressionError(f"expression longer than {MAX_EXPRESSION_CHARS} characters")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"invalid syntax: {e.msg}")
+    if sum(1 for _ in ast.walk(tree)) > MAX_NODES:
+        raise ExpressionError(f"expression has more than {MAX_NODES} nodes")
+    names = set()
+    fn = _compile_node(tree.body, names)
+    return fn, frozenset(names)
+
+def _number(name, value):
+    """Coerce one variable binding to int/float. Anything else (strings that are not numbers,
+    lists, dicts) is rejected here, before it can reach an operator: `s * 50000000` with a
+    string `s` would otherwise build a huge string."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        try:
+            return _check_int(value)
+        except ExpressionError:
+            raise ExpressionError(f"variable '{name}' exceeds {MAX_INT_BITS} bits")
+    if isinstance(value, float):
+        return value
+    if isinstance(value, str) and len(value) <= 100:
+        text = value.strip()
+        try:
+            return _check_int(int(text))
+        except (ValueError, ExpressionError):
+            try:
+                return float(text)
+            except ValueError:
+                pass
+    raise ExpressionError(f"variable '{name}' must be a number, got {type(value).__name__}")
+
+def evaluate(expression: str, variables: dict = None):
+    fn, _ = compile_expression(expression)
+    env = {k: _number(k, v) for k, v in (variables or {}).items()}
+    return fn(env, _SCALAR)
+
+def evaluate_batch(expression: str, columns: dict) -> np.ndarray:
+    """Evaluate over equally long columns of bindings at once (numpy broadcasting); scalars broadcast."""
+    fn, names = compile_expression(expression)
+    env = {}
+    for k, v in columns.items():
+        if isinstance(v, np.ndarray) and v.dtype.kind in "biuf":
+            env[k] = v.astype(np.float64, copy=False)
+        elif isinstance(v, (list, tuple, np.ndarray)):
+            # Missing row values arrive as None/NaN and stay NaN
+            env[k] = np.array([np.nan if x is None else float(_number(k, x)) for x in v], dtype=np.float64)
+        else:
+            env[k] = np.asarray(float(_number(k, v)), dtype=np.float64)
+    lengths = {a.shape[0] for a in env.values() if a.ndim == 1}
+    if len(lengths) > 1:
+        raise ExpressionError("all variable columns must have the same length")
+    n = lengths.pop() if lengths else 1
+    with np.errstate(all="ignore"):
+        result = fn(env, _VECTOR)
+    return np.broadcast_to(np.asarray(result, dtype=np.float64), (n,))
@@ -0,0 +1,96 @@
+import os
+import subprocess
+import threading
+from functools import lru_cache
+
+from PIL import ImageFont
+
+_CJK_CANDIDATES = [
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/msyh.ttf",
+    "C:/Windows/Fonts/msyhbd.ttf",
+    "C:/Windows/Fonts/simhei.ttf",
+    "C:/Windows/Fonts/simsun.ttc",
+    "C:/Windows/Fonts/msjh.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Light.ttc",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttf",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/arphic/ukai.ttc",
+    "/usr/share/fonts/truetype/arphic/uming.ttc",
+]
+
+_LATIN_CANDIDATES = [
+    "arial.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "DejaVuSans.ttf",
+]
+
+_resolved = {}
+_lock = threading.Lock()
+
+def _loadable(path: str) -> bool:
+    try:
+        ImageFont.truetype(path, 12)
+        return True
+    except Exception:
+        return False
+
+def _first_loadable(paths):
+    for fp in paths:
+        if os.path.exists(fp) and _loadable(fp):
+            return fp
+    return None
+
+def _fc_list_cjk():
+    # Linux/Streamlit Cloud: ask fontconfig for any font covering Chinese
+    try:
+        output = subprocess.check_output(["fc-list", ":lang=zh", "file"], text=True, timeout=10)
+    except Exception:
+        return None
+    paths = [line.split(":")[0].strip() for line in output.splitlines() if line.strip()]
+    return _first_loadable(paths)
+
+def _resolve(kind: str):
+    with _lock:
+        if kind not in _resolved:
+            if kind == "cjk":
+                _resolved[kind] = _first_loadable(_CJK_CANDIDATES) or _fc_list_cjk()
+            else:
+                _resolved[kind] = _first_loadable(_LATIN_CANDIDATES)
+        return _resolved[kind]
+
+def cjk_font_path():
+    """Path of a font able to render Chinese, discovered once per process (None if there is none)."""
+    return _resolve("cjk")
+
+def latin_font_path():
+    return _resolve("latin")
+
+def default_font_path():
+    return cjk_font_path() or latin_font_path()
+
+@lru_cache(maxsize=128)
+def get_font(path: str, size: int):
+    """Memoized ImageFont.truetype; raises like truetype when the file cannot be loaded."""
+    return ImageFont.truetype(path, size)
+
+@lru_cache(maxsize=1)
+def matplotlib_font_families():
+    """sans-serif family list for matplotlib, led by the resolved CJK font (registered with matplotlib)."""
+    families = ["SimHei", "Microsoft YaHei", "SimSun", "Arial", "DejaVu Sans", "sans-serif"]
+    path = cjk_font_path()
+    if not path:
+        return families
+    try:
+        from matplotlib import font_manager
+        font_manager.fontManager.addfont(path)
+        name = font_manager.FontProperties(fname=path).get_name()
+        return [name] + [f for f in families if f != name]
+    except Exception:
+        return families
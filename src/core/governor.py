@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import base64
+import binascii
+
+from src.core.artifacts import put_artifact
+
+# Environment variables (all optional):
+# - TOOL_OUTPUT_MAX_CHARS: tool results longer than this are stored as an artifact and the model
+#   gets a preview instead (default 8000, ~2-8k tokens)
+# - TOOL_OUTPUT_PREVIEW_CHARS: size of that preview (default 1500)
+
+_MARKER = re.compile(r"\[(?:IMAGE_ID|FILE_ID):[^\]]+\]")
+# Inline base64 payloads some tools still emit; the UI renders the artifact form just the same
+_INLINE_IMAGE = re.compile(r"\[IMAGE:([a-zA-Z0-9]+):([A-Za-z0-9+/=\s]+)\]")
+_INLINE_IMAGE_DATA = re.compile(r"\[IMAGE_DATA: ([A-Za-z0-9+/=\s]+)\]")
+_INLINE_FILE = re.compile(r"\[FILE:([a-zA-Z0-9]+):([A-Za-z0-9+/=\s]+):([^\]]+)\]")
+
+_FILE_MIMES = {
+    "csv": "text/csv",
+    "json": "application/json",
+    "txt": "text/plain",
+}
+
+
+def max_chars() -> int:
+    return int(os.environ.get("TOOL_OUTPUT_MAX_CHARS", 8000))
+
+def preview_chars() -> int:
+    return int(os.environ.get("TOOL_OUTPUT_PREVIEW_CHARS", 1500))
+
+def _b64(payload):
+    try:
+        return base64.b64decode(re.sub(r"\s+", "", payload), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+def externalize_inline_payloads(text: str) -> str:
+    """Swap inline base64 image/file markers for artifact markers."""
+    def image(m):
+        data = _b64(m.group(2))
+        if data is None:
+            return m.group(0)
+        mime = m.group(1).lower()
+        return f"[IMAGE_ID:{put_artifact(data, f'image/{mime}')}:{mime}]"
+
+    def image_data(m):
+        data = _b64(m.group(1))
+        return m.group(0) if data is None else f"[IMAGE_ID:{put_artifact(data, 'image/png')}:png]"
+
+    def file(m):
+        data = _b64(m.group(2))
+        if data is None:
+            return m.group(0)
+        ext = m.group(1).lower()
+        return f"[FILE_ID:{put_artifact(data, _FILE_MIMES.get(ext, 'application/octet-stream'))}:{ext}:{m.group(3)}]"
+
+    if "[IMAGE" in text:
+        text = _INLINE_IMAGE.sub(image, text)
+        text = _INLINE_IMAGE_DATA.sub(image_data, text)
+    if "[FILE:" in text:
+        text = _INLINE_FILE.sub(file, text)
+    return text
+
+def _sniff(text: str) -> str:
+    stripped = text.lstrip()
+    if stripped[:1] in ("{", "["):
+        try:
+            json.loads(stripped)
+            return "json"
+        except ValueError:
+            pass
+    lines = text.splitlines()[:20]
+    if len(lines) >= 3:
+        commas = {line.count(",") for line in lines[:-1]}
+        if len(commas) == 1 and commas.pop() > 0:
+            return "csv"
+    return "txt"
+
+def _head_tail(text: str, budget: int) -> str:
+    if len(text) <= budget:
+        return text
+    head = text[: budget * 3 // 4]
+    tail = text[-(budget // 4):]
+    return f"{head}\n... [{len(text) - len(head) - len(tail)} chars omitted] ...\n{tail}"
+
+def _csv_preview(text: str, budget: int) -> str:
+    lines = text.splitlines()
+    header = lines[0]
+    out = [f"CSV with {len(lines) - 1} rows and {header.count(',') + 1} columns: {header[:500]}", "First rows:"]
+    used = sum(len(x) for x in out)
+    for line in lines[1:6]:
+        if used + len(line) > budget:
+            break
+        out.append(line)
+        used += len(line)
+    return "\n".join(out)
+
+def _json_preview(text: str, budget: int) -> str:
+    value = json.loads(text)
+    if isinstance(value, dict):
+        keys = list(value)
+        shape = f"JSON object with {len(keys)} keys: {', '.join(map(str, keys[:30]))}{' ...' if len(keys) > 30 else ''}"
+    elif isinstance(value, list):
+        first = value[0] if value else None
+        item = f"; items look like {type(first).__name__}" + (f" with keys {', '.join(map(str, list(first)[:20]))}" if isinstance(first, dict) else "")
+        shape = f"JSON array with {len(value)} items{item if value else ''}"
+    else:
+        shape = f"JSON {type(value).__name__}"
+    return f"{shape}\n{_head_tail(text, max(0, budget - len(shape)))}"
+
+def preview(text: str, kind: str = None, budget: int = None) -> str:
+    budget = budget or preview_chars()
+    kind = kind or _sniff(text)
+    if kind == "csv":
+        return _csv_preview(text, budget)
+    if kind == "json":
+        return _json_preview(text, budget)
+    return f"{text.count(chr(10)) + 1} lines\n{_head_tail(text, budget)}"
+
+def offload(text: str, tool_name: str = "tool") -> str:
+    """Store `text` as an artifact and return a preview plus its download marker. Artifact
+    markers found in the full text are carried over so the UI still renders them."""
+    markers = list(dict.fromkeys(_MARKER.findall(text)))
+    body = _MARKER.sub("", text) if markers else text
+    kind = _sniff(body)
+    aid = put_artifact(text.encode("utf-8"), _FILE_MIMES[kind])
+    # Markers the tool produced come first: the UI renders the first image/file marker it finds
+    return "\n".join([
+        f"[Output of {tool_name} was {len(text)} chars; only a preview is shown. "
+        "Narrow the request (filters, line ranges, search) if more detail is needed.]",
+        preview(body, kind),
+        *markers,
+        f"Full output: [FILE_ID:{aid}:{kind}:{tool_name}_output.{kind}]",
+    ])
+
+def govern(text: str, tool_name: str = "tool") -> str:
+    """Apply the output-size policy to one tool result string."""
+    text = externalize_inline_payloads(text)
+    if len(text) <= max_chars():
+        return text
+    return offload(text, tool_name)
+
+def govern_tool_message(result):
+    """ToolNode wrapper hook: rewrite oversized ToolMessage content; other results pass through."""
+    content = getattr(result, "content", None)
+    if not isinstance(content, str) or getattr(result, "type", "") != "tool":
+        return result
+    governed = govern(content, getattr(result, "name", None) or "tool")
+    if governed == content:
+        return result
+    return result.model_copy(update={"content": governed})
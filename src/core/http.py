@@ -0,0 +1,21 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_session = None
+_session_lock = threading.Lock()
+
+def http_session() -> requests.Session:
+    """Process-wide requests.Session; keep-alive connections are reused across tool calls."""
+    global _session
+    if _session is not None:
+        return _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+    return _session
@@ -0,0 +1,436 @@
+import os
+import io
+import re
+import ast
+import time
+import threading
+import contextlib
+import multiprocessing
+from collections import OrderedDict
+
+from src.core.session import current_session_id
+
+# Environment variables (all optional):
+# - PY_EXEC_TIMEOUT: wall-clock limit per python_interpreter call in seconds (default 30)
+# - PY_WORKER_MEMORY_MB: extra heap a worker may allocate beyond its warm baseline (default 1024)
+# - PY_WORKER_MAX: workers bound to sessions at the same time; the least recently used is recycled (default 4)
+# - PY_WORKER_WARM: idle pre-warmed workers kept ready for new sessions (default 1)
+# - PY_WORKER_IDLE_TTL: seconds before an idle session's worker (and namespace) is released (default 1800)
+# - PY_DF_ARTIFACT_MAX_BYTES: largest DataFrame CSV returned as an artifact (default 20 MB)
+# - PY_PRELOAD_MAX_BYTES: uploads larger than this are not preloaded as DataFrames (default 512 MB)
+
+_MAX_FRAMES = 3
+
+class InterpreterError(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Worker process side
+# ---------------------------------------------------------------------------
+
+def _limit_memory(extra_bytes):
+    # RLIMIT_DATA covers heap and anonymous mmaps but not shared libraries or file-backed maps,
+    # so the cap is taken relative to the worker's footprint after the warm imports.
+    try:
+        import resource
+        with open("/proc/self/statm") as f:
+            data_pages = int(f.read().split()[5])
+        limit = data_pages * os.sysconf("SC_PAGE_SIZE") + extra_bytes
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+    except Exception:
+        # Non-Linux platforms: only the wall-clock limit applies
+        pass
+
+def table_var_name(filename):
+    """`sales 2024.csv` -> `df_sales_2024` (non-identifier characters collapse to `_`)."""
+    stem = re.sub(r"\W+", "_", os.path.splitext(filename)[0]).strip("_").lower()
+    name = f"df_{stem}" if stem else "df_table"
+    return name if name.isidentifier() else "df_table"
+
+def _preload_tables(ns, tables, loaded):
+    """Bind uploaded tables as `tables[filename]` and `df_<name>` (runs in the worker).
+
+    Each upload is parsed once per content into an Arrow IPC file (table_arrow_path in
+    src/core/tables.py) that is memory-mapped with ArrowDtype columns, so the DataFrames point
+    straight at the mapped pages. The first parse happens here, under the call's time and memory
+    limits; later calls and other workers only map the file. Without pyarrow the upload is parsed
+    with pandas directly. A name is only (re)bound when its upload is new or its content changed,
+    so user code may reassign it freely between calls.
+    """
+    import pandas as pd
+    from src.core.tables import parse_table, table_arrow_path
+    try:
+        import pyarrow as pa
+    except ImportError:
+        pa = None
+
+    if not isinstance(ns.get("tables"), dict):
+        ns["tables"] = {}
+    bound, errors = [], []
+    for filename, path in tables.items():
+        if loaded.get(filename) == path:
+            continue
+        try:
+            arrow = table_arrow_path(path) if pa is not None else None
+            if arrow:
+                df = pa.ipc.open_file(pa.memory_map(arrow)).read_all().to_pandas(types_mapper=pd.ArrowDtype)
+            else:
+                df = parse_table(path)
+        except MemoryError:
+            errors.append(f"{filename}: too large for the interpreter memory limit")
+            continue
+        except Exception as e:
+            errors.append(f"{filename}: {e}")
+            continue
+        var = table_var_name(filename)
+        ns["tables"][filename] = df
+        ns[var] = df
+        loaded[filename] = path
+        bound.append(f"{var} = tables[{filename!r}] ({len(df)} rows x {len(df.columns)} cols)")
+    return bound, errors
+
+def _run_code(code, ns):
+    """exec() the code; if it ends with an expression, print its value like a REPL would."""
+    tree = ast.parse(code, mode="exec")
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+    exec(compile(tree, "<python_interpreter>", "exec"), ns)
+    if last is not None:
+        value = eval(compile(last, "<python_interpreter>", "eval"), ns)
+        if value is not None:
+            print(repr(value))
+
+def _execute(ns, code, max_df_bytes, tables=None, loaded=None):
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    preloaded, preload_errors = _preload_tables(ns, tables or {}, loaded if loaded is not None else {})
+    before = {k: id(v) for k, v in ns.items() if isinstance(v, pd.DataFrame)}
+    out = io.StringIO()
+    error = ""
+    plt.close("all")
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            _run_code(code, ns)
+    except MemoryError:
+        error = "MemoryError: the code exceeded the interpreter memory limit"
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+
+    figures = []
+    for num in plt.get_fignums():
+        buf = io.BytesIO()
+        try:
+            plt.figure(num).savefig(buf, format="png", bbox_inches="tight")
+            figures.append(buf.getvalue())
+        except Exception as e:
+            error = error or f"Error rendering figure: {e}"
+    plt.close("all")
+
+    # DataFrames bound (or re-bound) by this call come back as CSV artifacts
+    frames, skipped = [], []
+    for name, value in list(ns.items()):
+        if name.startswith("_") or not isinstance(value, pd.DataFrame) or before.get(name) == id(value):
+            continue
+        if len(frames) >= _MAX_FRAMES:
+            skipped.append(name)
+            continue
+        data = value.to_csv(index=False).encode("utf-8")
+        if len(data) > max_df_bytes:
+            skipped.append(name)
+            continue
+        frames.append((name, data))
+    return {
+        "output": out.getvalue(),
+        "error": error,
+        "figures": figures,
+        "frames": frames,
+        "skipped": skipped,
+        "preloaded": preloaded,
+        "preload_errors": preload_errors,
+    }
+
+def _worker_main(conn, memory_bytes, max_df_bytes):
+    # Warm imports happen once per worker, before it reports ready
+    import numpy as np
+    import pandas as pd
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    try:
+        import pyarrow  # noqa: F401  (used to map preloaded upload tables)
+    except ImportError:
+        pass
+    import src.core.tables  # noqa: F401  (parses uploads for preloading)
+    try:
+        from src.core.fonts import matplotlib_font_families
+        plt.rcParams["font.sans-serif"] = matplotlib_font_families()
+        plt.rcParams["axes.unicode_minus"] = False
+    except Exception:
+        pass
+    _limit_memory(memory_bytes)
+    ns = {"__name__": "__main__", "np": np, "pd": pd, "plt": plt}
+    loaded = {}  # filename -> Arrow IPC path currently bound in ns
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            kind, payload = conn.recv()
+        except (EOFError, OSError):
+            return
+        if kind == "exec":
+            if payload.get("cwd") and os.path.isdir(payload["cwd"]):
+                os.chdir(payload["cwd"])
+            try:
+                conn.send(_execute(ns, payload["code"], max_df_bytes, payload.get("tables"), loaded))
+            except MemoryError:
+                conn.send({
+                    "output": "",
+                    "error": "MemoryError: result too large to return",
+                    "figures": [],
+                    "frames": [],
+                    "skipped": [],
+                    "preloaded": [],
+                    "preload_errors": [],
+                })
+
+
+# ---------------------------------------------------------------------------
+# Server side
+# ---------------------------------------------------------------------------
+
+class _Worker:
+    def __init__(self, ctx, memory_bytes, max_df_bytes):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(
+            target=_worker_main, args=(child, memory_bytes, max_df_bytes), name="py-interpreter", daemon=True
+        )
+        self.proc.start()
+        child.close()
+        self.lock = threading.Lock()
+        self.ready = False
+        self.last_used = time.time()
+        self.users = 0  # run() calls holding this worker; guarded by the pool lock
+
+    def wait_ready(self, timeout):
+        if self.ready:
+            return
+        if not self.conn.poll(timeout):
+            self.kill()
+            raise InterpreterError("interpreter worker did not start in time")
+        try:
+            self.conn.recv()
+        except (EOFError, OSError):
+            self.kill()
+            raise InterpreterError("interpreter worker exited during startup")
+        self.ready = True
+
+    def call(self, code, timeout, tables=None, cwd=None):
+        self.conn.send(("exec", {"code": code, "tables": tables or {}, "cwd": cwd}))
+        if not self.conn.poll(timeout):
+            self.kill()
+            raise TimeoutError
+        try:
+            return self.conn.recv()
+        except (EOFError, OSError):
+            self.kill()
+            raise InterpreterError("interpreter worker crashed (possibly killed for exceeding memory)")
+
+    def alive(self):
+        return self.proc.is_alive()
+
+    def kill(self):
+        try:
+            self.proc.kill()
+            self.proc.join(1)
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class InterpreterPool:
+    """Pre-warmed worker processes running python_interpreter code outside the server process.
+
+    Each chat session is bound to one worker, whose globals persist between calls. A call that
+    exceeds the wall-clock limit gets its worker killed (the session starts over with a fresh
+    namespace); memory is capped per worker with RLIMIT_DATA. Idle warm workers are kept ready
+    so a new session does not pay for interpreter start-up and the pandas/matplotlib imports.
+    """
+
+    def __init__(self, timeout, memory_bytes, max_workers, warm, idle_ttl, max_df_bytes):
+        self.timeout = timeout
+        self.memory_bytes = memory_bytes
+        self.max_workers = max_workers
+        self.warm_count = warm
+        self.idle_ttl = idle_ttl
+        self.max_df_bytes = max_df_bytes
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = []
+        self._sessions = OrderedDict()  # session_id -> _Worker
+        self._lock = threading.Lock()
+        self._janitor = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            timeout=float(os.environ.get("PY_EXEC_TIMEOUT", 30)),
+            memory_bytes=int(os.environ.get("PY_WORKER_MEMORY_MB", 1024)) * 1024 * 1024,
+            max_workers=max(1, int(os.environ.get("PY_WORKER_MAX", 4))),
+            warm=max(0, int(os.environ.get("PY_WORKER_WARM", 1))),
+            idle_ttl=float(os.environ.get("PY_WORKER_IDLE_TTL", 1800)),
+            max_df_bytes=int(os.environ.get("PY_DF_ARTIFACT_MAX_BYTES", 20 * 1024 * 1024)),
+        )
+
+    def warm(self):
+        """Top up the idle pool in the background; safe to call repeatedly."""
+        self._ensure_janitor()
+        threading.Thread(target=self._replenish, name="py-interpreter-warm", daemon=True).start()
+
+    def run(self, code, session_id=None, tables=None, cwd=None):
+        """Execute code in the session's worker. `tables` maps upload filenames to the uploads to
+        expose as DataFrames (see upload_tables); `cwd` is the
+        session's working directory, where uploads/<filename> resolves to its own uploads.
+        """
+        sid = session_id or current_session_id()
+        worker = self._acquire(sid)
+        try:
+            with worker.lock:
+                worker.wait_ready(60)
+                result = worker.call(code, self.timeout, tables, cwd)
+                worker.last_used = time.time()
+                return result
+        except TimeoutError:
+            self._drop(sid, worker)
+            raise TimeoutError(
+                f"execution exceeded {self.timeout:g}s; the interpreter was restarted and its variables were cleared"
+            )
+        except InterpreterError:
+            self._drop(sid, worker)
+            raise
+        finally:
+            with self._lock:
+                worker.users -= 1
+            self.warm()
+
+    def reset_session(self, session_id):
+        with self._lock:
+            worker = self._sessions.pop(session_id, None)
+        if worker:
+            worker.kill()
+
+    def shutdown(self):
+        with self._lock:
+            workers = list(self._sessions.values()) + self._idle
+            self._sessions.clear()
+            self._idle = []
+        for w in workers:
+            w.kill()
+
+    def _acquire(self, sid):
+        evicted = []
+        with self._lock:
+            worker = self._sessions.get(sid)
+            if worker is not None and worker.alive():
+                self._sessions.move_to_end(sid)
+                worker.users += 1
+                return worker
+            self._sessions.pop(sid, None)
+            while self._idle and not self._idle[-1].alive():
+                self._idle.pop()
+            worker = self._idle.pop() if self._idle else self._spawn()
+            # Recycle the least recently used workers that are not mid-call; when all are busy the
+            # pool runs over PY_WORKER_MAX until one of them is released
+            while len(self._sessions) >= self.max_workers:
+                victim = next((k for k, w in self._sessions.items() if w.users == 0), None)
+                if victim is None:
+                    break
+                evicted.append(self._sessions.pop(victim))
+            worker.users += 1
+            self._sessions[sid] = worker
+        for w in evicted:
+            w.kill()
+        return worker
+
+    def _drop(self, sid, worker):
+        with self._lock:
+            if self._sessions.get(sid) is worker:
+                del self._sessions[sid]
+        worker.kill()
+
+    def _spawn(self):
+        return _Worker(self._ctx, self.memory_bytes, self.max_df_bytes)
+
+    def _replenish(self):
+        with self._lock:
+            self._idle = [w for w in self._idle if w.alive()]
+            missing = self.warm_count - len(self._idle)
+            new = [self._spawn() for _ in range(max(0, missing))]
+            self._idle.extend(new)
+        for w in new:
+            try:
+                # A session may already have taken this worker; the lock serializes the handshake
+                with w.lock:
+                    w.wait_ready(60)
+            except InterpreterError:
+                pass
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            idle = [sid for sid, w in self._sessions.items() if now - w.last_used > self.idle_ttl and w.users == 0]
+            workers = [self._sessions.pop(sid) for sid in idle]
+        for w in workers:
+            w.kill()
+
+    def _ensure_janitor(self):
+        with self._lock:
+            if self._janitor is not None and self._janitor.is_alive():
+                return
+            self._janitor = threading.Thread(target=self._janitor_loop, name="py-interpreter-janitor", daemon=True)
+            self._janitor.start()
+
+    def _janitor_loop(self):
+        while True:
+            time.sleep(60)
+            try:
+                self.sweep()
+            except Exception:
+                pass
+
+
+def upload_tables(filenames):
+    """Map the session's CSV/Excel uploads to their file paths for preloading. Nothing is parsed
+    here: the worker does that within its limits (see _preload_tables). Oversized uploads are
+    left out.
+    """
+    from src.core.uploads import upload_path
+
+    max_bytes = int(os.environ.get("PY_PRELOAD_MAX_BYTES", 512 * 1024 * 1024))
+    tables = {}
+    for name in filenames:
+        if os.path.splitext(name)[1].lower() not in (".csv", ".xlsx", ".xls"):
+            continue
+        path = upload_path(name)
+        try:
+            if os.path.getsize(path) > max_bytes:
+                continue
+        except OSError:
+            continue
+        tables[name] = os.path.abspath(path)
+    return tables
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def get_interpreter_pool() -> InterpreterPool:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = InterpreterPool.from_env()
+    return _POOL
@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+import unicodedata
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+
+from src.core.cachedir import private_cache_dir
+from src.core.diskcache import SQLiteTTLCache
+
+# Environment variables (all optional):
+# - LLM_CACHE_TTL_SECONDS: how long a model response is reused (default 24 h, 0 disables the cache)
+# - LLM_CACHE_PATH: SQLite file for the cache (default ~/.cache/bunnytools/sqlite/cache.sqlite3, shared with search)
+# - LLM_CACHE_MAX_ENTRIES: rows kept before the oldest are dropped (default 2000)
+# - LLM_CACHE_TOOL_CALLS: "on" (default) also caches tool-call planning steps; "off" caches final answers only
+
+# Message fields that differ between otherwise identical requests and never reach the provider
+_VOLATILE = ("id", "response_metadata", "usage_metadata", "additional_kwargs")
+
+
+def _enabled_for_tool_calls() -> bool:
+    return os.environ.get("LLM_CACHE_TOOL_CALLS", "on").lower() not in ("off", "0", "false", "no")
+
+def _normalize_text(text):
+    if not isinstance(text, str):
+        return text
+    return unicodedata.normalize("NFKC", text).strip()
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical form of a serialized message list.
+
+    Tool call ids are assigned by the provider and differ on every run, so they are renumbered
+    in order of appearance; message ids and metadata are dropped and text is NFKC-normalized.
+    """
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    call_ids = {}
+
+    def call_id(raw):
+        return call_ids.setdefault(raw, f"call_{len(call_ids)}")
+
+    canonical = []
+    for m in messages if isinstance(messages, list) else [messages]:
+        kwargs = dict(m.get("kwargs", {})) if isinstance(m, dict) else {}
+        for field in _VOLATILE:
+            kwargs.pop(field, None)
+        kwargs["content"] = _normalize_text(kwargs.get("content"))
+        if kwargs.get("tool_calls"):
+            kwargs["tool_calls"] = [
+                {"name": c.get("name"), "args": c.get("args"), "id": call_id(c.get("id"))}
+                for c in kwargs["tool_calls"]
+            ]
+        kwargs.pop("invalid_tool_calls", None)
+        if "tool_call_id" in kwargs:
+            kwargs["tool_call_id"] = call_id(kwargs["tool_call_id"])
+        canonical.append([m.get("id", [None])[-1] if isinstance(m, dict) else None, kwargs])
+    return json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+
+def _dump_generations(generations):
+    return [
+        {"message": message_to_dict(g.message.model_copy(update={"id": None})), "info": g.generation_info}
+        for g in generations
+    ]
+
+def _load_generations(data):
+    messages = messages_from_dict([d["message"] for d in data])
+    return [ChatGeneration(message=m, generation_info=d["info"]) for m, d in zip(messages, data)]
+
+def _fresh(generations):
+    # A replayed answer must not carry the original message or tool call ids: the graph would
+    # treat a repeated message id as an update of the earlier message
+    out = []
+    for gen in generations:
+        msg = gen.message
+        update = {"id": None}
+        if getattr(msg, "tool_calls", None):
+            update["tool_calls"] = [{**c, "id": f"call_{uuid.uuid4().hex[:24]}"} for c in msg.tool_calls]
+            update["additional_kwargs"] = {k: v for k, v in msg.additional_kwargs.items() if k != "tool_calls"}
+        out.append(gen.model_copy(update={"message": msg.model_copy(update=update)}))
+    return out
+
+
+class LLMResponseCache(BaseCache):
+    """Exact-match cache for deterministic (temperature 0) chat model calls.
+
+    The key is sha256 over the namespace (provider and endpoint), the model's llm_string, which
+    already covers model parameters and the bound tool schemas, and the normalized messages.
+    Entries live in SQLite with TTL and entry-count eviction. A miss is timed until the
+    provider's answer is stored, so hits can report the latency they saved.
+    """
+
+    def __init__(self, store: SQLiteTTLCache, namespace: str = ""):
+        self.store = store
+        self.namespace = namespace
+        self._pending = {}  # key -> time of the miss
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stored": 0, "skipped": 0, "saved_seconds": 0.0, "lookup_seconds": 0.0}
+
+    def _key(self, prompt, llm_string):
+        h = hashlib.sha256()
+        for part in (self.namespace, llm_string, normalize_prompt(prompt)):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        start = time.monotonic()
+        key = self._key(prompt, llm_string)
+        raw = self.store.get(key)
+        generations = None
+        if raw is not None:
+            try:
+                entry = json.loads(raw)
+                generations = _fresh(_load_generations(entry["generations"]))
+            except Exception:
+                generations = None
+        with self._lock:
+            self._stats["lookup_seconds"] += time.monotonic() - start
+            if generations is None:
+                self._stats["misses"] += 1
+                self._pending[key] = start
+                # Misses whose call failed never reach update(); keep the map small
+                if len(self._pending) > 1024:
+                    self._pending.pop(next(iter(self._pending)))
+            else:
+                self._stats["hits"] += 1
+                self._stats["saved_seconds"] += entry.get("latency", 0.0)
+        return generations
+
+    def update(self, prompt, llm_string, return_val):
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            started = self._pending.pop(key, None)
+        if not self._cacheable(return_val):
+            with self._lock:
+                self._stats["skipped"] += 1
+            return
+        latency = time.monotonic() - started if started is not None else 0.0
+        self.store.set(key, json.dumps({"generations": _dump_generations(return_val), "latency": latency}))
+        with self._lock:
+            self._stats["stored"] += 1
+
+    def _cacheable(self, generations) -> bool:
+        for gen in generations:
+            msg = getattr(gen, "message", None)
+            if msg is None:
+                return False
+            finish = (gen.generation_info or {}).get("finish_reason") or msg.response_metadata.get("finish_reason")
+            if finish not in (None, "stop", "tool_calls"):
+                # Truncated or filtered answers are not worth replaying
+                return False
+            if msg.tool_calls and not _enabled_for_tool_calls():
+                return False
+            if not msg.content and not msg.tool_calls:
+                return False
+        return bool(generations)
+
+    def clear(self, **kwargs):
+        self.store.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return _with_rates(dict(self._stats))
+
+
+def _with_rates(s):
+    n = s["hits"] + s["misses"]
+    s["hit_rate"] = s["hits"] / n if n else 0.0
+    s["avg_lookup_ms"] = 1000 * s["lookup_seconds"] / n if n else 0.0
+    return s
+
+
+_STORE = None
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+def _store():
+    global _STORE
+    if _STORE is None:
+        _STORE = SQLiteTTLCache(
+            path=os.environ.get("LLM_CACHE_PATH") or os.path.join(private_cache_dir("sqlite"), "cache.sqlite3"),
+            ttl=float(os.environ.get("LLM_CACHE_TTL_SECONDS", 24 * 3600)),
+            max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 2000)),
+            table="llm_responses",
+        )
+    return _STORE
+
+def get_llm_cache(namespace: str):
+    """Cache for one provider endpoint, or None when disabled (LLM_CACHE_TTL_SECONDS=0)."""
+    with _CACHES_LOCK:
+        if _store().ttl <= 0:
+            return None
+        cache = _CACHES.get(namespace)
+        if cache is None:
+            cache = _CACHES[namespace] = LLMResponseCache(_store(), namespace)
+        return cache
+
+def llm_cache_stats() -> dict:
+    """Counters summed over all provider caches of this process."""
+    with _CACHES_LOCK:
+        caches = list(_CACHES.values())
+    total = {"hits": 0, "misses": 0, "stored": 0, "skipped": 0, "saved_seconds": 0.0, "lookup_seconds": 0.0}
+    for cache in caches:
+        for k, v in cache.stats().items():
+            if k in total:
+                total[k] += v
+    return _with_rates(total)
@@ -0,0 +1,289 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, List
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# Environment variables (all optional):
+# - LLM_ROUTING: "on" (default) routes across all configured providers; "off" uses only the first
+# - LLM_PROVIDERS: comma-separated provider order, default all configured (deepseek, zhipu)
+# - LLM_REQUEST_TIMEOUT: per-request timeout in seconds before failing over (default 60)
+# - LLM_HEDGE: "on" starts the next provider when the first has not answered by its p95 (default "off")
+# - LLM_HEDGE_MIN_DELAY: lower bound for that deadline in seconds (default 2)
+# - LLM_COOLDOWN_SECONDS: how long a provider is skipped after 3 failures in a row (default 30)
+# - LLM_MAX_CONNECTIONS: keep-alive pool size per provider (default 20)
+
+
+def request_timeout():
+    return float(os.environ.get("LLM_REQUEST_TIMEOUT", 60))
+
+def _hedge_enabled():
+    return os.environ.get("LLM_HEDGE", "off").lower() in ("on", "1", "true", "yes")
+
+def _cooldown():
+    return float(os.environ.get("LLM_COOLDOWN_SECONDS", 30))
+
+def should_fail_over(exc) -> bool:
+    """Timeouts, connection errors, 429 and 5xx move on to the next provider; a request the
+    provider rejected as malformed (400/422) would be rejected by the others too."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500 or status in (401, 403, 404, 408)
+    return True
+
+
+class LatencyStats:
+    """Rolling latency window and error rate of one provider.
+
+    Latency is time to the first streamed chunk, or to the full response for non-streaming
+    calls: the part a user waits through before anything appears.
+    """
+
+    PRIOR_LATENCY = 2.0
+    MIN_SAMPLES = 5
+
+    def __init__(self, window: int = 100):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True = success
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.last_error = ""
+
+    def percentile(self, q: float):
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return None
+        data = sorted(self.latencies)
+        return data[min(len(data) - 1, int(q * len(data)))]
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def score(self) -> float:
+        if not self.outcomes:
+            # Untried providers go first once, so every endpoint gets measured
+            return 0.0
+        p50 = self.percentile(0.5)
+        if p50 is None:
+            p50 = sum(self.latencies) / len(self.latencies) if self.latencies else self.PRIOR_LATENCY
+        return p50 * (1 + 4 * self.error_rate)
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "error_rate": self.error_rate,
+            "cooling_down": self.open_until > time.monotonic(),
+            "last_error": self.last_error,
+        }
+
+
+class Provider:
+    """One configured endpoint: its chat model, long-lived HTTP clients and stats."""
+
+    def __init__(self, cfg: dict, make_model):
+        self.name = cfg["provider"]
+        self.cfg = cfg
+        limits = httpx.Limits(
+            max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", 20)),
+            max_keepalive_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", 20)),
+            keepalive_expiry=120,
+        )
+        self.http_client = httpx.Client(limits=limits, timeout=request_timeout())
+        self.http_async_client = httpx.AsyncClient(limits=limits, timeout=request_timeout())
+        self.model = make_model(cfg, self.http_client, self.http_async_client)
+        self.stats = LatencyStats()
+
+
+class ProviderPool:
+    """Ranks providers by health and runs calls with failover and optional hedging."""
+
+    def __init__(self, providers: List[Provider]):
+        self.providers = providers
+        self._lock = threading.Lock()
+
+    def ranked(self) -> List[Provider]:
+        """Healthy providers by latency score (configured order breaks ties); providers in
+        cooldown are kept at the end as a last resort."""
+        now = time.monotonic()
+        with self._lock:
+            keyed = [((p.stats.open_until > now), p.stats.score(), i, p) for i, p in enumerate(self.providers)]
+        return [p for *_, p in sorted(keyed, key=lambda k: k[:3])]
+
+    def record(self, provider: Provider, latency: float, ok: bool, error: str = ""):
+        with self._lock:
+            s = provider.stats
+            s.calls += 1
+            s.outcomes.append(ok)
+            if ok:
+                s.latencies.append(latency)
+                s.consecutive_failures = 0
+                s.open_until = 0.0
+            else:
+                s.failures += 1
+                s.consecutive_failures += 1
+                s.last_error = error
+                if s.consecutive_failures >= 3:
+                    s.open_until = time.monotonic() + _cooldown()
+
+    def record_cancelled(self, provider: Provider, elapsed: float):
+        # Lost a hedge race: its latency was at least `elapsed`
+        with self._lock:
+            provider.stats.latencies.append(elapsed)
+
+    def hedge_delay(self, provider: Provider) -> float:
+        p95 = provider.stats.percentile(0.95)
+        floor = float(os.environ.get("LLM_HEDGE_MIN_DELAY", 2))
+        return max(floor, p95 if p95 is not None else request_timeout() / 4)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {p.name: p.stats.snapshot() for p in self.providers}
+
+    # -- blocking: failover only ---------------------------------------------------------
+
+    def call(self, fn):
+        """fn(provider) -> result. Tries providers in rank order until one succeeds."""
+        last = None
+        for p in self.ranked():
+            start = time.monotonic()
+            try:
+                result = fn(p)
+            except Exception as e:
+                self.record(p, time.monotonic() - start, False, _describe(e))
+                if not should_fail_over(e):
+                    raise
+                last = e
+                continue
+            self.record(p, time.monotonic() - start, True)
+            return result
+        raise last
+
+    # -- async: failover plus hedging ----------------------------------------------------
+
+    async def acall(self, fn, on_loser=None):
+        """await fn(provider) -> result. A failure starts the next provider; with LLM_HEDGE=on
+        the next one is also started when the current one passes its p95 deadline. The first
+        success wins; `on_loser(result)` releases results that finished too late."""
+        order = self.ranked()
+        hedge = _hedge_enabled() and len(order) > 1
+        pending = {}  # task -> (provider, started)
+        nxt = 0
+        last = None
+
+        def launch():
+            nonlocal nxt
+            p = order[nxt]
+            nxt += 1
+            pending[asyncio.ensure_future(asyncio.wait_for(fn(p), request_timeout()))] = (p, time.monotonic())
+            return p
+
+        current = launch()
+        try:
+            while pending:
+                timeout = self.hedge_delay(current) if hedge and nxt < len(order) else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    current = launch()
+                    continue
+                winner = None
+                for task in done:
+                    p, started = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        self.record(p, time.monotonic() - started, False, _describe(e))
+                        if not should_fail_over(e):
+                            raise
+                        last = e
+                        continue
+                    if winner is None:
+                        self.record(p, time.monotonic() - started, True)
+                        winner = (result,)
+                    elif on_loser is not None:
+                        await on_loser(result)
+                if winner is not None:
+                    return winner[0]
+                if not pending and nxt < len(order):
+                    current = launch()
+            raise last
+        finally:
+            now = time.monotonic()
+            for task, (p, started) in pending.items():
+                task.cancel()
+                self.record_cancelled(p, now - started)
+
+
+def _describe(e) -> str:
+    text = str(e)[:200]
+    return f"{type(e).__name__}: {text}" if text else type(e).__name__
+
+
+class RoutedChatModel(BaseChatModel):
+    """Chat model that sends each call to the healthiest provider of a ProviderPool.
+
+    Tool schemas bound with bind_tools are passed through to the chosen provider. A streamed
+    call can only fail over (or be hedged) until its first chunk has arrived.
+    """
+
+    pool: Any
+    model_names: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-chat"
+
+    @property
+    def _identifying_params(self):
+        return {"models": self.model_names, "temperature": 0}
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return self.pool.call(lambda p: p.model._generate(messages, stop=stop, **kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return await self.pool.acall(lambda p: p.model._agenerate(messages, stop=stop, **kwargs))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        def first_chunk(p):
+            it = p.model._stream(messages, stop=stop, **kwargs)
+            for chunk in it:
+                return chunk, it
+            raise RuntimeError(f"{p.name} returned an empty stream")
+
+        chunk, rest = self.pool.call(first_chunk)
+        yield chunk
+        yield from rest
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async def first_chunk(p):
+            it = p.model._astream(messages, stop=stop, **kwargs)
+            try:
+                return await it.__anext__(), it
+            except StopAsyncIteration:
+                raise RuntimeError(f"{p.name} returned an empty stream")
+            except BaseException:
+                await it.aclose()
+                raise
+
+        async def close(result):
+            await result[1].aclose()
+
+        chunk, rest = await self.pool.acall(first_chunk, on_loser=close)
+        yield chunk
+        async for chunk in rest:
+            yield chunk
@@ -0,0 +1,266 @@
+import os
+import time
+import asyncio
+import threading
+
+from src.core.aio import http_client, run_sync
+from src.core.http import http_session
+
+# Environment variables (all optional):
+# - TAVILY_API_KEY / SERPAPI_API_KEY: enable those providers
+# - TAVILY_API_URL / SERPAPI_API_URL: endpoint overrides (e.g. local stub servers in tests)
+# - WEB_SEARCH_PROVIDERS: comma-separated provider list/order, default all configured
+#   (tavily, serpapi, ddg_api, ddg_html, ddg_lite)
+# - WEB_SEARCH_MODE: "hedged" (default) or "sequential"
+# - WEB_SEARCH_HEDGE_DELAY: seconds before the next provider is started alongside a slow one (default 1.5)
+# - WEB_SEARCH_TIMEOUT: per-provider timeout in seconds (default 20)
+
+class NoResults(Exception):
+    pass
+
+def _timeout():
+    return float(os.environ.get("WEB_SEARCH_TIMEOUT", 20))
+
+def _hedge_delay():
+    return float(os.environ.get("WEB_SEARCH_HEDGE_DELAY", 1.5))
+
+def _format_results(results, max_results, url_key, snippet_key):
+    lines = []
+    for r in results[:max_results]:
+        title = r.get("title", "")
+        url = r.get(url_key, "")
+        snippet = r.get(snippet_key, "")
+        lines.append(f"- {title}\n{url}\n{snippet}")
+    if not lines:
+        raise NoResults("empty result set")
+    return "\n\n".join(lines)
+
+def _tavily_request(query, max_results):
+    return {
+        "method": "POST",
+        "url": os.environ.get("TAVILY_API_URL", "https://api.tavily.com/search"),
+        "json": {
+            "api_key": os.environ.get("TAVILY_API_KEY"),
+            "query": query,
+            "search_depth": "advanced",
+            "max_results": max_results,
+        },
+    }
+
+def _serpapi_request(query, max_results):
+    return {
+        "method": "GET",
+        "url": os.environ.get("SERPAPI_API_URL", "https://serpapi.com/search.json"),
+        "params": {"q": query, "engine": "google", "api_key": os.environ.get("SERPAPI_API_KEY")},
+    }
+
+# name -> (build request, results key, url key, snippet key)
+_HTTP_PROVIDERS = {
+    "tavily": (_tavily_request, "results", "url", "content"),
+    "serpapi": (_serpapi_request, "organic_results", "link", "snippet"),
+}
+
+_DDG_WRAPPERS = {}  # (backend, max_results) -> DuckDuckGoSearchAPIWrapper
+_DDG_LOCK = threading.Lock()
+
+def _ddg_wrapper(backend, max_results):
+    with _DDG_LOCK:
+        wrapper = _DDG_WRAPPERS.get((backend, max_results))
+        if wrapper is None:
+            from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
+            wrapper = DuckDuckGoSearchAPIWrapper(max_results=max_results, backend=backend)
+            _DDG_WRAPPERS[(backend, max_results)] = wrapper
+        return wrapper
+
+def _duckduckgo(backend, query, max_results):
+    result = _ddg_wrapper(backend, max_results).run(query)
+    if not result or result.startswith("No good DuckDuckGo Search Result"):
+        raise NoResults("empty result set")
+    return result
+
+def _check_status(status):
+    # raise_for_status() would echo the request URL, which carries the SerpAPI key
+    if status >= 400:
+        raise RuntimeError(f"HTTP {status}")
+
+def run_provider(name, query, max_results):
+    if name.startswith("ddg_"):
+        return _duckduckgo(name[4:], query, max_results)
+    build, results_key, url_key, snippet_key = _HTTP_PROVIDERS[name]
+    resp = http_session().request(**build(query, max_results), timeout=_timeout())
+    _check_status(resp.status_code)
+    return _format_results(resp.json().get(results_key, []), max_results, url_key, snippet_key)
+
+async def arun_provider(name, query, max_results):
+    if name.startswith("ddg_"):
+        # The DuckDuckGo wrapper is blocking only
+        return await asyncio.to_thread(_duckduckgo, name[4:], query, max_results)
+    build, results_key, url_key, snippet_key = _HTTP_PROVIDERS[name]
+    resp = await http_client().request(**build(query, max_results), timeout=_timeout())
+    _check_status(resp.status_code)
+    return _format_results(resp.json().get(results_key, []), max_results, url_key, snippet_key)
+
+def configured_providers():
+    explicit = os.environ.get("WEB_SEARCH_PROVIDERS", "")
+    if explicit.strip():
+        return [p.strip() for p in explicit.split(",") if p.strip()]
+    names = []
+    if os.environ.get("TAVILY_API_KEY"):
+        names.append("tavily")
+    if os.environ.get("SERPAPI_API_KEY"):
+        names.append("serpapi")
+    return names + ["ddg_api", "ddg_html", "ddg_lite"]
+
+
+class ProviderStats:
+    """Per-provider latency and failure EWMAs used to order providers for the next search.
+
+    score = latency EWMA + failure EWMA * timeout, so a provider that keeps failing drifts to the
+    back even if it fails fast. Providers with no samples yet keep their configured order.
+    """
+
+    ALPHA = 0.3
+    PRIOR_LATENCY = 1.0
+
+    def __init__(self):
+        self._data = {}  # name -> {"calls", "failures", "latency", "fail_rate", "last_error"}
+        self._lock = threading.Lock()
+
+    def _entry(self, name):
+        return self._data.setdefault(
+            name, {"calls": 0, "failures": 0, "latency": None, "fail_rate": 0.0, "last_error": ""}
+        )
+
+    def record(self, name, latency, ok, error=""):
+        with self._lock:
+            e = self._entry(name)
+            e["calls"] += 1
+            e["fail_rate"] += self.ALPHA * ((0.0 if ok else 1.0) - e["fail_rate"])
+            if ok:
+                e["latency"] = latency if e["latency"] is None else e["latency"] + self.ALPHA * (latency - e["latency"])
+            else:
+                e["failures"] += 1
+                e["last_error"] = error
+
+    def record_cancelled(self, name, elapsed):
+        # Lost the race: the true latency is at least `elapsed`
+        with self._lock:
+            e = self._entry(name)
+            if e["latency"] is None or elapsed > e["latency"]:
+                e["latency"] = elapsed if e["latency"] is None else e["latency"] + self.ALPHA * (elapsed - e["latency"])
+
+    def ordered(self, names):
+        timeout = _timeout()
+        with self._lock:
+            def score(item):
+                pos, name = item
+                e = self._data.get(name)
+                if e is None:
+                    return (self.PRIOR_LATENCY, pos)
+                latency = self.PRIOR_LATENCY if e["latency"] is None else e["latency"]
+                return (latency + e["fail_rate"] * timeout, pos)
+            return [name for _, name in sorted(enumerate(names), key=score)]
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(e) for name, e in self._data.items()}
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+
+_STATS = ProviderStats()
+
+def provider_stats() -> ProviderStats:
+    return _STATS
+
+def _failure_message(errors):
+    return (
+        f"Search error: no provider returned results ({'; '.join(errors)}). "
+        "Please configure TAVILY_API_KEY or SERPAPI_API_KEY for robust search."
+    )
+
+def search_sequential(query, max_results, names=None):
+    errors = []
+    for name in _STATS.ordered(names or configured_providers()):
+        start = time.monotonic()
+        try:
+            result = run_provider(name, query, max_results)
+        except Exception as e:
+            _STATS.record(name, time.monotonic() - start, False, str(e))
+            errors.append(f"{name}: {str(e)}")
+            continue
+        _STATS.record(name, time.monotonic() - start, True)
+        return result
+    return _failure_message(errors)
+
+async def asearch_hedged(query, max_results, names=None):
+    """Start the best-ranked provider; every hedge delay without a result (or right after a
+    failure) start the next one too. The first non-empty result wins and the rest are cancelled.
+    """
+    names = _STATS.ordered(names or configured_providers())
+    delay = _hedge_delay()
+    pending = {}  # task -> (name, started)
+    errors = []
+    nxt = 0
+
+    async def attempt(name):
+        return await asyncio.wait_for(arun_provider(name, query, max_results), _timeout())
+
+    def launch():
+        nonlocal nxt
+        name = names[nxt]
+        nxt += 1
+        pending[asyncio.ensure_future(attempt(name))] = (name, time.monotonic())
+
+    if not names:
+        return _failure_message(["no providers configured"])
+    launch()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(
+                pending, timeout=delay if nxt < len(names) else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                launch()
+                continue
+            for task in done:
+                name, started = pending.pop(task)
+                latency = time.monotonic() - started
+                try:
+                    result = task.result()
+                except Exception as e:
+                    _STATS.record(name, latency, False, str(e) or type(e).__name__)
+                    errors.append(f"{name}: {str(e) or type(e).__name__}")
+                    continue
+                _STATS.record(name, latency, True)
+                return result
+            if nxt < len(names):
+                launch()
+        return _failure_message(errors)
+    finally:
+        now = time.monotonic()
+        for task, (name, started) in pending.items():
+            task.cancel()
+            _STATS.record_cancelled(name, now - started)
+
+def _on_loop_thread():
+    try:
+        return asyncio.get_running_loop() is not None
+    except RuntimeError:
+        return False
+
+def _mode():
+    return os.environ.get("WEB_SEARCH_MODE", "hedged").lower()
+
+def search(query, max_results):
+    """Blocking entry point; hedged searches run on the shared event loop."""
+    if _mode() == "hedged" and not _on_loop_thread():
+        return run_sync(asearch_hedged(query, max_results))
+    return search_sequential(query, max_results)
+
+async def asearch(query, max_results):
+    if _mode() == "hedged":
+        return await asearch_hedged(query, max_results)
+    return await asyncio.to_thread(search_sequential, query, max_results)
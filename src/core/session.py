@@ -0,0 +1,27 @@
+import contextvars
+from contextlib import contextmanager
+
+# The chat session a graph run belongs to. Streamlit serves every browser session from the same
+# process, so this is a context variable set around each run instead of a process-wide env var;
+# tasks on the shared event loop and tool executor threads inherit it (see src/core/aio.py).
+_SESSION_ID = contextvars.ContextVar("session_id", default="")
+_SESSION_UPLOADS = contextvars.ContextVar("session_uploads", default=())
+
+def current_session_id() -> str:
+    """Return the id of the chat session the tools are currently running for."""
+    return _SESSION_ID.get() or "default"
+
+def current_session_uploads() -> list:
+    """Filenames the current session has uploaded; tools only operate on these."""
+    return list(_SESSION_UPLOADS.get())
+
+@contextmanager
+def session_scope(session_id: str, uploads=()):
+    """Run the enclosed code (e.g. one agent run) on behalf of one chat session."""
+    id_token = _SESSION_ID.set(session_id)
+    uploads_token = _SESSION_UPLOADS.set(tuple(uploads or ()))
+    try:
+        yield
+    finally:
+        _SESSION_UPLOADS.reset(uploads_token)
+        _SESSION_ID.reset(id_token)
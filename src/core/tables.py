@@ -0,0 +1,167 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from src.core.cachedir import private_cache_dir, touch, trim_dir
+
+# Environment variables (all optional):
+# - TABLE_CACHE_MAX_BYTES: in-memory budget for parsed DataFrames (default 512 MB)
+# - TABLE_CACHE_DIR: where parsed tables are persisted as Parquet/Arrow sidecars (default ~/.cache/bunnytools/tables)
+# - TABLE_CACHE_DISK_MAX_BYTES: size of that directory before the least recently used files go (default 2 GB)
+
+_DIGESTS = {}  # (path, size, mtime_ns) -> sha256 hex
+_DIGEST_LOCK = threading.Lock()
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's content, memoized on (path, size, mtime) so unchanged files are hashed once."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _DIGEST_LOCK:
+        digest = _DIGESTS.get(key)
+    if digest:
+        return digest
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _DIGEST_LOCK:
+        _DIGESTS[key] = digest
+    return digest
+
+
+def parse_table(path: str):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xls"):
+        return pd.read_excel(path)
+    try:
+        return pd.read_csv(path)
+    except UnicodeDecodeError:
+        return pd.read_csv(path, encoding="gbk")
+
+
+class TableCache:
+    """Content-hash keyed cache of parsed DataFrames.
+
+    Hot tables live in an in-memory LRU bounded by bytes; every parsed table is also written
+    to a Parquet sidecar so a re-parse of the same upload after eviction or restart only costs
+    a sidecar read. Tables Parquet cannot represent (mixed-type object columns) are only kept in
+    memory. The sidecar directory is private to the user and trimmed to disk_max_bytes.
+    """
+
+    def __init__(self, max_bytes: int, cache_dir: str, disk_max_bytes: int = 2 * 1024 ** 3):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._mem = OrderedDict()  # digest -> (df, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_bytes=int(os.environ.get("TABLE_CACHE_MAX_BYTES", 512 * 1024 * 1024)),
+            cache_dir=private_cache_dir("tables", "TABLE_CACHE_DIR"),
+            disk_max_bytes=int(os.environ.get("TABLE_CACHE_DISK_MAX_BYTES", 2 * 1024 ** 3)),
+        )
+
+    def load(self, path: str, parser):
+        """Return the DataFrame for path, calling parser(path) only on a full cache miss.
+        The result is a shallow copy, so tools may add or replace columns without touching the cache.
+        """
+        digest = file_digest(path)
+        with self._lock:
+            entry = self._mem.get(digest)
+            if entry is not None:
+                self._mem.move_to_end(digest)
+                return entry[0].copy(deep=False)
+        df = self._read_sidecar(digest)
+        if df is None:
+            df = parser(path)
+            self._write_sidecar(digest, df)
+        self._remember(digest, df)
+        return df.copy(deep=False)
+
+    def arrow_path(self, path: str, parser):
+        """Path of an uncompressed Arrow IPC file holding the parsed table, built once per content.
+        Readers memory-map it, so every process shares the same page-cache pages without parsing
+        or copying. Returns None when the table cannot be represented in Arrow.
+        """
+        digest = file_digest(path)
+        out = os.path.join(self.cache_dir, digest + ".arrow")
+        if os.path.exists(out):
+            touch(out)
+            return out
+        # Not kept in the in-memory LRU: the caller maps the Arrow file instead
+        df = self._read_sidecar(digest)
+        if df is None:
+            df = parser(path)
+            self._write_sidecar(digest, df)
+        try:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{out}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with pa.OSFile(tmp, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp, out)
+            trim_dir(self.cache_dir, self.disk_max_bytes)
+            return out
+        except Exception:
+            return None
+
+    def _remember(self, digest, df):
+        nbytes = int(df.memory_usage(index=True, deep=False).sum())
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if digest in self._mem:
+                return
+            self._mem[digest] = (df, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._mem:
+                _, (_, size) = self._mem.popitem(last=False)
+                self._bytes -= size
+
+    def _sidecar_path(self, digest):
+        return os.path.join(self.cache_dir, digest + ".parquet")
+
+    def _read_sidecar(self, digest):
+        path = self._sidecar_path(digest)
+        try:
+            if os.path.exists(path):
+                df = pd.read_parquet(path)
+                touch(path)
+                return df
+        except Exception:
+            pass
+        return None
+
+    def _write_sidecar(self, digest, df):
+        path = self._sidecar_path(digest)
+        # Write to a temp name and rename so concurrent readers never see a partial file.
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            df.to_parquet(tmp)
+            os.replace(tmp, path)
+        except Exception:
+            # No pyarrow/fastparquet, or mixed-type object columns Parquet cannot represent
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        trim_dir(self.cache_dir, self.disk_max_bytes)
+
+
+_CACHE = TableCache.from_env()
+
+def load_table_cached(path: str, parser):
+    return _CACHE.load(path, parser)
+
+def table_arrow_path(path: str, parser=parse_table):
+    return _CACHE.arrow_path(path, parser)
@@ -0,0 +1,171 @@
+import os
+import mmap
+import threading
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+# A checkpoint (byte offset) is kept for every _STRIDE-th line, so the index for a file with
+# 20M lines is ~160 KB; reaching any line costs at most _STRIDE newline searches from a checkpoint.
+_STRIDE = 1024
+_SCAN_CHUNK = 16 * 1024 * 1024
+_MAX_INDEXES = 32
+
+
+class LineIndex:
+    """Sparse, lazily extended line-offset index over a memory-mapped file.
+
+    The file is only scanned as far as the highest line requested so far; a request for lines
+    near the start of a 2 GB log never touches the rest of it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self._checkpoints = array("Q", [0])  # byte offset of line k * _STRIDE (0-based)
+        self._scanned = 0  # bytes scanned for newlines so far
+        self._lines = 0  # newlines seen in the scanned prefix
+        self._lock = threading.Lock()
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+    @property
+    def complete(self) -> bool:
+        return self._scanned >= self.size
+
+    def total_lines(self):
+        """Line count once the whole file has been indexed, else None."""
+        if not self.complete:
+            return None
+        ends_open = self.size and self._mm[self.size - 1] != 0x0A
+        return self._lines + (1 if ends_open else 0)
+
+    def read(self, offset: int, length: int) -> bytes:
+        if self._mm is None or offset >= self.size:
+            return b""
+        return self._mm[offset:min(self.size, offset + length)]
+
+    def _extend(self, line: int):
+        # Scan forward chunk by chunk until `line` has a known checkpoint or the file ends
+        while not self.complete and self._lines < line:
+            end = min(self.size, self._scanned + _SCAN_CHUNK)
+            chunk = np.frombuffer(self._mm, dtype=np.uint8, count=end - self._scanned, offset=self._scanned)
+            newlines = np.flatnonzero(chunk == 0x0A)
+            del chunk
+            first = self._lines
+            # Line (first + i + 1) starts right after the i-th newline of this chunk
+            starts = self._scanned + newlines + 1
+            numbers = np.arange(first + 1, first + 1 + len(newlines))
+            for pos in starts[numbers % _STRIDE == 0]:
+                self._checkpoints.append(int(pos))
+            self._lines += len(newlines)
+            self._scanned = end
+
+    def line_offset(self, line: int):
+        """Byte offset where 0-based `line` starts, or None past the end of the file."""
+        if self._mm is None:
+            return 0 if line == 0 else None
+        with self._lock:
+            self._extend(line)
+            k = line // _STRIDE
+            if k >= len(self._checkpoints):
+                return None
+            pos = self._checkpoints[k]
+            for _ in range(line - k * _STRIDE):
+                nl = self._mm.find(b"\n", pos)
+                if nl < 0:
+                    return None
+                pos = nl + 1
+            return pos if pos < self.size or line == 0 else None
+
+    def read_lines(self, start: int, end: int, max_bytes: int):
+        """Bytes of 0-based lines [start, end), cut at max_bytes. Returns (data, lines_returned)."""
+        begin = self.line_offset(start)
+        if begin is None:
+            return b"", 0
+        stop = self.line_offset(end)
+        stop = self.size if stop is None else stop
+        data = self.read(begin, min(stop - begin, max_bytes))
+        return data, data.count(b"\n") + (0 if data.endswith(b"\n") or not data else 1)
+
+
+_INDEXES = OrderedDict()  # (path, size, mtime_ns) -> LineIndex
+_INDEX_LOCK = threading.Lock()
+
+def line_index(path: str) -> LineIndex:
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _INDEX_LOCK:
+        idx = _INDEXES.get(key)
+        if idx is not None:
+            _INDEXES.move_to_end(key)
+            return idx
+        idx = LineIndex(path)
+        _INDEXES[key] = idx
+        while len(_INDEXES) > _MAX_INDEXES:
+            _, old = _INDEXES.popitem(last=False)
+            old.close()
+        return idx
+
+def trim_utf8(data: bytes, at_start: bool = True) -> bytes:
+    """Drop multi-byte characters cut by the range boundaries (continuation bytes at the front
+    when the range does not start the file, an incomplete sequence at the end)."""
+    if not at_start:
+        skip = 0
+        while skip < min(3, len(data)) and (data[skip] & 0xC0) == 0x80:
+            skip += 1
+        data = data[skip:]
+    for back in range(1, min(4, len(data)) + 1):
+        b = data[-back]
+        if (b & 0xC0) == 0x80:
+            continue
+        need = 1 if b < 0x80 else 2 if b < 0xE0 else 3 if b < 0xF0 else 4
+        if back < need:
+            data = data[:-back]
+        break
+    return data
+
+def utf8_continuation(before: bytes, data: bytes) -> int:
+    """Leading bytes of data that complete a UTF-8 character begun in `before` (the bytes just
+    ahead of the read offset). 0 when the offset is on a character boundary or the bytes are not
+    UTF-8, so non-UTF-8 content at a page start is never skipped."""
+    for back in range(1, min(3, len(before)) + 1):
+        b = before[-back]
+        if (b & 0xC0) == 0x80:
+            continue
+        need = 2 if 0xC2 <= b < 0xE0 else 3 if 0xE0 <= b < 0xF0 else 4 if 0xF0 <= b < 0xF5 else 0
+        rest = need - back
+        if rest > 0 and len(data) >= rest and all((x & 0xC0) == 0x80 for x in data[:rest]):
+            return rest
+        return 0
+    return 0
+
+def decode_utf8(data: bytes, at_start: bool = True) -> str:
+    return trim_utf8(data, at_start).decode("utf-8", errors="replace")
+
+def decode_prefix(data: bytes, max_chars: int, at_end: bool = False):
+    """Decode at most max_chars characters from the start of data. Returns (text, raw bytes
+    consumed), counted on the input itself: invalid bytes decode to U+FFFD (3 bytes when
+    re-encoded), so re-encoding the text would overshoot the next page's offset on GBK or
+    Latin-1 files. An incomplete character at the end is left for the next read unless data
+    reaches the end of the file."""
+    cut = data if at_end else trim_utf8(data)
+    text = cut.decode("utf-8", errors="replace")
+    if len(text) <= max_chars:
+        return text, len(cut)
+    # Longest prefix whose decoded text fits
+    lo, hi = 0, len(cut)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if len(trim_utf8(cut[:mid]).decode("utf-8", errors="replace")) <= max_chars:
+            lo = mid
+        else:
+            hi = mid - 1
+    part = trim_utf8(cut[:lo])
+    return part.decode("utf-8", errors="replace"), len(part)
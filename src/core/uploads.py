@@ -0,0 +1,177 @@
+import os
+import time
+import shutil
+import hashlib
+import threading
+
+from src.core.session import current_session_id
+
+# Environment variables (all optional):
+# - UPLOAD_DIR: root directory for uploads (default "uploads")
+# - UPLOAD_TTL_SECONDS: how long an idle session keeps its uploads (default 2 h)
+# - UPLOAD_JANITOR_INTERVAL: seconds between janitor sweeps (default 60)
+
+class UploadStore:
+    """Session-scoped, content-addressed store for user uploads.
+
+    File bodies live once under <root>/.store/<sha256><ext>, shared by every session that
+    uploaded the same content with the same extension (tools pick readers by extension). Each
+    session maps its filenames to a blob; a blob's reference count is the number of (session,
+    filename) entries pointing at it. Sessions idle for longer than the TTL are released by a
+    background janitor, which deletes blobs no longer referenced.
+    Tools can therefore read the same upload any number of times without it being re-written.
+
+    Code run by python_interpreter opens uploads as uploads/<filename> relative to the session's
+    own working directory (<root>/.sessions/<session id>), which holds links to that session's
+    blobs only, so sessions uploading the same filename never see each other's files.
+    """
+
+    def __init__(self, root: str, ttl: float, interval: float):
+        self.root = root
+        self.blob_dir = os.path.join(root, ".store")
+        self.session_root = os.path.join(root, ".sessions")
+        self.ttl = ttl
+        self.interval = interval
+        self._sessions = {}  # session_id -> {filename: blob_path}
+        self._last_access = {}  # session_id -> timestamp
+        self._refs = {}  # blob_path -> refcount
+        self._lock = threading.RLock()
+        self._janitor = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            root=os.environ.get("UPLOAD_DIR", "uploads"),
+            ttl=float(os.environ.get("UPLOAD_TTL_SECONDS", 2 * 3600)),
+            interval=float(os.environ.get("UPLOAD_JANITOR_INTERVAL", 60)),
+        )
+
+    def put(self, filename: str, data: bytes, session_id: str = None) -> str:
+        """Register an upload for a session; the body is only written if the content is new."""
+        sid = session_id or current_session_id()
+        digest = hashlib.sha256(data).hexdigest()
+        ext = os.path.splitext(filename)[1].lower()
+        blob = os.path.join(self.blob_dir, digest + ext)
+        with self._lock:
+            if not os.path.exists(blob):
+                os.makedirs(self.blob_dir, exist_ok=True)
+                tmp = blob + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, blob)
+            files = self._sessions.setdefault(sid, {})
+            old = files.get(filename)
+            if old != blob:
+                files[filename] = blob
+                self._refs[blob] = self._refs.get(blob, 0) + 1
+                if old:
+                    self._unref(old)
+            self._last_access[sid] = time.time()
+            self._link_session_path(sid, filename, blob)
+        self._ensure_janitor()
+        return digest
+
+    def has(self, filename: str, session_id: str = None) -> bool:
+        """Whether the session still holds filename (the janitor releases idle sessions)."""
+        sid = session_id or current_session_id()
+        with self._lock:
+            blob = self._sessions.get(sid, {}).get(filename)
+            return blob is not None and os.path.exists(blob)
+
+    def sync(self, filenames, session_id: str = None):
+        """Release a session's uploads that are no longer present in the uploader widget."""
+        sid = session_id or current_session_id()
+        keep = set(filenames)
+        with self._lock:
+            files = self._sessions.get(sid, {})
+            for name in [n for n in files if n not in keep]:
+                self._unref(files.pop(name))
+                self._remove(os.path.join(self.session_dir(sid), "uploads", name))
+
+    def path(self, filename: str, session_id: str = None) -> str:
+        """Resolve a session filename to its on-disk path and mark the session as active.
+        Unknown names fall back to <root>/<filename> (e.g. files placed there by hand).
+        """
+        sid = session_id or current_session_id()
+        with self._lock:
+            blob = self._sessions.get(sid, {}).get(filename)
+            if blob:
+                self._last_access[sid] = time.time()
+                return blob
+        return os.path.join(self.root, filename)
+
+    def session_dir(self, session_id: str = None) -> str:
+        """Working directory for the session's python_interpreter code (see class docstring)."""
+        return os.path.abspath(os.path.join(self.session_root, session_id or current_session_id()))
+
+    def release_session(self, session_id: str):
+        with self._lock:
+            for blob in self._sessions.pop(session_id, {}).values():
+                self._unref(blob)
+            self._last_access.pop(session_id, None)
+            shutil.rmtree(self.session_dir(session_id), ignore_errors=True)
+
+    def sweep(self):
+        """Release sessions idle for longer than the TTL; unreferenced blobs are deleted."""
+        now = time.time()
+        with self._lock:
+            idle = [sid for sid, ts in self._last_access.items() if now - ts > self.ttl]
+            for sid in idle:
+                self.release_session(sid)
+
+    def _unref(self, blob):
+        count = self._refs.get(blob, 0)
+        if count > 1:
+            self._refs[blob] = count - 1
+            return
+        self._refs.pop(blob, None)
+        self._remove(blob)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _link_session_path(self, sid, filename, blob):
+        link_dir = os.path.join(self.session_dir(sid), "uploads")
+        link = os.path.join(link_dir, filename)
+        try:
+            os.makedirs(link_dir, exist_ok=True)
+            if os.path.exists(link) and os.path.samefile(link, blob):
+                return
+            self._remove(link)
+            os.link(blob, link)
+        except OSError:
+            try:
+                shutil.copyfile(blob, link)
+            except OSError:
+                pass
+
+    def _ensure_janitor(self):
+        if self._janitor is not None and self._janitor.is_alive():
+            return
+        with self._lock:
+            if self._janitor is not None and self._janitor.is_alive():
+                return
+            self._janitor = threading.Thread(target=self._janitor_loop, name="upload-janitor", daemon=True)
+            self._janitor.start()
+
+    def _janitor_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception:
+                pass
+
+
+_STORE = UploadStore.from_env()
+
+def get_upload_store() -> UploadStore:
+    return _STORE
+
+def upload_path(filename: str) -> str:
+    """Path of a current-session upload; safe to call repeatedly, the file is never consumed."""
+    return _STORE.path(filename)
@@ -1,5 +1,5 @@
 from .general import web_search, calculator, current_time
-from .files import python_interpreter, list_uploaded_files, read_file_from_upload
+from .files import python_interpreter, list_uploaded_files, read_file_from_upload, search_in_upload
 from .dev import json_formatter, hash_generator, encoding_tool, timestamp_converter, qrcode_generator, sql_formatter
 from .office import (
     excel_to_csv_from_upload,
@@ -36,28 +36,36 @@ from .image import (
     image_add_image_watermark_upload,
     image_remove_watermark_upload,
     image_auto_remove_watermark_upload,
+    image_pipeline_upload,
+    image_batch_pipeline_upload,
 )
 
-def get_tools():
-    return [
-        web_search, 
-        calculator, 
-        current_time, 
-        python_interpreter, 
+# Tool groups the agent can be built with; "core" is always included.
+TOOL_GROUPS = {
+    "core": [
+        calculator,
+        current_time,
+        python_interpreter,
         list_uploaded_files,
+    ],
+    "search": [
+        web_search,
+    ],
+    "text": [
         read_file_from_upload,
+        search_in_upload,
+    ],
+    "dev": [
         json_formatter,
         hash_generator,
         encoding_tool,
         timestamp_converter,
         qrcode_generator,
         sql_formatter,
+    ],
+    "table": [
         excel_to_csv_from_upload,
         csv_to_excel_from_upload,
-        markdown_to_html,
-        word_to_pdf_from_upload,
-        pdf_to_word_from_upload,
-        excel_to_pdf_from_upload,
         table_basic_profile_from_upload,
         table_value_counts_from_upload,
         table_correlation_from_upload,
@@ -68,6 +76,14 @@ def get_tools():
         table_chart_scatter_from_upload,
         table_chart_line_from_upload,
         table_chart_bar_from_upload,
+    ],
+    "office": [
+        markdown_to_html,
+        word_to_pdf_from_upload,
+        pdf_to_word_from_upload,
+        excel_to_pdf_from_upload,
+    ],
+    "image_base64": [
         image_resize_base64,
         image_convert_base64,
         image_crop_base64,
@@ -76,6 +92,8 @@ def get_tools():
         image_add_text_watermark_base64,
         image_add_image_watermark_base64,
         image_remove_watermark_base64,
+    ],
+    "image": [
         image_upload_to_base64,
         image_crop_upload,
         image_compress_upload,
@@ -84,4 +102,15 @@ def get_tools():
         image_add_image_watermark_upload,
         image_remove_watermark_upload,
         image_auto_remove_watermark_upload,
+        image_pipeline_upload,
+        image_batch_pipeline_upload,
+    ],
+}
+
+def get_tools(groups=None):
+    """All tools, or only those of the given groups (plus "core"), in TOOL_GROUPS order."""
+    return [
+        t for name, tools in TOOL_GROUPS.items()
+        if groups is None or name == "core" or name in groups
+        for t in tools
     ]
@@ -8,6 +8,7 @@ import urllib.parse
 from typing import Literal
 from langchain_core.tools import tool
 import sqlparse
+from src.core.artifacts import put_artifact as _put_artifact
 
 @tool
 def json_formatter(data: str, action: Literal["format", "compress", "escape", "unescape"] = "format") -> str:
@@ -74,7 +75,7 @@ def timestamp_converter(value: str, action: Literal["to_date", "to_timestamp"])
 
 @tool
 def qrcode_generator(text: str) -> str:
-    """Generates a QR code for the given text and returns it as a Base64 string to be displayed directly."""
+    """Generates a QR code for the given text; the UI displays the image directly."""
     try:
         qr = qrcode.QRCode(version=1, box_size=10, border=5)
         qr.add_data(text)
@@ -84,10 +85,10 @@ def qrcode_generator(text: str) -> str:
         # Save to BytesIO instead of file
         buffered = io.BytesIO()
         img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        aid = _put_artifact(buffered.getvalue(), "image/png")
         
         # Return special markers the UI can parse
-        return f"QR Code generated successfully. [IMAGE:png:{img_str}]"
+        return f"QR Code generated successfully. [IMAGE_ID:{aid}:png]"
     except Exception as e:
         return f"Error generating QR code: {str(e)}"
 
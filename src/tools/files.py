@@ -1,88 +1,192 @@
 import os
-import re
-import io
-import base64
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 from langchain_core.tools import tool
-from langchain_experimental.utilities import PythonREPL
+from src.core.uploads import upload_path, get_upload_store
+from src.core.session import current_session_id, current_session_uploads
+from src.core.artifacts import put_artifact as _put_artifact
+from src.core.interpreter import get_interpreter_pool, upload_tables
+from src.core.textfile import line_index, decode_utf8, decode_prefix, utf8_continuation
+from src.core.bm25 import get_index as get_bm25_index
 
 # 4. Python REPL Tool
-python_repl = PythonREPL()
+# Code runs in a per-session worker process (src/core/interpreter.py), never in the server process.
 
 @tool
 def python_interpreter(code: str) -> str:
     """Executes Python code and returns the output. 
     Use this for complex calculations, data processing, or generating code snippets.
+    Variables persist between calls in the same chat session; pandas (pd), numpy (np) and
+    matplotlib.pyplot (plt) are already imported. Calls are time- and memory-limited.
     
     Note on file access:
-    - Uploaded files are located in the 'uploads/' directory.
-    - To read a CSV file: pd.read_csv('uploads/filename.csv')
-    - To read an Excel file: pd.read_excel('uploads/filename.xlsx')
+    - Uploaded CSV/Excel files are preloaded: use tables['filename.csv'] or df_<filename stem>
+      (e.g. df_sales for sales.csv) instead of reading them again.
+    - All uploaded files, tables included, can also be opened from the 'uploads/' directory
+      (e.g. pd.read_csv('uploads/sales.csv') for one listed under "Could not preload").
     
     If you generate plots using matplotlib, they will be returned as images.
+    DataFrames created or reassigned by the code are returned as downloadable CSV files.
     """
     try:
-        # Clear any previous plots
-        plt.clf()
-        plt.close('all')
-        
-        # Run the code
-        result = python_repl.run(code)
-        
-        # Check for plots
-        plot_data = ""
-        if plt.get_fignums():
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', bbox_inches='tight')
-            buf.seek(0)
-            b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-            plot_data = f"\n[IMAGE:png:{b64}]"
-            plt.close('all')
-            
-        return f"Output:\n{result}{plot_data}"
+        tables = upload_tables(current_session_uploads())
+        sid = current_session_id()
+        res = get_interpreter_pool().run(code, session_id=sid, tables=tables, cwd=get_upload_store().session_dir(sid))
     except Exception as e:
         return f"Error executing code: {str(e)}"
 
+    parts = []
+    if res["preloaded"]:
+        parts.append("Preloaded tables: " + "; ".join(res["preloaded"]))
+    if res["preload_errors"]:
+        parts.append("Could not preload: " + "; ".join(res["preload_errors"]))
+    parts.append(f"Output:\n{res['output']}")
+    if res["error"]:
+        parts.append(res["error"])
+    for png in res["figures"]:
+        aid = _put_artifact(png, "image/png")
+        parts.append(f"[IMAGE_ID:{aid}:png]")
+    for name, data in res["frames"]:
+        aid = _put_artifact(data, "text/csv")
+        parts.append(f"DataFrame `{name}`: [FILE_ID:{aid}:csv:{name}.csv]")
+    if res["skipped"]:
+        parts.append("Not exported (too many or too large): " + ", ".join(res["skipped"]))
+    return "\n".join(parts)
+
+# Page size of read_file_from_upload; kept under the tool-output governor limit
+# (TOOL_OUTPUT_MAX_CHARS) so a page reaches the model whole instead of as a preview
+_READ_MAX_CHARS = int(os.environ.get("READ_PAGE_CHARS", 6000))
+
 @tool
-def read_file_from_upload(filename: str, head: int = None) -> str:
-    """Read the content of an uploaded text-based file (txt, csv, md, py, json, etc.).
+def read_file_from_upload(
+    filename: str,
+    head: int = None,
+    offset: int = None,
+    length: int = None,
+    start_line: int = None,
+    end_line: int = None,
+) -> str:
+    """Read the content of an uploaded text-based file (txt, csv, md, py, json, log, etc.).
     
     Args:
         filename: The name of the file in uploads/.
-        head: (Optional) Number of characters to read from the beginning. Default reads full file (up to limit).
+        head: (Optional) Number of characters to read from the beginning (at most one page).
+        offset, length: (Optional) Read `length` bytes starting at byte `offset` (for paging through large files).
+        start_line, end_line: (Optional) Read lines start_line..end_line (1-based, inclusive).
+    At most one page (about 6000 characters) is returned per call; the reply says where the next page starts.
     """
-    allowed = os.environ.get("CURRENT_SESSION_UPLOADS", "")
-    names = [x.strip() for x in re.split(r"[;,]", allowed) if x.strip()]
+    names = current_session_uploads()
     
     if filename not in names:
          # Try fuzzy match or check if it's just not in the list but exists (security risk? No, rely on list)
          return "Error: File not allowed (not in current session uploads)"
          
-    path = os.path.join("uploads", filename)
+    path = upload_path(filename)
     if not os.path.exists(path):
         return "Error: File not found in uploads/"
         
     try:
-        with open(path, "r", encoding="utf-8", errors="replace") as f:
-            if head:
-                content = f.read(head)
-                return f"Content of {filename} (first {head} chars):\n{content}..."
-            else:
-                content = f.read()
-                # Truncate if too long to avoid context overflow
-                if len(content) > 20000:
-                    return f"Content of {filename} (truncated to first 20000 chars):\n{content[:20000]}..."
-                return f"Content of {filename}:\n{content}"
+        # Pages come from a memory-mapped view, so only the requested range is ever read
+        idx = line_index(path)
+        size = idx.size
+        if start_line is not None or end_line is not None:
+            first = max(1, start_line or 1)
+            last = end_line if end_line is not None else first + 199
+            if last < first:
+                return "Error: end_line must be >= start_line"
+            data, _ = idx.read_lines(first - 1, last, _READ_MAX_CHARS * 4)
+            if not data:
+                return f"{filename}: no lines from line {first} (file has {idx.total_lines()} lines)"
+            begin = idx.line_offset(first - 1)
+            text, used = decode_prefix(data, _READ_MAX_CHARS, at_end=begin + len(data) >= size)
+            end = begin + used
+            shown = data[:used]
+            complete = shown.count(b"\n") + (1 if end >= size and not shown.endswith(b"\n") else 0)
+            total = idx.total_lines()
+            total_note = f" of {total}" if total is not None else ""
+            if end < size and not shown.endswith(b"\n"):
+                # The page ends inside a line longer than the page; continue from the byte
+                # offset, since start_line would either repeat this line or skip its rest
+                shown_last = first + complete
+                return (
+                    f"Content of {filename} (lines {first}-{shown_last}{total_note}, line {shown_last} cut at byte {end}):\n"
+                    f"{text}\n[Next: offset={end}]"
+                )
+            shown_last = first + complete - 1
+            more = f"\n[Next: start_line={shown_last + 1}]" if total is None or shown_last < total else ""
+            return f"Content of {filename} (lines {first}-{shown_last}{total_note}):\n{text}{more}"
+        if offset is not None or length is not None:
+            start = max(0, offset or 0)
+            # At least 4 bytes so one complete UTF-8 character always fits
+            want = min(max(4, length or _READ_MAX_CHARS), _READ_MAX_CHARS * 4)
+            raw = idx.read(start, want)
+            # Skip the rest of a UTF-8 character cut at the front; decode_prefix leaves one cut at
+            # the end for the next page
+            lead = utf8_continuation(idx.read(max(0, start - 3), min(3, start)), raw) if start else 0
+            # The next page starts right after the last raw byte returned
+            text, used = decode_prefix(raw[lead:], _READ_MAX_CHARS, at_end=start + len(raw) >= size)
+            end = start + lead + used
+            more = f"\n[Next: offset={end}]" if end < size else ""
+            return f"Content of {filename} (bytes {start}-{end} of {size}):\n{text}{more}"
+        if head:
+            head = min(head, _READ_MAX_CHARS)
+            raw = idx.read(0, head * 4 + 4)
+            text, end = decode_prefix(raw, head, at_end=len(raw) >= size)
+            if end >= size:
+                return f"Content of {filename}:\n{text}"
+            return f"Content of {filename} (first {len(text)} chars):\n{text}...\n[Next: offset={end}]"
+        raw = idx.read(0, _READ_MAX_CHARS * 4 + 4)
+        text, end = decode_prefix(raw, _READ_MAX_CHARS, at_end=len(raw) >= size)
+        if end < size:
+            # Truncate if too long to avoid context overflow
+            return (
+                f"Content of {filename} (truncated to first {_READ_MAX_CHARS} chars of {size} bytes):\n"
+                f"{text}...\n[Next: offset={end}, or use start_line/end_line]"
+            )
+        return f"Content of {filename}:\n{text}"
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
+_PASSAGE_CHARS = 800
+
+@tool
+def search_in_upload(filename: str, query: str, top_k: int = 5) -> str:
+    """Search inside an uploaded text document (txt, md, log, code, json, csv...) and return the
+    top_k most relevant passages (BM25 ranking, Chinese supported) with their line numbers and
+    byte offsets. Prefer this over reading a whole large file; use read_file_from_upload with the
+    returned offset or start_line to see more context around a hit.
+    """
+    names = current_session_uploads()
+    if filename not in names:
+        return "Error: File not allowed (not in current session uploads)"
+    path = upload_path(filename)
+    if not os.path.exists(path):
+        return "Error: File not found in uploads/"
+    try:
+        with open(path, "rb") as f:
+            if b"\x00" in f.read(8192):
+                return "Error: Not a text file"
+        # Built on first search, then reused for the same content (memory, then disk cache)
+        index = get_bm25_index(path)
+        hits = index.search(query, max(1, min(int(top_k), 20)))
+        if not hits:
+            return f"No passages in {filename} match: {query}"
+        idx = line_index(path)
+        parts = [f"Top {len(hits)} passages in {filename} for: {query}"]
+        for rank, (doc, score) in enumerate(hits, 1):
+            start, end = int(index.starts[doc]), int(index.ends[doc])
+            text = decode_utf8(idx.read(start, end - start)).strip()
+            if len(text) > _PASSAGE_CHARS:
+                text = text[:_PASSAGE_CHARS] + "..."
+            parts.append(
+                f"[{rank}] score={score:.2f} line {int(index.lines[doc])}, bytes {start}-{end}\n{text}"
+            )
+        return "\n\n".join(parts)
+    except Exception as e:
+        return f"Error searching file: {str(e)}"
+
 @tool
 def list_uploaded_files() -> str:
     """Lists files uploaded in the current session only."""
-    allowed = os.environ.get("CURRENT_SESSION_UPLOADS", "")
-    names = [x.strip() for x in re.split(r"[;,]", allowed) if x.strip()]
+    names = current_session_uploads()
     if not names:
         return "No files uploaded yet."
     return "Uploaded files (current session):\n" + "\n".join(names)
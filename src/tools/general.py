@@ -1,85 +1,112 @@
 import os
+import re
 import time
-import requests
+import unicodedata
+from typing import Any, Dict, List, Optional
 from langchain_community.tools import DuckDuckGoSearchRun
-from langchain_core.tools import tool
+from langchain_core.tools import tool, StructuredTool
+from src.core.search import search, asearch, configured_providers
+from src.core.cachedir import private_cache_dir
+from src.core.diskcache import SQLiteTTLCache
+from src.core.expr import evaluate, evaluate_batch
 
 # 1. Web Search Tool (robust, with fallbacks)
-@tool
-def web_search(query: str, max_results: int = 5) -> str:
-    """Search the web and return concise results. Tries Tavily (if API key), then SerpAPI, then DuckDuckGo.
-    Environment variables:
-    - TAVILY_API_KEY (optional)
-    - SERPAPI_API_KEY (optional)
-    """
-    tavily_key = os.environ.get("TAVILY_API_KEY")
-    serp_key = os.environ.get("SERPAPI_API_KEY")
+_WEB_SEARCH_DOC = """Search the web and return concise results. Uses Tavily (if API key), SerpAPI and DuckDuckGo;
+by default providers are hedged (a slow one is raced by the next) and the first good result wins.
+Environment variables:
+- TAVILY_API_KEY (optional)
+- SERPAPI_API_KEY (optional)
+"""
 
-    try:
-        if tavily_key:
-            resp = requests.post(
-                "https://api.tavily.com/search",
-                json={
-                    "api_key": tavily_key,
-                    "query": query,
-                    "search_depth": "advanced",
-                    "max_results": max_results,
-                },
-                timeout=20,
-            )
-            resp.raise_for_status()
-            data = resp.json()
-            results = data.get("results", [])
-            lines = []
-            for r in results[:max_results]:
-                title = r.get("title", "")
-                url = r.get("url", "")
-                snippet = r.get("content", "")
-                lines.append(f"- {title}\n{url}\n{snippet}")
-            return "\n\n".join(lines) or "No results found."
+# Environment variables (all optional):
+# - SEARCH_CACHE_TTL_SECONDS: how long a search result is reused (default 6 h, 0 disables the cache)
+# - SEARCH_CACHE_PATH: SQLite file for the cache (default ~/.cache/bunnytools/sqlite/cache.sqlite3, shared with the LLM cache)
+# - SEARCH_CACHE_MAX_ENTRIES: rows kept before the oldest are dropped (default 5000)
+_SEARCH_CACHE = SQLiteTTLCache(
+    path=os.environ.get("SEARCH_CACHE_PATH") or os.path.join(private_cache_dir("sqlite"), "cache.sqlite3"),
+    ttl=float(os.environ.get("SEARCH_CACHE_TTL_SECONDS", 6 * 3600)),
+    max_entries=int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", 5000)),
+    table="web_search",
+)
+
+def _normalize_query(query: str) -> str:
+    # "  Python  教程 " and "python 教程" share one cache entry
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query or "")).strip().casefold()
 
-        if serp_key:
-            resp = requests.get(
-                "https://serpapi.com/search.json",
-                params={"q": query, "engine": "google", "api_key": serp_key},
-                timeout=20,
-            )
-            resp.raise_for_status()
-            data = resp.json()
-            results = data.get("organic_results", [])
-            lines = []
-            for r in results[:max_results]:
-                title = r.get("title", "")
-                url = r.get("link", "")
-                snippet = r.get("snippet", "")
-                lines.append(f"- {title}\n{url}\n{snippet}")
-            return "\n\n".join(lines) or "No results found."
+def _cache_key(query, max_results, provider):
+    return f"{provider}|{max_results}|{_normalize_query(query)}"
+
+def _cacheable(result: str) -> bool:
+    return bool(result) and not result.startswith(("Search error", "No results found"))
+
+def _web_search(query: str, max_results: int = 5) -> str:
+    key = _cache_key(query, max_results, configured_providers()[0])
+    cached = _SEARCH_CACHE.get(key)
+    if cached is not None:
+        return cached
+    try:
+        result = search(query, max_results)
+    except Exception as e:
+        return f"Search error: {str(e)}"
+    if _cacheable(result):
+        _SEARCH_CACHE.set(key, result)
+    return result
 
-        # Fallback to DuckDuckGo
-        from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
-        
-        errors = []
-        # Try different backends: "api" (default), "html", "lite"
-        for backend in ["api", "html", "lite"]:
-            try:
-                wrapper = DuckDuckGoSearchAPIWrapper(max_results=max_results, backend=backend)
-                result = wrapper.run(query)
-                if result:
-                    return result
-            except Exception as e:
-                errors.append(f"{backend}: {str(e)}")
-                continue
-        
-        return f"No results found via DuckDuckGo. Errors: {'; '.join(errors)}. Please configure TAVILY_API_KEY or SERPAPI_API_KEY for robust search."
+async def _aweb_search(query: str, max_results: int = 5) -> str:
+    # Async-native path used by graph.astream: the HTTP calls do not hold a worker thread.
+    key = _cache_key(query, max_results, configured_providers()[0])
+    cached = _SEARCH_CACHE.get(key)
+    if cached is not None:
+        return cached
+    try:
+        result = await asearch(query, max_results)
     except Exception as e:
         return f"Search error: {str(e)}"
+    if _cacheable(result):
+        _SEARCH_CACHE.set(key, result)
+    return result
+
+web_search = StructuredTool.from_function(
+    func=_web_search,
+    coroutine=_aweb_search,
+    name="web_search",
+    description=_WEB_SEARCH_DOC,
+)
 
 # 2. Calculator Tool
+_BATCH_PREVIEW = 200
+
+def _format_number(v):
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15:
+        return str(int(v))
+    return str(v)
+
 @tool
-def calculator(expression: str) -> str:
-    """Calculates the result of a mathematical expression."""
+def calculator(
+    expression: str,
+    variables: Optional[Dict[str, Any]] = None,
+    rows: Optional[List[Dict[str, float]]] = None,
+) -> str:
+    """Calculates the result of a mathematical expression.
+    Supports + - * / // % **, comparisons, math functions (sqrt, exp, log, log10, log2, sin, cos, tan,
+    asin, acos, atan, atan2, hypot, floor, ceil, abs, round, min, max, pow, factorial, comb, perm, gcd)
+    and constants pi, e, tau.
+    Batch mode: pass `variables` whose values are lists (columns) and/or `rows` (a list of
+    {name: value} bindings); the expression is evaluated for all of them at once, e.g.
+    expression="price * qty * (1 - discount)", rows=[{"price": 10, "qty": 3, "discount": 0.1}, ...].
+    """
     try:
-        return str(eval(expression))
+        columns = dict(variables or {})
+        if rows:
+            keys = set().union(*(r.keys() for r in rows))
+            for k in keys:
+                columns[k] = [r.get(k, float("nan")) for r in rows]
+        if not any(isinstance(v, (list, tuple)) for v in columns.values()):
+            return str(evaluate(expression, columns))
+        values = evaluate_batch(expression, columns)
+        shown = ", ".join(_format_number(float(v)) for v in values[:_BATCH_PREVIEW])
+        more = f" ... ({len(values) - _BATCH_PREVIEW} more)" if len(values) > _BATCH_PREVIEW else ""
+        return f"Results ({len(values)}): [{shown}{more}]"
     except Exception as e:
         return f"Error calculating: {str(e)}"
 
@@ -1,17 +1,26 @@
 import base64
 import io
-from typing import Literal
+from typing import Any, Dict, List, Literal
 from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageStat, ImageChops
 from langchain_core.tools import tool
+from src.core.uploads import upload_path
+from src.core.session import current_session_uploads
+from src.core.artifacts import put_artifact as _put_artifact, get_artifact
+from src.core.fonts import get_font, default_font_path
 import os
-import re
-import uuid
-import subprocess
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import fnmatch
+import zipfile
 
 def _decode_image(b64: str) -> Image.Image:
     return Image.open(io.BytesIO(base64.b64decode(b64)))
 
-def _encode_image(img: Image.Image, fmt: str = "PNG", quality: int = 80) -> str:
+def _encode_image(img: Image.Image, fmt: str = "PNG", quality: int = 80) -> bytes:
     buf = io.BytesIO()
     if fmt.upper() == "WEBP":
         img = img.convert("RGB")
@@ -21,69 +30,255 @@ def _encode_image(img: Image.Image, fmt: str = "PNG", quality: int = 80) -> str:
         img.save(buf, format=fmt, quality=quality, optimize=True)
     else:
         img.save(buf, format=fmt)
-    return base64.b64encode(buf.getvalue()).decode('utf-8')
+    return buf.getvalue()
+
 def _choose_font(font_path: str, font_size: int):
     if font_path and os.path.exists(font_path):
         try:
-            return ImageFont.truetype(font_path, font_size)
+            return get_font(font_path, font_size)
+        except Exception:
+            pass
+    # Resolved once per process (CJK first, then Latin); font objects are memoized by (path, size)
+    fp = default_font_path()
+    if fp:
+        try:
+            return get_font(fp, font_size)
         except Exception:
             pass
-            
-    cands = [
-        "C:/Windows/Fonts/msyh.ttc",
-        "C:/Windows/Fonts/msyh.ttf",
-        "C:/Windows/Fonts/msyhbd.ttf",
-        "C:/Windows/Fonts/simhei.ttf",
-        "C:/Windows/Fonts/simsun.ttc",
-        "C:/Windows/Fonts/msjh.ttc",
-        "/System/Library/Fonts/PingFang.ttc",
-        "/System/Library/Fonts/STHeiti Light.ttc",
-        "/System/Library/Fonts/STHeiti Medium.ttc",
-        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
-        "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttf",
-        "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
-        "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
-        "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
-        "/usr/share/fonts/truetype/arphic/ukai.ttc",
-        "/usr/share/fonts/truetype/arphic/uming.ttc",
-        "arial.ttf",
-        "C:/Windows/Fonts/arial.ttf",
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        "DejaVuSans.ttf",
-    ]
-    for fp in cands:
-        if os.path.exists(fp):
-            try:
-                return ImageFont.truetype(fp, font_size)
-            except Exception:
-                pass
-                
-    # Try to find a Chinese font using fc-list (Linux/Streamlit Cloud)
-    try:
-        output = subprocess.check_output(['fc-list', ':lang=zh', 'file'], text=True)
-        for line in output.splitlines():
-            if line.strip():
-                # Output format is usually: /path/to/font: ...
-                path = line.split(":")[0].strip()
-                if os.path.exists(path):
-                    try:
-                        return ImageFont.truetype(path, font_size)
-                    except Exception:
-                        continue
-    except Exception:
-        pass
-        
     return ImageFont.load_default()
 
-ARTIFACT_CACHE = {}
+# Tiled watermark layers keyed by (stamp, spacing, angle, canvas size), bounded by bytes
+_PATTERN_CACHE = OrderedDict()
+_PATTERN_CACHE_BYTES = int(os.environ.get("WATERMARK_PATTERN_CACHE_BYTES", 256 * 1024 * 1024))
+_PATTERN_LOCK = threading.Lock()
+
+def _text_stamp(text: str, font, fill, stroke_fill, stroke_width: int = 2):
+    """Rasterize text once; returns the stamp and the offset of its top-left from the draw origin."""
+    probe = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    l, t, r, b = probe.textbbox((0, 0), text, font=font, stroke_width=stroke_width)
+    stamp = Image.new("RGBA", (max(1, r - l), max(1, b - t)), (0, 0, 0, 0))
+    ImageDraw.Draw(stamp).text((-l, -t), text, font=font, fill=fill, stroke_width=stroke_width, stroke_fill=stroke_fill)
+    return stamp, (l, t)
+
+def _composite_at(dst: Image.Image, src: Image.Image, x: int, y: int):
+    """alpha_composite src onto dst at (x, y), clipping whatever falls outside dst."""
+    left, top = max(0, -x), max(0, -y)
+    right, bottom = min(src.width, dst.width - x), min(src.height, dst.height - y)
+    if right <= left or bottom <= top:
+        return
+    dst.alpha_composite(src, (x + left, y + top), (left, top, right, bottom))
+
+def _tile_stamp(stamp: Image.Image, offset, size, step: int, angle: float = 0.0) -> Image.Image:
+    """Repeat stamp every `step` px from the origin: build one row strip, then composite the strip per row.
 
-def _put_artifact(data: str) -> str:
-    k = uuid.uuid4().hex
-    ARTIFACT_CACHE[k] = data
-    return k
+    Compositing onto the transparent canvases keeps the stamp's own alpha; pasting with the
+    stamp as its own mask would multiply the alpha in a second time.
+    """
+    ox, oy = offset
+    row = Image.new("RGBA", (size[0], stamp.height), (0, 0, 0, 0))
+    for xx in range(0, size[0] + step, step):
+        _composite_at(row, stamp, xx + ox, 0)
+    layer = Image.new("RGBA", size, (0, 0, 0, 0))
+    for yy in range(0, size[1] + step, step):
+        _composite_at(layer, row, 0, yy + oy)
+    if angle != 0.0:
+        layer = layer.rotate(angle, expand=False)
+    return layer
+
+def _pattern_layer(key, build) -> Image.Image:
+    """Return the cached pattern layer for key, building it on a miss. Callers must not mutate it."""
+    with _PATTERN_LOCK:
+        layer = _PATTERN_CACHE.get(key)
+        if layer is not None:
+            _PATTERN_CACHE.move_to_end(key)
+            return layer
+    layer = build()
+    nbytes = layer.width * layer.height * 4
+    if nbytes <= _PATTERN_CACHE_BYTES:
+        with _PATTERN_LOCK:
+            _PATTERN_CACHE[key] = layer
+            total = sum(v.width * v.height * 4 for v in _PATTERN_CACHE.values())
+            while total > _PATTERN_CACHE_BYTES and len(_PATTERN_CACHE) > 1:
+                _, old = _PATTERN_CACHE.popitem(last=False)
+                total -= old.width * old.height * 4
+    return layer
 
-def get_artifact(key: str) -> str:
-    return ARTIFACT_CACHE.get(key, "")
+def _apply_remove_watermark(img: Image.Image, x: int, y: int, width: int, height: int, method: str = "blur", strength: int = 6, feather: int = 0) -> Image.Image:
+    img = img.convert("RGBA")
+    box = (x, y, x + width, y + height)
+    region = img.crop(box)
+    strength = max(1, strength)
+    if method == "blur":
+        region = region.filter(ImageFilter.GaussianBlur(radius=strength))
+    elif method == "pixelate":
+        small = region.resize((max(1, width // max(1, strength)), max(1, height // max(1, strength))), resample=Image.NEAREST)
+        region = small.resize((width, height), resample=Image.NEAREST)
+    elif method == "median":
+        size = strength if strength % 2 == 1 else strength + 1
+        region = region.filter(ImageFilter.MedianFilter(size=size))
+    elif method in ("clone_left", "clone_top"):
+        src_img = img.copy()
+        if method == "clone_left":
+            sx = max(0, x - width)
+            sy = y
+            src_box = (sx, sy, sx + width, sy + height)
+        else:
+            sx = x
+            sy = max(0, y - height)
+            src_box = (sx, sy, sx + width, sy + height)
+        # Clamp source box within bounds
+        sx1, sy1, sx2, sy2 = src_box
+        sx1 = max(0, min(sx1, src_img.width))
+        sy1 = max(0, min(sy1, src_img.height))
+        sx2 = max(0, min(sx2, src_img.width))
+        sy2 = max(0, min(sy2, src_img.height))
+        src_box = (sx1, sy1, sx2, sy2)
+        sample = src_img.crop(src_box)
+        # If sample size mismatch, resize
+        if sample.size != (width, height):
+            sample = sample.resize((width, height))
+        region = sample
+    # Compose with optional feather for smoother edges
+    out_img = img.copy()
+    out_img.paste(region, (x, y))
+    if feather > 0:
+        mask = Image.new("L", img.size, 0)
+        mdraw = ImageDraw.Draw(mask)
+        mdraw.rectangle([x, y, x + width, y + height], fill=255)
+        mask = mask.filter(ImageFilter.GaussianBlur(radius=feather))
+        out_img = Image.composite(out_img, img, mask)
+    return out_img
+
+def _apply_text_watermark(
+    img: Image.Image,
+    text: str,
+    x: int = 10,
+    y: int = 10,
+    opacity: float = 0.3,
+    font_size: int = 24,
+    color: str = "#FFFFFF",
+    stroke_color: str = "#000000",
+    mode: str = "single",
+    spacing: int = 160,
+    angle: float = 0.0,
+    align: str = "lt",
+    font_path: str = "",
+) -> Image.Image:
+    img = img.convert("RGBA")
+    txt_layer = Image.new("RGBA", img.size)
+    txt_layer.putalpha(0)
+    draw = ImageDraw.Draw(txt_layer)
+    def parse_color(s: str, a: int):
+        t = s.strip().lower()
+        if t.startswith("#"):
+            t = t[1:]
+            if len(t) == 6:
+                r = int(t[0:2], 16); g = int(t[2:4], 16); b = int(t[4:6], 16)
+                return (r, g, b, a)
+            if len(t) == 3:
+                r = int(t[0]*2, 16); g = int(t[1]*2, 16); b = int(t[2]*2, 16)
+                return (r, g, b, a)
+        if "," in t:
+            parts = [p.strip() for p in t.split(",")]
+            if len(parts) >= 3:
+                try:
+                    r = int(parts[0]); g = int(parts[1]); b = int(parts[2])
+                    return (r, g, b, a)
+                except Exception:
+                    pass
+        return (255, 255, 255, a)
+    alpha = int(255 * max(0.0, min(1.0, opacity)))
+    fill = parse_color(color, alpha)
+    stroke_fill = parse_color(stroke_color, alpha)
+    f = _choose_font(font_path, font_size)
+    try:
+        tw, th = draw.textsize(text, font=f)
+    except Exception:
+        tw, th = (font_size * max(1, len(text) // 2), font_size)
+    px, py = x, y
+    if mode == "center" or align == "center":
+        px = (img.width - tw) // 2
+        py = (img.height - th) // 2
+    else:
+        if align == "rt":
+            px = img.width - tw - x
+            py = y
+        elif align == "rb":
+            px = img.width - tw - x
+            py = img.height - th - y
+        elif align == "lb":
+            px = x
+            py = img.height - th - y
+    px = max(0, min(px, img.width - tw))
+    py = max(0, min(py, img.height - th))
+    if mode == "single" or mode == "center":
+        draw.text((px, py), text, font=f, fill=fill, stroke_width=2, stroke_fill=stroke_fill)
+        if angle != 0.0:
+            txt_layer = txt_layer.rotate(angle, expand=False)
+    else:
+        # Rasterize the text once and tile the stamp; the finished layer is cached for same-size images
+        step = max(20, spacing)
+        ang = angle if angle != 0.0 else (30.0 if mode == "diagonal" else 0.0)
+        key = ("text", text, getattr(f, "path", None), getattr(f, "size", font_size), fill, stroke_fill, step, ang, img.size)
+        txt_layer = _pattern_layer(key, lambda: _tile_stamp(*_text_stamp(text, f, fill, stroke_fill), img.size, step, ang))
+    out = Image.alpha_composite(img, txt_layer)
+    return out
+
+def _apply_image_watermark(
+    base: Image.Image,
+    wm: Image.Image,
+    x: int = 10,
+    y: int = 10,
+    opacity: float = 0.3,
+    scale: float = 1.0,
+    mode: str = "single",
+    spacing: int = 160,
+    angle: float = 0.0,
+    align: str = "lt",
+) -> Image.Image:
+    base = base.convert("RGBA")
+    wm = wm.convert("RGBA")
+    if scale != 1.0:
+        w = int(max(1, wm.width * scale))
+        h = int(max(1, wm.height * scale))
+        wm = wm.resize((w, h))
+    alpha = wm.split()[3]
+    alpha = alpha.point(lambda p: int(p * max(0.0, min(1.0, opacity))))
+    wm.putalpha(alpha)
+    if angle != 0.0:
+        wm = wm.rotate(angle, expand=True)
+    # Image watermarks have always been pasted with their own alpha as the mask, which applies
+    # the opacity twice; bake that into the stamp once so single and tiled modes composite the
+    # same stamp and keep the established strength
+    stamp = Image.new("RGBA", wm.size, (0, 0, 0, 0))
+    stamp.paste(wm, (0, 0), wm)
+    wm = stamp
+    overlay = Image.new("RGBA", base.size, (0, 0, 0, 0))
+    if mode == "single" or mode == "center":
+        px, py = x, y
+        if mode == "center" or align == "center":
+            px = (base.width - wm.width) // 2
+            py = (base.height - wm.height) // 2
+        else:
+            if align == "rt":
+                px = base.width - wm.width - x
+                py = y
+            elif align == "rb":
+                px = base.width - wm.width - x
+                py = base.height - wm.height - y
+            elif align == "lb":
+                px = x
+                py = base.height - wm.height - y
+        px = max(0, min(px, base.width - wm.width))
+        py = max(0, min(py, base.height - wm.height))
+        _composite_at(overlay, wm, px, py)
+    else:
+        step = max(10, spacing)
+        ang = 30.0 if mode == "diagonal" and angle == 0.0 else 0.0
+        key = ("image", hashlib.sha1(wm.tobytes()).hexdigest(), wm.size, step, ang, base.size)
+        overlay = _pattern_layer(key, lambda: _tile_stamp(wm, (0, 0), base.size, step, ang))
+    out = Image.alpha_composite(base, overlay)
+    return out
 
 @tool
 def image_resize_base64(image_base64: str, width: int, height: int) -> str:
@@ -91,8 +286,8 @@ def image_resize_base64(image_base64: str, width: int, height: int) -> str:
     try:
         img = _decode_image(image_base64)
         resized = img.resize((width, height))
-        b64 = _encode_image(resized, "PNG")
-        aid = _put_artifact(b64)
+        data = _encode_image(resized, "PNG")
+        aid = _put_artifact(data, "image/png")
         return f"Image resized. [IMAGE_ID:{aid}:png]"
     except Exception as e:
         return f"Error resizing image: {str(e)}"
@@ -102,10 +297,10 @@ def image_convert_base64(image_base64: str, format: Literal["PNG", "JPEG", "WEBP
     """Convert a base64-encoded image to a different format and return base64."""
     try:
         img = _decode_image(image_base64)
-        b64 = _encode_image(img, format)
+        data = _encode_image(img, format)
         lower = format.lower()
         mime = "png" if lower == "png" else ("jpeg" if lower == "jpeg" else "webp")
-        aid = _put_artifact(b64)
+        aid = _put_artifact(data, f"image/{mime}")
         return f"Image converted. [IMAGE_ID:{aid}:{mime}]"
     except Exception as e:
         return f"Error converting image: {str(e)}"
@@ -117,8 +312,8 @@ def image_crop_base64(image_base64: str, x: int, y: int, width: int, height: int
         img = _decode_image(image_base64)
         box = (x, y, x + width, y + height)
         cropped = img.crop(box)
-        b64 = _encode_image(cropped, "PNG")
-        aid = _put_artifact(b64)
+        data = _encode_image(cropped, "PNG")
+        aid = _put_artifact(data, "image/png")
         return f"Image cropped. [IMAGE_ID:{aid}:png]"
     except Exception as e:
         return f"Error cropping image: {str(e)}"
@@ -130,9 +325,9 @@ def image_compress_base64(image_base64: str, quality: int = 75, format: Literal[
         img = _decode_image(image_base64).convert("RGB")
         buf = io.BytesIO()
         img.save(buf, format=format, quality=quality, optimize=True)
-        b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
+        data = buf.getvalue()
         mime = "jpeg" if format == "JPEG" else "webp"
-        aid = _put_artifact(b64)
+        aid = _put_artifact(data, f"image/{mime}")
         return f"Image compressed. [IMAGE_ID:{aid}:{mime}]"
     except Exception as e:
         return f"Error compressing image: {str(e)}"
@@ -143,8 +338,8 @@ def image_rotate_base64(image_base64: str, angle: float, expand: bool = True) ->
     try:
         img = _decode_image(image_base64)
         rotated = img.rotate(angle, expand=expand)
-        b64 = _encode_image(rotated, "PNG")
-        aid = _put_artifact(b64)
+        data = _encode_image(rotated, "PNG")
+        aid = _put_artifact(data, "image/png")
         return f"Image rotated. [IMAGE_ID:{aid}:png]"
     except Exception as e:
         return f"Error rotating image: {str(e)}"
@@ -160,8 +355,8 @@ def image_add_text_watermark_base64(image_base64: str, text: str, x: int = 10, y
         # If default font is too small, try scaling via stroke
         draw.text((x, y), text, font=font, fill=(255, 255, 255, int(255 * opacity)))
         out = Image.alpha_composite(img, txt_layer)
-        b64 = _encode_image(out.convert("RGB"), "PNG")
-        aid = _put_artifact(b64)
+        data = _encode_image(out.convert("RGB"), "PNG")
+        aid = _put_artifact(data, "image/png")
         return f"Text watermark added. [IMAGE_ID:{aid}:png]"
     except Exception as e:
         return f"Error adding text watermark: {str(e)}"
@@ -180,8 +375,8 @@ def image_add_image_watermark_base64(image_base64: str, watermark_base64: str, x
         alpha = alpha.point(lambda p: int(p * opacity))
         wm.putalpha(alpha)
         base.paste(wm, (x, y), wm)
-        b64 = _encode_image(base.convert("RGB"), "PNG")
-        aid = _put_artifact(b64)
+        data = _encode_image(base.convert("RGB"), "PNG")
+        aid = _put_artifact(data, "image/png")
         return f"Image watermark added. [IMAGE_ID:{aid}:png]"
     except Exception as e:
         return f"Error adding image watermark: {str(e)}"
@@ -204,50 +399,9 @@ def image_remove_watermark_base64(
     """
     try:
         img = _decode_image(image_base64).convert("RGBA")
-        box = (x, y, x + width, y + height)
-        region = img.crop(box)
-        strength = max(1, strength)
-        if method == "blur":
-            region = region.filter(ImageFilter.GaussianBlur(radius=strength))
-        elif method == "pixelate":
-            small = region.resize((max(1, width // max(1, strength)), max(1, height // max(1, strength))), resample=Image.NEAREST)
-            region = small.resize((width, height), resample=Image.NEAREST)
-        elif method == "median":
-            size = strength if strength % 2 == 1 else strength + 1
-            region = region.filter(ImageFilter.MedianFilter(size=size))
-        elif method in ("clone_left", "clone_top"):
-            src_img = img.copy()
-            if method == "clone_left":
-                sx = max(0, x - width)
-                sy = y
-                src_box = (sx, sy, sx + width, sy + height)
-            else:
-                sx = x
-                sy = max(0, y - height)
-                src_box = (sx, sy, sx + width, sy + height)
-            # Clamp source box within bounds
-            sx1, sy1, sx2, sy2 = src_box
-            sx1 = max(0, min(sx1, src_img.width))
-            sy1 = max(0, min(sy1, src_img.height))
-            sx2 = max(0, min(sx2, src_img.width))
-            sy2 = max(0, min(sy2, src_img.height))
-            src_box = (sx1, sy1, sx2, sy2)
-            sample = src_img.crop(src_box)
-            # If sample size mismatch, resize
-            if sample.size != (width, height):
-                sample = sample.resize((width, height))
-            region = sample
-        # Compose with optional feather for smoother edges
-        out_img = img.copy()
-        out_img.paste(region, (x, y))
-        if feather > 0:
-            mask = Image.new("L", img.size, 0)
-            mdraw = ImageDraw.Draw(mask)
-            mdraw.rectangle([x, y, x + width, y + height], fill=255)
-            mask = mask.filter(ImageFilter.GaussianBlur(radius=feather))
-            out_img = Image.composite(out_img, img, mask)
-        b64 = _encode_image(out_img.convert("RGB"), "PNG")
-        aid = _put_artifact(b64)
+        out_img = _apply_remove_watermark(img, x, y, width, height, method, strength, feather)
+        data = _encode_image(out_img.convert("RGB"), "PNG")
+        aid = _put_artifact(data, "image/png")
         return f"Watermark removed. [IMAGE_ID:{aid}:png]"
     except Exception as e:
         return f"Error removing watermark: {str(e)}"
@@ -258,24 +412,17 @@ def image_upload_to_base64(filename: str) -> str:
     try:
         if not _allowed(filename):
             return "Error: File not allowed (not in current session uploads)"
-        path = os.path.join("uploads", filename)
+        path = upload_path(filename)
         with open(path, "rb") as f:
             data = f.read()
         # Detect format roughly via Pillow
         img = Image.open(io.BytesIO(data))
         fmt = img.format or "PNG"
-        # Normalize to given format when encoding
-        b64 = base64.b64encode(data).decode("utf-8")
         mime = fmt.lower()
-        aid = _put_artifact(b64)
+        aid = _put_artifact(data, f"image/{mime}")
         return f"Image loaded. [IMAGE_ID:{aid}:{mime}]"
     except Exception as e:
         return f"Error reading uploaded image: {str(e)}"
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
 
 @tool
 def image_crop_upload(filename: str, x: int, y: int, width: int, height: int) -> str:
@@ -283,20 +430,15 @@ def image_crop_upload(filename: str, x: int, y: int, width: int, height: int) ->
     try:
         if not _allowed(filename):
             return "Error: File not allowed (not in current session uploads)"
-        path = os.path.join("uploads", filename)
+        path = upload_path(filename)
         img = Image.open(path)
         box = (x, y, x + width, y + height)
         cropped = img.crop(box)
-        b64 = _encode_image(cropped, "WEBP", quality=80)
-        aid = _put_artifact(b64)
+        data = _encode_image(cropped, "WEBP", quality=80)
+        aid = _put_artifact(data, "image/webp")
         return f"Image cropped. [IMAGE_ID:{aid}:webp]"
     except Exception as e:
         return f"Error cropping image: {str(e)}"
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
 
 @tool
 def image_compress_upload(filename: str, quality: int = 75, format: Literal["JPEG", "WEBP"] = "JPEG") -> str:
@@ -304,21 +446,16 @@ def image_compress_upload(filename: str, quality: int = 75, format: Literal["JPE
     try:
         if not _allowed(filename):
             return "Error: File not allowed (not in current session uploads)"
-        path = os.path.join("uploads", filename)
+        path = upload_path(filename)
         img = Image.open(path).convert("RGB")
         buf = io.BytesIO()
         img.save(buf, format=format, quality=quality, optimize=True)
-        b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
+        data = buf.getvalue()
         mime = "jpeg" if format == "JPEG" else "webp"
-        aid = _put_artifact(b64)
+        aid = _put_artifact(data, f"image/{mime}")
         return f"Image compressed. [IMAGE_ID:{aid}:{mime}]"
     except Exception as e:
         return f"Error compressing image: {str(e)}"
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
 
 @tool
 def image_rotate_upload(filename: str, angle: float, expand: bool = True) -> str:
@@ -326,19 +463,14 @@ def image_rotate_upload(filename: str, angle: float, expand: bool = True) -> str
     try:
         if not _allowed(filename):
             return "Error: File not allowed (not in current session uploads)"
-        path = os.path.join("uploads", filename)
+        path = upload_path(filename)
         img = Image.open(path)
         rotated = img.rotate(angle, expand=expand)
-        b64 = _encode_image(rotated, "WEBP", quality=80)
-        aid = _put_artifact(b64)
+        data = _encode_image(rotated, "WEBP", quality=80)
+        aid = _put_artifact(data, "image/webp")
         return f"Image rotated. [IMAGE_ID:{aid}:webp]"
     except Exception as e:
         return f"Error rotating image: {str(e)}"
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
 
 @tool
 def image_add_text_watermark_upload(
@@ -360,75 +492,14 @@ def image_add_text_watermark_upload(
     try:
         if not _allowed(filename):
             return "Error: File not allowed (not in current session uploads)"
-        path = os.path.join("uploads", filename)
-        img = Image.open(path).convert("RGBA")
-        txt_layer = Image.new("RGBA", img.size)
-        txt_layer.putalpha(0)
-        draw = ImageDraw.Draw(txt_layer)
-        def parse_color(s: str, a: int):
-            t = s.strip().lower()
-            if t.startswith("#"):
-                t = t[1:]
-                if len(t) == 6:
-                    r = int(t[0:2], 16); g = int(t[2:4], 16); b = int(t[4:6], 16)
-                    return (r, g, b, a)
-                if len(t) == 3:
-                    r = int(t[0]*2, 16); g = int(t[1]*2, 16); b = int(t[2]*2, 16)
-                    return (r, g, b, a)
-            if "," in t:
-                parts = [p.strip() for p in t.split(",")]
-                if len(parts) >= 3:
-                    try:
-                        r = int(parts[0]); g = int(parts[1]); b = int(parts[2])
-                        return (r, g, b, a)
-                    except Exception:
-                        pass
-            return (255, 255, 255, a)
-        alpha = int(255 * max(0.0, min(1.0, opacity)))
-        fill = parse_color(color, alpha)
-        stroke_fill = parse_color(stroke_color, alpha)
-        f = _choose_font(font_path, font_size)
-        try:
-            tw, th = draw.textsize(text, font=f)
-        except Exception:
-            tw, th = (font_size * max(1, len(text) // 2), font_size)
-        px, py = x, y
-        if mode == "center" or align == "center":
-            px = (img.width - tw) // 2
-            py = (img.height - th) // 2
-        else:
-            if align == "rt":
-                px = img.width - tw - x
-                py = y
-            elif align == "rb":
-                px = img.width - tw - x
-                py = img.height - th - y
-            elif align == "lb":
-                px = x
-                py = img.height - th - y
-        px = max(0, min(px, img.width - tw))
-        py = max(0, min(py, img.height - th))
-        if mode == "single" or mode == "center":
-            draw.text((px, py), text, font=f, fill=fill, stroke_width=2, stroke_fill=stroke_fill)
-        else:
-            step = max(20, spacing)
-            for yy in range(0, img.height + step, step):
-                for xx in range(0, img.width + step, step):
-                    draw.text((xx, yy), text, font=f, fill=fill, stroke_width=2, stroke_fill=stroke_fill)
-        if angle != 0.0 or mode == "diagonal":
-            ang = angle if angle != 0.0 else 30.0
-            txt_layer = txt_layer.rotate(ang, expand=False)
-        out = Image.alpha_composite(img, txt_layer)
-        b64 = _encode_image(out.convert("RGB"), "WEBP", quality=80)
-        aid = _put_artifact(b64)
+        path = upload_path(filename)
+        img = Image.open(path)
+        out = _apply_text_watermark(img, text, x, y, opacity, font_size, color, stroke_color, mode, spacing, angle, align, font_path)
+        data = _encode_image(out.convert("RGB"), "WEBP", quality=80)
+        aid = _put_artifact(data, "image/webp")
         return f"Text watermark added. [IMAGE_ID:{aid}:webp]"
     except Exception as e:
         return f"Error adding text watermark: {str(e)}"
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
 
 @tool
 def image_add_image_watermark_upload(
@@ -447,58 +518,16 @@ def image_add_image_watermark_upload(
     try:
         if not (_allowed(filename) and _allowed(watermark_filename)):
             return "Error: File not allowed (not in current session uploads)"
-        base_path = os.path.join("uploads", filename)
-        wm_path = os.path.join("uploads", watermark_filename)
-        base = Image.open(base_path).convert("RGBA")
-        wm = Image.open(wm_path).convert("RGBA")
-        if scale != 1.0:
-            w = int(max(1, wm.width * scale))
-            h = int(max(1, wm.height * scale))
-            wm = wm.resize((w, h))
-        alpha = wm.split()[3]
-        alpha = alpha.point(lambda p: int(p * max(0.0, min(1.0, opacity))))
-        wm.putalpha(alpha)
-        if angle != 0.0:
-            wm = wm.rotate(angle, expand=True)
-        overlay = Image.new("RGBA", base.size)
-        overlay.putalpha(0)
-        if mode == "single" or mode == "center":
-            px, py = x, y
-            if mode == "center" or align == "center":
-                px = (base.width - wm.width) // 2
-                py = (base.height - wm.height) // 2
-            else:
-                if align == "rt":
-                    px = base.width - wm.width - x
-                    py = y
-                elif align == "rb":
-                    px = base.width - wm.width - x
-                    py = base.height - wm.height - y
-                elif align == "lb":
-                    px = x
-                    py = base.height - wm.height - y
-            px = max(0, min(px, base.width - wm.width))
-            py = max(0, min(py, base.height - wm.height))
-            overlay.paste(wm, (px, py), wm)
-        else:
-            step = max(10, spacing)
-            for yy in range(0, base.height + step, step):
-                for xx in range(0, base.width + step, step):
-                    overlay.paste(wm, (xx, yy), wm)
-            if mode == "diagonal" and angle == 0.0:
-                overlay = overlay.rotate(30.0, expand=False)
-        out = Image.alpha_composite(base, overlay)
-        b64 = _encode_image(out.convert("RGB"), "WEBP", quality=80)
-        aid = _put_artifact(b64)
+        base_path = upload_path(filename)
+        wm_path = upload_path(watermark_filename)
+        base = Image.open(base_path)
+        wm = Image.open(wm_path)
+        out = _apply_image_watermark(base, wm, x, y, opacity, scale, mode, spacing, angle, align)
+        data = _encode_image(out.convert("RGB"), "WEBP", quality=80)
+        aid = _put_artifact(data, "image/webp")
         return f"Image watermark added. [IMAGE_ID:{aid}:webp]"
     except Exception as e:
         return f"Error adding image watermark: {str(e)}"
-    finally:
-        for p in (base_path, wm_path):
-            try:
-                os.remove(p)
-            except Exception:
-                pass
 
 @tool
 def image_remove_watermark_upload(
@@ -515,61 +544,132 @@ def image_remove_watermark_upload(
     try:
         if not _allowed(filename):
             return "Error: File not allowed (not in current session uploads)"
-        path = os.path.join("uploads", filename)
+        path = upload_path(filename)
         img = Image.open(path).convert("RGBA")
-        box = (x, y, x + width, y + height)
+        out_img = _apply_remove_watermark(img, x, y, width, height, method, strength, feather)
+        data = _encode_image(out_img.convert("RGB"), "WEBP", quality=80)
+        aid = _put_artifact(data, "image/webp")
+        return f"Watermark removed. [IMAGE_ID:{aid}:webp]"
+    except Exception as e:
+        return f"Error removing watermark: {str(e)}"
+def _histogram_percentile(hist, q: float, default: int = 32) -> int:
+    """Value at index int(N * q) of the sorted pixels, read from a 256-bin histogram."""
+    total = sum(hist)
+    if not total:
+        return default
+    k = int(total * q)
+    acc = 0
+    for v, c in enumerate(hist):
+        acc += c
+        if acc > k:
+            return v
+    return len(hist) - 1
+
+def _threshold_lut(thr: int):
+    return [255 if p >= thr else 0 for p in range(256)]
+
+def _median_background(gray: Image.Image, size: int) -> Image.Image:
+    # PIL's MedianFilter cost grows with size**2; beyond a small kernel, filter a downscaled
+    # copy with the equivalent kernel and scale the smooth background back up.
+    if size <= 7:
+        return gray.filter(ImageFilter.MedianFilter(size=size))
+    factor = max(1, size // 5)
+    small = gray.resize((max(1, gray.width // factor), max(1, gray.height // factor)), resample=Image.BOX)
+    small_size = max(3, (size // factor) | 1)
+    small = small.filter(ImageFilter.MedianFilter(size=small_size))
+    return small.resize(gray.size, resample=Image.BILINEAR)
+
+def _apply_auto_remove_watermark(img: Image.Image, prefer: str = "auto") -> Image.Image:
+    img = img.convert("RGBA")
+    rgb = img.convert("RGB")
+    gray = rgb.convert("L")
+    # median background; large kernels run on a downscaled copy (the background is smooth anyway)
+    size = max(5, (min(img.width, img.height) // 100) * 2 + 1)
+    med = _median_background(gray, size)
+    pos = ImageChops.subtract(gray, med)
+    neg = ImageChops.subtract(med, gray)
+    # Percentiles and pixel counts come from 256-bin histograms instead of sorting every pixel
+    hist = [a + b for a, b in zip(pos.histogram(), neg.histogram())]
+    thr = _histogram_percentile(hist, 0.92)
+    m1 = pos.point(_threshold_lut(thr))
+    m2 = neg.point(_threshold_lut(thr))
+    edges = gray.filter(ImageFilter.FIND_EDGES)
+    thr_e = _histogram_percentile(edges.histogram(), 0.85)
+    m3 = edges.point(_threshold_lut(thr_e))
+    merged = ImageChops.lighter(ImageChops.lighter(m1, m2), m3)
+    # Two 3x3 max filters == one 5x5 dilation; on a binary mask BoxBlur(2) + "any" threshold is identical and ~10x faster
+    merged = merged.filter(ImageFilter.BoxBlur(2)).point([0] + [255] * 255)
+    # mask fraction to decide strategy
+    cnt = img.width * img.height - merged.histogram()[0]
+    frac = cnt / float(img.width * img.height)
+    bbox = merged.getbbox()
+    if not bbox:
+        # Fallback: common logo position at bottom-right
+        bx1 = int(img.width * 0.65)
+        by1 = int(img.height * 0.65)
+        bx2 = int(img.width * 0.95)
+        by2 = int(img.height * 0.95)
+        bbox = (bx1, by1, bx2, by2)
+    x1, y1, x2, y2 = bbox
+    w = max(1, x2 - x1)
+    h = max(1, y2 - y1)
+    if frac > 0.3:
+        # likely tiled watermark: apply median to entire image and blend by mask
+        # Only the mask's bounding box (plus blur margin) needs the median; outside it the mask is 0
+        pad = 12
+        region_box = (max(0, x1 - pad), max(0, y1 - pad), min(img.width, x2 + pad), min(img.height, y2 + pad))
+        med_img = img.copy()
+        med_img.paste(rgb.crop(region_box).filter(ImageFilter.MedianFilter(size=5)).convert("RGBA"), region_box[:2])
+        soft_mask = merged.filter(ImageFilter.GaussianBlur(radius=6))
+        out_img = Image.composite(med_img, img, soft_mask)
+    else:
+        method = "median"
+        feather = 6
+        strength = max(5, min(25, (w + h) // 40))
+        if prefer == "clone" or (prefer == "auto" and (x1 < img.width * 0.1 or y1 < img.height * 0.1 or x2 > img.width * 0.9 or y2 > img.height * 0.9)):
+            method = "clone_left" if x1 > img.width // 2 else "clone_top"
+        elif prefer == "blur":
+            method = "blur"
+        else:
+            method = "median"
+        box = (x1, y1, x1 + w, y1 + h)
         region = img.crop(box)
-        strength = max(1, strength)
         if method == "blur":
             region = region.filter(ImageFilter.GaussianBlur(radius=strength))
-        elif method == "pixelate":
-            small = region.resize((max(1, width // max(1, strength)), max(1, height // max(1, strength))), resample=Image.NEAREST)
-            region = small.resize((width, height), resample=Image.NEAREST)
         elif method == "median":
-            size = strength if strength % 2 == 1 else strength + 1
-            region = region.filter(ImageFilter.MedianFilter(size=size))
+            size2 = strength if strength % 2 == 1 else strength + 1
+            region = region.filter(ImageFilter.MedianFilter(size=size2))
         elif method in ("clone_left", "clone_top"):
             src_img = img.copy()
             if method == "clone_left":
-                sx = max(0, x - width)
-                sy = y
-                src_box = (sx, sy, sx + width, sy + height)
+                sx = max(0, x1 - w)
+                sy = y1
+                src_box = (sx, sy, sx + w, sy + h)
             else:
-                sx = x
-                sy = max(0, y - height)
-                src_box = (sx, sy, sx + width, sy + height)
+                sx = x1
+                sy = max(0, y1 - h)
+                src_box = (sx, sy, sx + w, sy + h)
             sx1, sy1, sx2, sy2 = src_box
             sx1 = max(0, min(sx1, src_img.width))
             sy1 = max(0, min(sy1, src_img.height))
             sx2 = max(0, min(sx2, src_img.width))
             sy2 = max(0, min(sy2, src_img.height))
-            src_box = (sx1, sy1, sx2, sy2)
-            sample = src_img.crop(src_box)
-            if sample.size != (width, height):
-                sample = sample.resize((width, height))
+            sample = src_img.crop((sx1, sy1, sx2, sy2))
+            if sample.size != (w, h):
+                sample = sample.resize((w, h))
             region = sample
         out_img = img.copy()
-        out_img.paste(region, (x, y))
+        out_img.paste(region, (x1, y1))
         if feather > 0:
             mask = Image.new("L", img.size, 0)
             mdraw = ImageDraw.Draw(mask)
-            mdraw.rectangle([x, y, x + width, y + height], fill=255)
+            mdraw.rectangle([x1, y1, x1 + w, y1 + h], fill=255)
             mask = mask.filter(ImageFilter.GaussianBlur(radius=feather))
             out_img = Image.composite(out_img, img, mask)
-        b64 = _encode_image(out_img.convert("RGB"), "WEBP", quality=80)
-        aid = _put_artifact(b64)
-        return f"Watermark removed. [IMAGE_ID:{aid}:webp]"
-    except Exception as e:
-        return f"Error removing watermark: {str(e)}"
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
+    return out_img
+
 def _allowed(filename: str) -> bool:
-    allowed = os.environ.get("CURRENT_SESSION_UPLOADS", "")
-    names = [x.strip() for x in re.split(r"[;,]", allowed) if x.strip()]
-    return filename in names
+    return filename in current_session_uploads()
 
 @tool
 def image_auto_remove_watermark_upload(
@@ -579,102 +679,237 @@ def image_auto_remove_watermark_upload(
     """Automatically detect and remove watermark from an uploaded image; return base64 (WEBP).
     - Heuristics: detect high-frequency residual against median background; threshold to get candidate mask.
     - If mask found and near edges, prefer cloning from adjacent area; otherwise median filter with feather.
-    - Only operates on current session uploads and deletes source after processing.
+    - Only operates on current session uploads; the source stays available for further tools.
     """
     try:
         if not _allowed(filename):
             return "Error: File not allowed (not in current session uploads)"
-        path = os.path.join("uploads", filename)
-        img = Image.open(path).convert("RGBA")
-        rgb = img.convert("RGB")
-        gray = rgb.convert("L")
-        # median background
-        size = max(5, (min(img.width, img.height) // 100) * 2 + 1)
-        med = gray.filter(ImageFilter.MedianFilter(size=size))
-        pos = ImageChops.subtract(gray, med)
-        neg = ImageChops.subtract(med, gray)
-        vals = list(pos.getdata()) + list(neg.getdata())
-        vals.sort()
-        thr = vals[int(len(vals) * 0.92)] if vals else 32
-        m1 = pos.point(lambda p: 255 if p >= thr else 0)
-        m2 = neg.point(lambda p: 255 if p >= thr else 0)
-        edges = gray.filter(ImageFilter.FIND_EDGES)
-        ve = list(edges.getdata())
-        ve.sort()
-        thr_e = ve[int(len(ve) * 0.85)] if ve else 32
-        m3 = edges.point(lambda p: 255 if p >= thr_e else 0)
-        merged = ImageChops.lighter(ImageChops.lighter(m1, m2), m3)
-        merged = merged.filter(ImageFilter.MaxFilter(size=3)).filter(ImageFilter.MaxFilter(size=3))
-        # mask fraction to decide strategy
-        cnt = sum(1 for v in merged.getdata() if v)
-        frac = cnt / float(img.width * img.height)
-        bbox = merged.getbbox()
-        if not bbox:
-            # Fallback: common logo position at bottom-right
-            bx1 = int(img.width * 0.65)
-            by1 = int(img.height * 0.65)
-            bx2 = int(img.width * 0.95)
-            by2 = int(img.height * 0.95)
-            bbox = (bx1, by1, bx2, by2)
-        x1, y1, x2, y2 = bbox
-        w = max(1, x2 - x1)
-        h = max(1, y2 - y1)
-        if frac > 0.3:
-            # likely tiled watermark: apply median to entire image and blend by mask
-            med_img = rgb.filter(ImageFilter.MedianFilter(size=5)).convert("RGBA")
-            soft_mask = merged.filter(ImageFilter.GaussianBlur(radius=6))
-            out_img = Image.composite(med_img, img, soft_mask)
-        else:
-            method = "median"
-            feather = 6
-            strength = max(5, min(25, (w + h) // 40))
-            if prefer == "clone" or (prefer == "auto" and (x1 < img.width * 0.1 or y1 < img.height * 0.1 or x2 > img.width * 0.9 or y2 > img.height * 0.9)):
-                method = "clone_left" if x1 > img.width // 2 else "clone_top"
-            elif prefer == "blur":
-                method = "blur"
-            else:
-                method = "median"
-            box = (x1, y1, x1 + w, y1 + h)
-            region = img.crop(box)
-            if method == "blur":
-                region = region.filter(ImageFilter.GaussianBlur(radius=strength))
-            elif method == "median":
-                size2 = strength if strength % 2 == 1 else strength + 1
-                region = region.filter(ImageFilter.MedianFilter(size=size2))
-            elif method in ("clone_left", "clone_top"):
-                src_img = img.copy()
-                if method == "clone_left":
-                    sx = max(0, x1 - w)
-                    sy = y1
-                    src_box = (sx, sy, sx + w, sy + h)
-                else:
-                    sx = x1
-                    sy = max(0, y1 - h)
-                    src_box = (sx, sy, sx + w, sy + h)
-                sx1, sy1, sx2, sy2 = src_box
-                sx1 = max(0, min(sx1, src_img.width))
-                sy1 = max(0, min(sy1, src_img.height))
-                sx2 = max(0, min(sx2, src_img.width))
-                sy2 = max(0, min(sy2, src_img.height))
-                sample = src_img.crop((sx1, sy1, sx2, sy2))
-                if sample.size != (w, h):
-                    sample = sample.resize((w, h))
-                region = sample
-            out_img = img.copy()
-            out_img.paste(region, (x1, y1))
-            if feather > 0:
-                mask = Image.new("L", img.size, 0)
-                mdraw = ImageDraw.Draw(mask)
-                mdraw.rectangle([x1, y1, x1 + w, y1 + h], fill=255)
-                mask = mask.filter(ImageFilter.GaussianBlur(radius=feather))
-                out_img = Image.composite(out_img, img, mask)
-        b64 = _encode_image(out_img.convert("RGB"), "WEBP", quality=80)
-        aid = _put_artifact(b64)
+        path = upload_path(filename)
+        img = Image.open(path)
+        out_img = _apply_auto_remove_watermark(img, prefer)
+        data = _encode_image(out_img.convert("RGB"), "WEBP", quality=80)
+        aid = _put_artifact(data, "image/webp")
         return f"Watermark auto-removed. [IMAGE_ID:{aid}:webp]"
     except Exception as e:
         return f"Error auto-removing watermark: {str(e)}"
-    finally:
+
+def _pipeline_image_watermark(img: Image.Image, watermark_data: bytes, **kwargs) -> Image.Image:
+    with Image.open(io.BytesIO(watermark_data)) as wm:
+        return _apply_image_watermark(img, wm, **kwargs)
+
+def _resolve_pipeline_operations(operations):
+    """Check session access for watermark files and inline their bytes, so the steps are
+    self-contained and can run in a worker process without the session's upload state.
+    """
+    resolved = []
+    for step in operations or []:
+        step = dict(step)
+        if str(step.get("op", "")).lower() == "image_watermark":
+            name = step.pop("watermark_filename", "")
+            if not _allowed(name):
+                raise ValueError(f"watermark file '{name}' not in current session uploads")
+            with open(upload_path(name), "rb") as f:
+                step["watermark_data"] = f.read()
+        resolved.append(step)
+    return resolved
+
+_PIPELINE_OPS = {
+    "crop": lambda img, x, y, width, height: img.crop((x, y, x + width, y + height)),
+    "resize": lambda img, width, height: img.resize((width, height)),
+    "rotate": lambda img, angle, expand=True: img.rotate(angle, expand=expand),
+    "text_watermark": _apply_text_watermark,
+    "image_watermark": _pipeline_image_watermark,
+    "remove_watermark": _apply_remove_watermark,
+    "auto_remove_watermark": _apply_auto_remove_watermark,
+}
+
+def _run_pipeline(img: Image.Image, operations, fmt: str = "WEBP", quality: int = 80):
+    """Apply operations to an in-memory image. 'compress'/'convert' steps only change the final
+    encoding, so the image is encoded exactly once by the caller. Returns (image, format, quality, op names).
+    """
+    names = []
+    for i, step in enumerate(operations or []):
+        params = dict(step)
+        op = str(params.pop("op", "")).lower()
         try:
-            os.remove(path)
-        except Exception:
-            pass
+            if op in ("compress", "convert"):
+                fmt = str(params.get("format", fmt)).upper()
+                quality = int(params.get("quality", quality))
+            elif op in _PIPELINE_OPS:
+                img = _PIPELINE_OPS[op](img, **params)
+            else:
+                raise ValueError(f"unknown op, expected one of {sorted(list(_PIPELINE_OPS) + ['compress'])}")
+        except Exception as e:
+            raise ValueError(f"step {i + 1} ({op or '?'}): {e}")
+        names.append(op)
+    if fmt not in ("WEBP", "JPEG", "PNG"):
+        raise ValueError(f"unsupported output format '{fmt}'")
+    return img, fmt, quality, names
+
+@tool
+def image_pipeline_upload(
+    filename: str,
+    operations: List[Dict[str, Any]],
+    format: Literal["WEBP", "JPEG", "PNG"] = "WEBP",
+    quality: int = 80,
+) -> str:
+    """Apply several edits to one uploaded image in a single call (one decode, one encode); return base64.
+    Prefer this over chaining several image_*_upload calls for compound edits.
+    operations: ordered list of {"op": <name>, ...params}; params match the image_*_upload tools:
+    - crop: x, y, width, height
+    - resize: width, height
+    - rotate: angle, expand
+    - text_watermark: text, x, y, opacity, font_size, color, stroke_color, mode, spacing, angle, align, font_path
+    - image_watermark: watermark_filename, x, y, opacity, scale, mode, spacing, angle, align
+    - remove_watermark: x, y, width, height, method, strength, feather
+    - auto_remove_watermark: prefer
+    - compress: quality, format (JPEG | WEBP | PNG; sets the final encoding)
+    Example: [{"op": "crop", "x": 0, "y": 0, "width": 800, "height": 600}, {"op": "rotate", "angle": 90},
+              {"op": "text_watermark", "text": "DRAFT", "mode": "tile"}, {"op": "compress", "quality": 70, "format": "JPEG"}]
+    """
+    try:
+        if not _allowed(filename):
+            return "Error: File not allowed (not in current session uploads)"
+        img = Image.open(upload_path(filename))
+        out, fmt, q, names = _run_pipeline(img, _resolve_pipeline_operations(operations), format.upper(), quality)
+        if fmt == "PNG" and out.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            out = out.convert("RGBA")
+        data = _encode_image(out, fmt, quality=q)
+        mime = fmt.lower()
+        aid = _put_artifact(data, f"image/{mime}")
+        return f"Pipeline applied ({' -> '.join(names) or 'no-op'}). [IMAGE_ID:{aid}:{mime}]"
+    except Exception as e:
+        return f"Error running image pipeline: {str(e)}"
+
+_BATCH_POOL = None
+_BATCH_POOL_LOCK = threading.Lock()
+
+def _batch_pool() -> ProcessPoolExecutor:
+    # One long-lived pool sized to the machine; "spawn" avoids forking the threaded server process.
+    global _BATCH_POOL
+    with _BATCH_POOL_LOCK:
+        if _BATCH_POOL is None:
+            workers = int(os.environ.get("IMAGE_BATCH_WORKERS", 0)) or os.cpu_count() or 1
+            _BATCH_POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _BATCH_POOL
+
+def _discard_batch_pool(pool: ProcessPoolExecutor):
+    # A worker that died (e.g. OOM-killed on a huge image) leaves the pool broken for good;
+    # drop it so the next _batch_pool() call starts a fresh one.
+    global _BATCH_POOL
+    with _BATCH_POOL_LOCK:
+        if _BATCH_POOL is pool:
+            _BATCH_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _batch_worker(name: str, path: str, operations, fmt: str, quality: int):
+    """Runs in a worker process: decode, apply the pipeline, encode. Returns (name, bytes, format, error)."""
+    try:
+        with Image.open(path) as img:
+            out, out_fmt, q, _ = _run_pipeline(img, operations, fmt, quality)
+            if out_fmt == "PNG" and out.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+                out = out.convert("RGBA")
+            return name, _encode_image(out, out_fmt, quality=q), out_fmt, ""
+    except Exception as e:
+        return name, b"", fmt, str(e)
+
+def _report_progress(payload: dict):
+    """Emit a progress event on the graph's 'custom' stream; a no-op outside a graph run."""
+    try:
+        from langgraph.config import get_stream_writer
+        get_stream_writer()(payload)
+    except Exception:
+        pass
+
+_IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif")
+
+def _zip_entry_names(items):
+    """ZIP entry names for (source filename, output ext) pairs. Sources that would map to the same
+    name (a.png and a.jpg both becoming a.webp) keep their source extension in the stem, and any
+    name still taken gets a numeric suffix, so no image is overwritten in the archive."""
+    plain = [f"{os.path.splitext(name)[0]}.{ext}" for name, ext in items]
+    counts = {}
+    for entry in plain:
+        counts[entry] = counts.get(entry, 0) + 1
+    used, out = set(), []
+    for (name, ext), entry in zip(items, plain):
+        if counts[entry] > 1:
+            stem, src_ext = os.path.splitext(name)
+            entry = f"{stem}_{src_ext.lstrip('.').lower() or 'img'}.{ext}"
+        base, n = entry, 2
+        while entry.lower() in used:
+            entry = f"{os.path.splitext(base)[0]}-{n}.{ext}"
+            n += 1
+        used.add(entry.lower())
+        out.append(entry)
+    return out
+
+@tool
+def image_batch_pipeline_upload(
+    operations: List[Dict[str, Any]],
+    filenames: List[str] = None,
+    pattern: str = "",
+    format: Literal["WEBP", "JPEG", "PNG"] = "WEBP",
+    quality: int = 80,
+) -> str:
+    """Apply the same image_pipeline_upload operations to many uploaded images in parallel; returns one ZIP.
+    - operations: same format as image_pipeline_upload (e.g. [{"op": "text_watermark", "text": "SAMPLE", "mode": "tile"}]).
+    - filenames: explicit list of uploads; or pattern: a glob over current uploads (e.g. "*.jpg").
+      With neither, every uploaded image is processed.
+    Use this instead of calling an image tool once per file.
+    """
+    try:
+        allowed = current_session_uploads()
+        if filenames:
+            names = list(dict.fromkeys(filenames))
+        elif pattern:
+            names = [n for n in allowed if fnmatch.fnmatch(n, pattern)]
+        else:
+            names = [n for n in allowed if n.lower().endswith(_IMAGE_EXTS)]
+        if not names:
+            return "Error: No matching uploaded images."
+        denied = [n for n in names if not _allowed(n)]
+        if denied:
+            return f"Error: File not allowed (not in current session uploads): {', '.join(denied)}"
+        ops = _resolve_pipeline_operations(operations)
+        fmt = format.upper()
+        total = len(names)
+        pending = dict.fromkeys(names)
+        results, errors = [], []
+        # A broken pool is replaced and the unfinished images are retried once
+        for attempt in range(2):
+            pool = _batch_pool()
+            try:
+                futures = [
+                    pool.submit(_batch_worker, n, os.path.abspath(upload_path(n)), ops, fmt, quality)
+                    for n in pending
+                ]
+                for fut in as_completed(futures):
+                    name, data, out_fmt, err = fut.result()
+                    del pending[name]
+                    if err:
+                        errors.append(f"- {name}: {err}")
+                    else:
+                        results.append((name, data, out_fmt))
+                    _report_progress({"tool": "image_batch_pipeline_upload", "file": name, "done": total - len(pending), "total": total, "error": err})
+                break
+            except BrokenProcessPool:
+                _discard_batch_pool(pool)
+        errors.extend(f"- {name}: worker process died" for name in pending)
+        if not results:
+            return "Error: All images failed.\n" + "\n".join(errors)
+        buf = io.BytesIO()
+        # Encoded images do not compress further; store them to keep zipping cheap
+        with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as zf:
+            results.sort()
+            entries = _zip_entry_names([(name, "jpg" if out_fmt == "JPEG" else out_fmt.lower()) for name, _, out_fmt in results])
+            for entry, (_, data, _) in zip(entries, results):
+                zf.writestr(entry, data)
+        aid = _put_artifact(buf.getvalue(), "application/zip")
+        out = [f"Processed {len(results)}/{total} images."]
+        if errors:
+            out.append("Failed:")
+            out.extend(errors)
+        return "\n".join(out) + f"\n[FILE_ID:{aid}:zip:images_batch.zip]"
+    except Exception as e:
+        return f"Error running batch image pipeline: {str(e)}"
@@ -1,12 +1,18 @@
 import os
-import re
 import io
-import base64
-import uuid
 import pandas as pd
+from typing import Literal
 from langchain_core.tools import tool
+from src.core.uploads import upload_path
+from src.core.session import current_session_uploads
+from src.core.artifacts import put_artifact as _put_artifact, get_artifact
+from src.core.tables import load_table_cached, parse_table as _parse_table
+from src.core.profiling import streaming_profile
+from src.core.fonts import matplotlib_font_families
+from src.core.governor import max_chars as _max_output_chars
 import subprocess
 import shutil
+import tempfile
 import zipfile
 import xml.etree.ElementTree as ET
 import matplotlib
@@ -15,81 +21,85 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 
 # Configure fonts for Chinese support
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'SimSun', 'Arial', 'sans-serif']
+plt.rcParams['font.sans-serif'] = matplotlib_font_families()
 plt.rcParams['axes.unicode_minus'] = False
 
 def _allowed(filename: str) -> bool:
-    allowed = os.environ.get("CURRENT_SESSION_UPLOADS", "")
-    names = [x.strip() for x in re.split(r"[;,]", allowed) if x.strip()]
-    return filename in names
-
-ARTIFACT_CACHE = {}
-
-def _put_artifact(data: str) -> str:
-    k = uuid.uuid4().hex
-    ARTIFACT_CACHE[k] = data
-    return k
-
-def get_artifact(key: str) -> str:
-    return ARTIFACT_CACHE.get(key, "")
+    return filename in current_session_uploads()
 
 @tool
 def excel_to_csv_from_upload(filename: str, return_base64: bool = False) -> str:
     """Convert an uploaded Excel file to CSV and return content or Base64.
-    The file must exist in 'uploads/' directory.
+    The file must exist in 'uploads/' directory. Large results are returned as a downloadable
+    file with the schema and first rows instead of the full CSV text.
     """
     if not _allowed(filename):
         return "Error: File not allowed (not in current session uploads)"
-    path = os.path.join("uploads", filename)
+    path = upload_path(filename)
     if not os.path.exists(path):
         return "Error: File not found in uploads/"
     try:
         df = pd.read_excel(path)
         csv_str = df.to_csv(index=False)
+        out_name = f"{os.path.splitext(filename)[0]}.csv"
         if return_base64:
-            b64 = base64.b64encode(csv_str.encode('utf-8')).decode('utf-8')
-            aid = _put_artifact(b64)
-            return f"Converted successfully. [FILE_ID:{aid}:csv:{os.path.splitext(filename)[0]}.csv]"
-        return csv_str
+            aid = _put_artifact(csv_str.encode('utf-8'), "text/csv")
+            return f"Converted successfully. [FILE_ID:{aid}:csv:{out_name}]"
+        if len(csv_str) <= _max_output_chars():
+            return csv_str
+        aid = _put_artifact(csv_str.encode('utf-8'), "text/csv")
+        schema = ", ".join(f"{c} ({t})" for c, t in df.dtypes.astype(str).items())
+        return (
+            f"Converted {len(df)} rows x {len(df.columns)} columns ({len(csv_str)} chars of CSV). "
+            f"Columns: {schema}\nFirst rows:\n{df.head(5).to_csv(index=False)}"
+            f"[FILE_ID:{aid}:csv:{out_name}]"
+        )
     except Exception as e:
         return f"Error converting Excel to CSV: {str(e)}"
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
 
 def _load_table_from_upload(filename: str):
-    path = os.path.join("uploads", filename)
+    path = upload_path(filename)
     ext = os.path.splitext(filename)[1].lower()
-    if ext in (".xlsx", ".xls"):
-        df = pd.read_excel(path)
-    elif ext == ".csv":
-        try:
-            df = pd.read_csv(path)
-        except UnicodeDecodeError:
-            df = pd.read_csv(path, encoding="gbk")
-    else:
+    if ext not in (".xlsx", ".xls", ".csv"):
         raise RuntimeError("Unsupported file type. Please upload Excel or CSV.")
+    # Parsed once per file content; later calls hit the in-memory or sidecar cache
+    df = load_table_cached(path, _parse_table)
     return df, path
 
 @tool
-def table_basic_profile_from_upload(filename: str) -> str:
-    """Generate a basic profile (dtypes, missing, unique, numeric stats) for an uploaded Excel/CSV."""
+def table_basic_profile_from_upload(filename: str, mode: Literal["auto", "full", "streaming"] = "auto") -> str:
+    """Generate a basic profile (dtypes, missing, unique, numeric stats) for an uploaded Excel/CSV.
+    - mode: auto | full | streaming. 'auto' streams CSVs larger than PROFILE_STREAMING_THRESHOLD_BYTES
+      (default 200 MB) in chunks with bounded memory; unique counts and quartiles are then approximate.
+    """
     try:
         if not _allowed(filename):
             return "Error: File not allowed (not in current session uploads)"
-        df, path = _load_table_from_upload(filename)
+        path = upload_path(filename)
+        ext = os.path.splitext(filename)[1].lower()
+        threshold = int(os.environ.get("PROFILE_STREAMING_THRESHOLD_BYTES", 200 * 1024 * 1024))
+        streaming = ext == ".csv" and (mode == "streaming" or (mode == "auto" and os.path.getsize(path) > threshold))
         
-        rows, cols = df.shape
-        dtypes = df.dtypes.astype(str).to_dict()
-        miss = df.isna().sum().to_dict()
-        uniq = {c: int(df[c].nunique()) for c in df.columns}
-        nums = df.select_dtypes(include=["number"])
-        desc = nums.describe().to_csv() if not nums.empty else "No numeric columns."
+        if streaming:
+            try:
+                rows, cols, dtypes, miss, uniq, nums = streaming_profile(path)
+            except UnicodeDecodeError:
+                rows, cols, dtypes, miss, uniq, nums = streaming_profile(path, encoding="gbk")
+        else:
+            df, path = _load_table_from_upload(filename)
+            rows, cols = df.shape
+            dtypes = df.dtypes.astype(str).to_dict()
+            miss = df.isna().sum().to_dict()
+            uniq = {c: int(df[c].nunique()) for c in df.columns}
+            nums = df.select_dtypes(include=["number"])
+            if not nums.empty:
+                nums = nums.describe()
+        desc = nums.to_csv() if not nums.empty else "No numeric columns."
         
         out = []
         out.append(f"Rows: {rows}, Cols: {cols}")
+        if streaming:
+            out.append("(Streaming profile: unique counts and quartiles are approximate.)")
         out.append("\nData Types:")
         for k, v in dtypes.items():
             out.append(f"- {k}: {v}")
@@ -105,17 +115,12 @@ def table_basic_profile_from_upload(filename: str) -> str:
             out.append(f"- {k}: {v}")
             
         # Save numeric summary as artifact
-        aid = _put_artifact(base64.b64encode(desc.encode("utf-8")).decode("utf-8"))
+        aid = _put_artifact(desc.encode("utf-8"), "text/csv")
         name = os.path.splitext(filename)[0] + "_numeric_summary.csv"
         
         return "\n".join(out) + f"\n\n[FILE_ID:{aid}:csv:{name}]"
     except Exception as e:
         return f"Error profiling table: {str(e)}"
-    finally:
-        try:
-            os.remove(os.path.join("uploads", filename))
-        except Exception:
-            pass
 
 @tool
 def table_value_counts_from_upload(filename: str, column: str) -> str:
@@ -129,18 +134,13 @@ def table_value_counts_from_upload(filename: str, column: str) -> str:
             return f"Error: Column '{column}' not found. Available columns: {list(df.columns)}"
             
         vc = df[column].value_counts().to_csv()
-        aid = _put_artifact(base64.b64encode(vc.encode("utf-8")).decode("utf-8"))
+        aid = _put_artifact(vc.encode("utf-8"), "text/csv")
         name = os.path.splitext(filename)[0] + f"_{column}_counts.csv"
         
         top_5 = df[column].value_counts().head(5).to_string()
         return f"Top 5 values for '{column}':\n{top_5}\n\nFull counts available: [FILE_ID:{aid}:csv:{name}]"
     except Exception as e:
         return f"Error getting value counts: {str(e)}"
-    finally:
-        try:
-            os.remove(os.path.join("uploads", filename))
-        except Exception:
-            pass
 
 @tool
 def table_correlation_from_upload(filename: str) -> str:
@@ -156,17 +156,12 @@ def table_correlation_from_upload(filename: str) -> str:
             
         corr = nums.corr()
         csv_out = corr.to_csv()
-        aid = _put_artifact(base64.b64encode(csv_out.encode("utf-8")).decode("utf-8"))
+        aid = _put_artifact(csv_out.encode("utf-8"), "text/csv")
         name = os.path.splitext(filename)[0] + "_correlation.csv"
         
         return f"Correlation matrix calculated. [FILE_ID:{aid}:csv:{name}]"
     except Exception as e:
         return f"Error calculating correlation: {str(e)}"
-    finally:
-        try:
-            os.remove(os.path.join("uploads", filename))
-        except Exception:
-            pass
 
 @tool
 def table_filter_query_from_upload(filename: str, query: str) -> str:
@@ -182,17 +177,12 @@ def table_filter_query_from_upload(filename: str, query: str) -> str:
             return f"Error executing query '{query}': {str(qe)}"
             
         csv_out = filtered.to_csv(index=False)
-        aid = _put_artifact(base64.b64encode(csv_out.encode("utf-8")).decode("utf-8"))
+        aid = _put_artifact(csv_out.encode("utf-8"), "text/csv")
         name = os.path.splitext(filename)[0] + "_filtered.csv"
         
         return f"Filtered {len(filtered)} rows (from {len(df)}). [FILE_ID:{aid}:csv:{name}]"
     except Exception as e:
         return f"Error filtering table: {str(e)}"
-    finally:
-        try:
-            os.remove(os.path.join("uploads", filename))
-        except Exception:
-            pass
 
 @tool
 def table_outliers_from_upload(filename: str, column: str) -> str:
@@ -216,17 +206,12 @@ def table_outliers_from_upload(filename: str, column: str) -> str:
         outliers = df[(df[column] < lower) | (df[column] > upper)]
         
         csv_out = outliers.to_csv(index=False)
-        aid = _put_artifact(base64.b64encode(csv_out.encode("utf-8")).decode("utf-8"))
+        aid = _put_artifact(csv_out.encode("utf-8"), "text/csv")
         name = os.path.splitext(filename)[0] + f"_{column}_outliers.csv"
         
         return f"Found {len(outliers)} outliers in '{column}' (bounds: {lower:.2f}, {upper:.2f}). [FILE_ID:{aid}:csv:{name}]"
     except Exception as e:
         return f"Error detecting outliers: {str(e)}"
-    finally:
-        try:
-            os.remove(os.path.join("uploads", filename))
-        except Exception:
-            pass
 
 @tool
 def table_pivot_from_upload(filename: str, index: str, columns: str, values: str, aggfunc: str = "mean") -> str:
@@ -239,33 +224,26 @@ def table_pivot_from_upload(filename: str, index: str, columns: str, values: str
         pivot = df.pivot_table(index=index, columns=columns, values=values, aggfunc=aggfunc)
         
         csv_out = pivot.to_csv()
-        aid = _put_artifact(base64.b64encode(csv_out.encode("utf-8")).decode("utf-8"))
+        aid = _put_artifact(csv_out.encode("utf-8"), "text/csv")
         name = os.path.splitext(filename)[0] + "_pivot.csv"
         
         return f"Pivot table created. [FILE_ID:{aid}:csv:{name}]"
     except Exception as e:
         return f"Error creating pivot table: {str(e)}"
-    finally:
-        try:
-            os.remove(os.path.join("uploads", filename))
-        except Exception:
-            pass
 
 def _save_plot_to_artifact(filename_prefix: str, chart_type: str = "chart") -> str:
-    """Save current matplotlib figure to base64 artifact and return formatted string (display + download)."""
+    """Save current matplotlib figure as a PNG artifact and return markers for display + download."""
     buf = io.BytesIO()
     plt.savefig(buf, format='png', bbox_inches='tight')
     plt.close()
-    buf.seek(0)
-    b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-    aid = _put_artifact(b64)
+    aid = _put_artifact(buf.getvalue(), "image/png")
     
     # Generate a safe filename for download
     safe_name = os.path.splitext(filename_prefix)[0]
     out_name = f"{safe_name}_{chart_type}.png"
     
-    # Return raw base64 as requested by user
-    return f"[IMAGE:png:{b64}]\n\nDownload Chart: [FILE:png:{b64}:{out_name}]"
+    # The UI resolves both markers from the artifact store; no base64 goes into the context
+    return f"[IMAGE_ID:{aid}:png]\n\nDownload Chart: [FILE_ID:{aid}:png:{out_name}]"
 
 @tool
 def table_chart_histogram_from_upload(filename: str, column: str, bins: int = 10) -> str:
@@ -289,11 +267,6 @@ def table_chart_histogram_from_upload(filename: str, column: str, bins: int = 10
         return f"Histogram created. {_save_plot_to_artifact(filename, 'histogram')}"
     except Exception as e:
         return f"Error generating histogram: {str(e)}"
-    finally:
-        try:
-            os.remove(os.path.join("uploads", filename))
-        except Exception:
-            pass
 
 @tool
 def table_chart_scatter_from_upload(filename: str, x_column: str, y_column: str) -> str:
@@ -316,11 +289,6 @@ def table_chart_scatter_from_upload(filename: str, x_column: str, y_column: str)
         return f"Scatter plot created. {_save_plot_to_artifact(filename, 'scatter')}"
     except Exception as e:
         return f"Error generating scatter plot: {str(e)}"
-    finally:
-        try:
-            os.remove(os.path.join("uploads", filename))
-        except Exception:
-            pass
 
 @tool
 def table_chart_line_from_upload(filename: str, x_column: str, y_column: str) -> str:
@@ -347,11 +315,6 @@ def table_chart_line_from_upload(filename: str, x_column: str, y_column: str) ->
         return f"Line chart created. {_save_plot_to_artifact(filename, 'line_chart')}"
     except Exception as e:
         return f"Error generating line chart: {str(e)}"
-    finally:
-        try:
-            os.remove(os.path.join("uploads", filename))
-        except Exception:
-            pass
 
 @tool
 def table_chart_bar_from_upload(filename: str, x_column: str, y_column: str, aggregation: str = "sum") -> str:
@@ -387,18 +350,13 @@ def table_chart_bar_from_upload(filename: str, x_column: str, y_column: str, agg
         return f"Bar chart created. {_save_plot_to_artifact(filename, 'bar_chart')}"
     except Exception as e:
         return f"Error generating bar chart: {str(e)}"
-    finally:
-        try:
-            os.remove(os.path.join("uploads", filename))
-        except Exception:
-            pass
 
 @tool
 def csv_to_excel_from_upload(filename: str) -> str:
     """Convert an uploaded CSV file to Excel and return Base64 for download."""
     if not _allowed(filename):
         return "Error: File not allowed (not in current session uploads)"
-    path = os.path.join("uploads", filename)
+    path = upload_path(filename)
     if not os.path.exists(path):
         return "Error: File not found in uploads/"
     try:
@@ -406,16 +364,10 @@ def csv_to_excel_from_upload(filename: str) -> str:
         buffer = io.BytesIO()
         with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
             df.to_excel(writer, index=False)
-        b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        aid = _put_artifact(b64)
+        aid = _put_artifact(buffer.getvalue(), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
         return f"Converted successfully. [FILE_ID:{aid}:xlsx:{os.path.splitext(filename)[0]}.xlsx]"
     except Exception as e:
         return f"Error converting CSV to Excel: {str(e)}"
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
 
 @tool
 def markdown_to_html(md_text: str) -> str:
@@ -427,13 +379,36 @@ def markdown_to_html(md_text: str) -> str:
     except Exception as e:
         return f"Error converting markdown: {str(e)}"
 
+def _soffice_convert(path: str, target: str):
+    """Convert with LibreOffice into a private temp dir and profile, returning the output bytes.
+    A separate UserInstallation per call lets conversions issued in the same agent step run
+    concurrently; with the shared default profile a second soffice would hand off to the first.
+    """
+    soffice = shutil.which("soffice")
+    if not soffice:
+        return None
+    with tempfile.TemporaryDirectory(prefix="soffice_") as tmp:
+        profile = os.path.abspath(os.path.join(tmp, "profile")).replace(os.sep, "/")
+        profile = "file://" + (profile if profile.startswith("/") else "/" + profile)
+        subprocess.run(
+            [soffice, f"-env:UserInstallation={profile}", "--headless", "--convert-to", target, "--outdir", tmp, path],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        out = os.path.join(tmp, os.path.splitext(os.path.basename(path))[0] + "." + target)
+        if not os.path.exists(out):
+            return None
+        with open(out, "rb") as f:
+            return f.read()
+
 @tool
 def word_to_pdf_from_upload(filename: str) -> str:
     """Convert an uploaded Word (DOCX) file to PDF; returns a downloadable artifact."""
     try:
         if not _allowed(filename):
             return "Error: File not allowed (not in current session uploads)"
-        path = os.path.join("uploads", filename)
+        path = upload_path(filename)
         if not os.path.exists(path):
             return "Error: File not found in uploads/"
         pdf_bytes = None
@@ -472,18 +447,7 @@ def word_to_pdf_from_upload(filename: str) -> str:
         # 3) LibreOffice (soffice)
         if pdf_bytes is None:
             try:
-                soffice = shutil.which("soffice")
-                if soffice:
-                    out_dir = os.path.dirname(path)
-                    subprocess.run([soffice, "--headless", "--convert-to", "pdf", "--outdir", out_dir, path], check=True)
-                    out_pdf = os.path.splitext(path)[0] + ".pdf"
-                    if os.path.exists(out_pdf):
-                        with open(out_pdf, "rb") as f:
-                            pdf_bytes = f.read()
-                        try:
-                            os.remove(out_pdf)
-                        except Exception:
-                            pass
+                pdf_bytes = _soffice_convert(path, "pdf")
             except Exception:
                 pdf_bytes = None
         # 4) Pandoc
@@ -593,17 +557,11 @@ def word_to_pdf_from_upload(filename: str) -> str:
                 pdf_bytes = None
         if pdf_bytes is None:
             return "Error: Conversion failed (no available converter: docx2pdf, Word COM, LibreOffice, Pandoc, or pure-Python fallback)"
-        b64 = base64.b64encode(pdf_bytes).decode("utf-8")
-        aid = _put_artifact(b64)
+        aid = _put_artifact(pdf_bytes, "application/pdf")
         out_name = os.path.splitext(filename)[0] + ".pdf"
         return f"Converted successfully. [FILE_ID:{aid}:pdf:{out_name}]"
     except Exception as e:
         return f"Error converting Word to PDF: {str(e)}"
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
 
 @tool
 def pdf_to_word_from_upload(filename: str) -> str:
@@ -611,7 +569,7 @@ def pdf_to_word_from_upload(filename: str) -> str:
     try:
         if not _allowed(filename):
             return "Error: File not allowed (not in current session uploads)"
-        path = os.path.join("uploads", filename)
+        path = upload_path(filename)
         if not os.path.exists(path):
             return "Error: File not found in uploads/"
         docx_bytes = None
@@ -633,18 +591,7 @@ def pdf_to_word_from_upload(filename: str) -> str:
         # 2) LibreOffice
         if docx_bytes is None:
             try:
-                soffice = shutil.which("soffice")
-                if soffice:
-                    out_dir = os.path.dirname(path)
-                    subprocess.run([soffice, "--headless", "--convert-to", "docx", "--outdir", out_dir, path], check=True)
-                    out_docx = os.path.splitext(path)[0] + ".docx"
-                    if os.path.exists(out_docx):
-                        with open(out_docx, "rb") as f:
-                            docx_bytes = f.read()
-                        try:
-                            os.remove(out_docx)
-                        except Exception:
-                            pass
+                docx_bytes = _soffice_convert(path, "docx")
             except Exception:
                 docx_bytes = None
         # 3) pdfminer + python-docx
@@ -679,17 +626,11 @@ def pdf_to_word_from_upload(filename: str) -> str:
                 docx_bytes = None
         if docx_bytes is None:
             return "Error: Conversion failed (pdfminer/PyPDF2 + python-docx not available)"
-        b64 = base64.b64encode(docx_bytes).decode("utf-8")
-        aid = _put_artifact(b64)
+        aid = _put_artifact(docx_bytes, "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
         out_name = os.path.splitext(filename)[0] + ".docx"
         return f"Converted successfully. [FILE_ID:{aid}:docx:{out_name}]"
     except Exception as e:
         return f"Error converting PDF to Word: {str(e)}"
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
 
 @tool
 def excel_to_pdf_from_upload(filename: str) -> str:
@@ -697,7 +638,7 @@ def excel_to_pdf_from_upload(filename: str) -> str:
     try:
         if not _allowed(filename):
             return "Error: File not allowed (not in current session uploads)"
-        path = os.path.join("uploads", filename)
+        path = upload_path(filename)
         if not os.path.exists(path):
             return "Error: File not found in uploads/"
         pdf_bytes = None
@@ -722,14 +663,8 @@ def excel_to_pdf_from_upload(filename: str) -> str:
             pdf_bytes = None
         if pdf_bytes is None:
             return "Error: Conversion failed (reportlab not available)"
-        b64 = base64.b64encode(pdf_bytes).decode('utf-8')
-        aid = _put_artifact(b64)
+        aid = _put_artifact(pdf_bytes, "application/pdf")
         out_name = os.path.splitext(filename)[0] + ".pdf"
         return f"Converted successfully. [FILE_ID:{aid}:pdf:{out_name}]"
     except Exception as e:
         return f"Error converting Excel to PDF: {str(e)}"
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
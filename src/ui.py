@@ -2,21 +2,19 @@ import streamlit as st
 import os
 import re
 import base64
+import time
+import uuid
 from datetime import datetime
 
-try:
-    from src.tools.image import get_artifact as get_image_artifact
-except Exception:
-    def get_image_artifact(_):
-        return ""
-try:
-    from src.tools.office import get_artifact as get_file_artifact
-except Exception:
-    def get_file_artifact(_):
-        return ""
-
-from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
-from src.agent.react_agent import get_graph
+from src.core.artifacts import get_artifact
+from src.core.uploads import get_upload_store
+from src.core.session import session_scope
+from src.core.interpreter import get_interpreter_pool
+from src.core.llmcache import llm_cache_stats
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, ToolMessage
+from src.agent.react_agent import get_graph, stream_graph, llm_provider_stats
+from src.agent.memory import memory_enabled, get_checkpointer, session_config
+from src.agent.router import select_tool_groups
 
 # Import tab components
 from src.ui_tabs.jsonsql import render_jsonsql_tab
@@ -26,50 +24,114 @@ from src.ui_tabs.jsonpath import render_jsonpath_tab
 from src.ui_tabs.markdown_editor import render_markdown_tab
 from src.ui_tabs.request import render_request_tab
 
-def extract_image_base64(text):
-    """Extract base64 image data from tool output."""
+def extract_image(text):
+    """Extract an image from tool output as (mime, source) for st.image.
+    Artifacts are returned as raw bytes; inline base64 markers become data URIs.
+    """
     match1 = re.search(r"\[IMAGE_DATA: (.+?)\]", text)
     if match1:
-        return ("png", match1.group(1).strip())
+        return ("png", f"data:image/png;base64,{match1.group(1).strip()}")
     match2 = re.search(r"\[IMAGE:([a-zA-Z0-9]+):(.+?)\]", text)
     if match2:
-        return (match2.group(1).lower(), match2.group(2).strip())
+        mime = match2.group(1).lower()
+        return (mime, f"data:image/{mime};base64,{match2.group(2).strip()}")
     match3 = re.search(r"\[IMAGE_ID:([a-f0-9]+):([a-zA-Z0-9]+)\]", text)
     if match3:
         aid = match3.group(1)
         mime = match3.group(2).lower()
-        b64 = get_image_artifact(aid)
-        if b64:
-            return (mime, b64)
-        # Fallback: check office tools artifact cache
-        b64 = get_file_artifact(aid)
-        if b64:
-            return (mime, b64)
+        data = get_artifact(aid)
+        if data:
+            return (mime, data)
     
     return None
 
 def extract_file_artifact(text):
-    """Extract downloadable file artifact from tool output."""
+    """Extract downloadable file artifact from tool output as (ext, bytes, filename)."""
     match = re.search(r"\[FILE:([a-zA-Z0-9]+):(.+?):([^\]]+)\]", text)
     if match:
         ext = match.group(1).lower()
-        b64 = match.group(2)
+        data = base64.b64decode(match.group(2))
         fname = match.group(3)
-        return (ext, b64, fname)
+        return (ext, data, fname)
     match2 = re.search(r"\[FILE_ID:([a-f0-9]+):([a-zA-Z0-9]+):([^\]]+)\]", text)
     if match2:
         aid = match2.group(1)
         ext = match2.group(2).lower()
         fname = match2.group(3)
-        b64 = get_file_artifact(aid)
-        if b64:
-            return (ext, b64, fname)
+        data = get_artifact(aid)
+        if data:
+            return (ext, data, fname)
     return None
 
 
+class _StreamRenderer:
+    """Accumulates AIMessageChunk tokens and writes them to Streamlit in batches.
+
+    Every st.* call triggers a frontend delta, so tokens and tool-call argument fragments are
+    buffered and flushed at most once per `interval` seconds instead of once per token.
+    """
+
+    def __init__(self, message_placeholder, steps_container, interval: float = 0.08):
+        self.message_placeholder = message_placeholder
+        self.steps_container = steps_container
+        self.interval = interval
+        self.text = ""
+        self._streamed_ids = set()
+        self._tool_calls = {}  # (message_id, index) -> {"name", "args"}
+        self._slots = {}  # (message_id, index) -> st.empty()
+        self._dirty = set()
+        self._text_dirty = False
+        self._last_flush = 0.0
+
+    def on_chunk(self, chunk):
+        if isinstance(chunk.content, str) and chunk.content:
+            self.text += chunk.content
+            self._text_dirty = True
+            self._streamed_ids.add(chunk.id)
+        for tc in chunk.tool_call_chunks or []:
+            key = (chunk.id, tc.get("index") or 0)
+            call = self._tool_calls.setdefault(key, {"name": "", "args": ""})
+            call["name"] += tc.get("name") or ""
+            call["args"] += tc.get("args") or ""
+            self._dirty.add(key)
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def tool_call_slot(self, message_id, index):
+        key = (message_id, index)
+        if key not in self._slots:
+            self._slots[key] = self.steps_container.empty()
+        self._dirty.discard(key)
+        return self._slots[key]
+
+    def complete_message(self, msg):
+        # Providers that do not stream only deliver the finished message through "updates"
+        if msg.id not in self._streamed_ids and isinstance(msg.content, str):
+            self.text += msg.content
+            self._text_dirty = True
+            self.flush()
+
+    def flush(self, final: bool = False):
+        if self._text_dirty or final:
+            self.message_placeholder.markdown(self.text if final else self.text + "▌")
+            self._text_dirty = False
+        for key in list(self._dirty):
+            call = self._tool_calls[key]
+            self.tool_call_slot(*key).markdown(f"🛠️ **调用工具**: `{call['name']}`\n参数: `{call['args']}`")
+        self._dirty.clear()
+        self._last_flush = time.monotonic()
+
+
 def render_ui():
     st.set_page_config(page_title="AI 智能助手", page_icon="🛠️")
 
+    # Per-browser-session id used by tools to scope artifacts and uploads
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = uuid.uuid4().hex
+    session_id = st.session_state["session_id"]
+    # Keep a python_interpreter worker warm so the first code call does not pay process start-up
+    get_interpreter_pool().warm()
+
     st.title("🛠️BunnyTools")
 
     st.divider()
@@ -105,6 +167,19 @@ def render_ui():
             os.environ["ZHIPU_API_KEY"] = zhipu_key
         
         st.info("可使用 DeepSeek / Zhipu；至少配置一个 API Key。")
+        cache_stats = llm_cache_stats()
+        if cache_stats["hits"] + cache_stats["misses"]:
+            st.caption(
+                f"LLM 缓存命中率 {cache_stats['hit_rate']:.0%} "
+                f"({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})，"
+                f"节省约 {cache_stats['saved_seconds']:.1f}s"
+            )
+        for name, ps in llm_provider_stats().items():
+            if ps["calls"]:
+                p50 = f"{ps['p50']:.1f}s" if ps["p50"] is not None else "-"
+                p95 = f"{ps['p95']:.1f}s" if ps["p95"] is not None else "-"
+                status = "冷却中" if ps["cooling_down"] else "正常"
+                st.caption(f"{name}: p50 {p50} / p95 {p95}，错误率 {ps['error_rate']:.0%}，{status}")
         
         st.divider()
         st.header("文件上传")
@@ -114,20 +189,31 @@ def render_ui():
             type=["csv", "xlsx", "xls", "txt", "png", "jpg", "jpeg", "webp", "bmp", "gif", "docx", "doc", "pdf"]
         )
         
+        upload_store = get_upload_store()
         if uploaded_files:
-            upload_dir = "uploads"
+            upload_dir = upload_store.root
             if not os.path.exists(upload_dir):
                 os.makedirs(upload_dir)
                 
+            # Streamlit re-runs this script on every interaction; only register files not seen yet,
+            # or whose registration the janitor released after the session sat idle.
+            # The store is content-addressed, so identical bodies are never written twice.
+            registered = st.session_state.setdefault("uploaded_file_ids", {})
             current_names = []
             for uploaded_file in uploaded_files:
-                file_path = os.path.join(upload_dir, uploaded_file.name)
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
+                if registered.get(uploaded_file.name) != uploaded_file.file_id or not upload_store.has(uploaded_file.name, session_id):
+                    upload_store.put(uploaded_file.name, uploaded_file.getvalue(), session_id)
+                    registered[uploaded_file.name] = uploaded_file.file_id
                 current_names.append(uploaded_file.name)
+            for name in [n for n in registered if n not in current_names]:
+                registered.pop(name)
+            upload_store.sync(current_names, session_id)
             st.session_state["uploaded_current"] = current_names
-            os.environ["CURRENT_SESSION_UPLOADS"] = ";".join(current_names)
             st.success(f"已上传 {len(uploaded_files)} 个文件到 {upload_dir}/：{', '.join(current_names)}")
+        elif st.session_state.get("uploaded_current"):
+            upload_store.sync([], session_id)
+            st.session_state["uploaded_current"] = []
+            st.session_state["uploaded_file_ids"] = {}
 
     # Initialize session state for messages
     if "messages" not in st.session_state:
@@ -148,14 +234,13 @@ def render_ui():
                         
                         # Try to display base64 image if present in tool output
                         if step['type'] == 'tool_output':
-                            img_info = extract_image_base64(step['content'])
+                            img_info = extract_image(step['content'])
                             if img_info:
-                                mime, img_b64 = img_info
-                                st.image(f"data:image/{mime};base64,{img_b64}", caption="生成的图片")
+                                mime, img_src = img_info
+                                st.image(img_src, caption="生成的图片")
                             file_info = extract_file_artifact(step['content'])
                             if file_info:
-                                ext, b64, fname = file_info
-                                data = base64.b64decode(b64)
+                                ext, data, fname = file_info
                                 st.download_button("下载文件: " + fname, data=data, file_name=fname)
 
     # User input
@@ -195,26 +280,52 @@ def render_ui():
                     u = u[:max_len] + "\n\n[部分输入已截断以避免超出上下文限制]"
                 inputs = {"messages": [HumanMessage(content=u + uploaded_context)]}
                 
-                # Use stream_mode="updates" to get node-level updates (waiting effect between nodes)
-                # This avoids token-by-token streaming but allows showing progress
-                with st.spinner("正在思考中..."):
-                    graph = get_graph()
-                    for event in graph.stream(inputs, stream_mode="updates"):
+                # Combined streaming: "messages" gives token chunks (answer text and tool-call
+                # argument fragments), "updates" gives completed messages per node, "custom" tool progress.
+                # With memory on, earlier turns come from the session's checkpoint, so only the new
+                # message is sent and follow-ups can reuse what tools already returned.
+                run_config = session_config(session_id) if memory_enabled() else None
+                # Bind only the tool groups this turn needs (smaller tool schemas and prompt)
+                tool_groups = select_tool_groups(u, files, st.session_state.get("tool_groups"))
+                st.session_state["tool_groups"] = tool_groups
+                # Tools read the session id and its uploads from this scope, never from process-wide state
+                with st.spinner("正在思考中..."), session_scope(session_id, files):
+                    graph = get_graph(tool_groups)
+                    renderer = _StreamRenderer(message_placeholder, steps_container)
+                    progress_placeholder = steps_container.empty()
+                    for mode, event in stream_graph(graph, inputs, ["messages", "updates", "custom"], config=run_config):
+                        if mode == "messages":
+                            chunk, _metadata = event
+                            if isinstance(chunk, AIMessageChunk):
+                                renderer.on_chunk(chunk)
+                            continue
+                        if mode == "custom":
+                            # Per-item progress emitted by long-running tools (e.g. batch image processing)
+                            if isinstance(event, dict) and "done" in event:
+                                progress_placeholder.progress(
+                                    event["done"] / max(1, event.get("total", 1)),
+                                    text=f"⏳ {event.get('tool', '')}: {event['done']}/{event.get('total', '?')} {event.get('file', '')}",
+                                )
+                            continue
+                        renderer.flush()
                         for node_name, node_data in event.items():
+                            if node_name == "pre_model_hook":
+                                # History compaction rewrites stored state; nothing new to show
+                                continue
                             # Log node transition
                             steps_log.append({"type": "node", "content": node_name})
                             
-                            new_messages = node_data.get("messages", [])
+                            new_messages = (node_data or {}).get("messages", [])
                             if not isinstance(new_messages, list):
                                 new_messages = [new_messages]
                                 
                             for msg in new_messages:
                                 if isinstance(msg, AIMessage):
-                                    # Handle tool calls
+                                    # Handle tool calls (replaces the streamed argument preview)
                                     if msg.tool_calls:
-                                        for tool_call in msg.tool_calls:
+                                        for idx, tool_call in enumerate(msg.tool_calls):
                                             step_info = f"🛠️ **调用工具**: `{tool_call['name']}`\n参数: `{tool_call['args']}`"
-                                            steps_container.markdown(step_info)
+                                            renderer.tool_call_slot(msg.id, idx).markdown(step_info)
                                             steps_log.append({"type": "tool_call", "content": f"Tool: {tool_call['name']}, Args: {tool_call['args']}"})
                                     
                                     # Handle content (thought process or final answer)
@@ -223,11 +334,8 @@ def render_ui():
                                         thought_preview = msg.content if len(msg.content) <= 600 else (msg.content[:600] + "...")
                                         steps_container.markdown(f"🧠 **思考**:\n```\n{thought_preview}\n```")
                                         steps_log.append({"type": "thought", "content": msg.content})
-                                        
-                                        # Accumulate full response
-                                        full_response += msg.content
-                                        # Update main message placeholder
-                                        message_placeholder.markdown(full_response)
+                                        # Tokens were already streamed into the answer; only non-streaming providers need this
+                                        renderer.complete_message(msg)
                                 
                                 elif isinstance(msg, ToolMessage):
                                     # Display tool output
@@ -235,17 +343,22 @@ def render_ui():
                                     step_info = f"✅ **工具返回**: `{msg.name}`\n```\n{content_display}\n```"
                                     steps_container.markdown(step_info)
                                     
-                                    img_info = extract_image_base64(msg.content)
+                                    img_info = extract_image(msg.content)
                                     if img_info:
-                                        mime, img_b64 = img_info
-                                        steps_container.image(f"data:image/{mime};base64,{img_b64}", caption="生成的图片")
+                                        mime, img_src = img_info
+                                        steps_container.image(img_src, caption="生成的图片")
                                     file_info = extract_file_artifact(msg.content)
                                     if file_info:
-                                        ext, b64, fname = file_info
-                                        data = base64.b64decode(b64)
+                                        ext, data, fname = file_info
                                         steps_container.download_button("下载文件: " + fname, data=data, file_name=fname)
                                     
                                     steps_log.append({"type": "tool_output", "content": msg.content})
+                    renderer.flush(final=True)
+                    full_response = renderer.text
+                if run_config:
+                    checkpointer = get_checkpointer()
+                    checkpointer.prune(session_id)
+                    checkpointer.touch(session_id)
 
                 # Final update to session state
                 st.session_state.messages.append({
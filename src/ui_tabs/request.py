@@ -1,7 +1,8 @@
 import streamlit as st
-import requests
 import shlex
 import json
+import httpx
+from src.core.aio import run_sync
 
 def _parse_curl_cmd(cmd):
     if not cmd: return
@@ -79,6 +80,17 @@ def _parse_curl_cmd(cmd):
     except Exception as e:
         st.error(f"解析 cURL 失败: {str(e)}")
 
+async def _asend(method, url, headers, body):
+    # A short-lived client per request: arbitrary user URLs must not share the app's pooled
+    # client, whose cookie jar would replay one user's cookies on another user's requests
+    async with httpx.AsyncClient(timeout=30, follow_redirects=True) as client:
+        return await client.request(
+            method=method,
+            url=url,
+            headers=headers,
+            content=body.encode('utf-8') if body else None,
+        )
+
 def render_request_tab():
     st.markdown("#### HTTP 模拟请求")
     
@@ -124,20 +136,14 @@ def render_request_tab():
             if headers_str.strip():
                 headers_dict = json.loads(headers_str)
             
-            resp = requests.request(
-                method=method,
-                url=url,
-                headers=headers_dict,
-                data=body.encode('utf-8') if body else None,
-                timeout=30
-            )
+            resp = run_sync(_asend(method, url, headers_dict, body))
             st.session_state.req_response = resp
         except Exception as e:
             st.error(f"请求失败: {str(e)}")
             
     if st.session_state.req_response:
         resp = st.session_state.req_response
-        st.markdown(f"**Status:** `{resp.status_code} {resp.reason}`")
+        st.markdown(f"**Status:** `{resp.status_code} {resp.reason_phrase}`")
         
         r1, r2 = st.tabs(["Response Body", "Response Headers"])
         with r1: